@@ -0,0 +1,5 @@
+"""Shared tools for the simulation and analysis scripts of the tutorial.
+
+The scripts in part2_snakemake and part3_synthesis add the repository root to
+their module search path and import this package from there.
+"""
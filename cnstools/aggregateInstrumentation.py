@@ -0,0 +1,96 @@
+"""Collect instrumentation sidecar files into one table.
+
+Usage:
+    aggregateInstrumentation.py [options] <tablefile> <sidecar>...
+
+Run from the repository root as: python -m cnstools.aggregateInstrumentation
+
+Reads the sidecar files written by the simulation scripts (see
+cnstools/instrumentation.py), e.g. of all simulations of a sweep or of a
+scaling benchmark, and saves a table with one row per file and phase to
+<tablefile>. The fields are file, rank, num_processes, num_threads, phase,
+wall_time (s), fraction (of the total wall time of the file), peak_rss (MB)
+and the kernel counters, which are NaN if the NEST version does not provide
+them. Prints the wall time of every phase summed over all files, such that
+the dominating phases stand out.
+
+Options:
+    --csv       save the table as comma separated text instead of npy
+"""
+
+import numpy as np
+
+from cnstools.instrumentation import KERNEL_COUNTERS
+
+
+TABLE_DTYPE = np.dtype([
+    ('file', 'U256'), ('rank', np.int64), ('num_processes', np.int64),
+    ('num_threads', np.int64), ('phase', 'U32'), ('wall_time', np.float64),
+    ('fraction', np.float64), ('peak_rss', np.float64)
+] + [(name, np.float64) for name in KERNEL_COUNTERS])
+
+
+def aggregateInstrumentation(sidecars):
+    """Collect the phases of sidecar files into one table.
+
+    Parameters:
+        sidecars        list of sidecar files
+
+    Returns:
+        table:          structured array with the fields of TABLE_DTYPE
+    """
+    import yaml
+
+    rows = []
+    for sidecar in sidecars:
+        with open(sidecar, 'r') as f:
+            data = yaml.load(f, Loader=yaml.FullLoader)
+        for phase in data['phases']:
+            rows.append((
+                sidecar, data['rank'], data['num_processes'],
+                data['num_threads'], phase['name'], phase['wall_time'],
+                phase['wall_time'] / data['total_wall_time'],
+                phase['peak_rss']
+            ) + tuple(phase.get(name, np.nan) for name in KERNEL_COUNTERS))
+    return np.array(rows, dtype=TABLE_DTYPE)
+
+
+def summarizePhases(table):
+    """Sum the wall time of every phase over all files.
+
+    Parameters:
+        table           structured array with the fields of TABLE_DTYPE
+
+    Returns:
+        summary:        list of (phase, total wall time, mean fraction,
+                        maximal peak RSS), sorted by decreasing wall time
+    """
+    summary = []
+    for phase in np.unique(table['phase']):
+        rows = table[table['phase'] == phase]
+        summary.append((phase, rows['wall_time'].sum(),
+                        rows['fraction'].mean(), rows['peak_rss'].max()))
+    return sorted(summary, key=lambda row: -row[1])
+
+
+if __name__ == '__main__':
+    from docopt import docopt
+
+    # parse command line parameters
+    args = docopt(__doc__)
+
+    # collect and save the table
+    table = aggregateInstrumentation(args['<sidecar>'])
+    if args['--csv']:
+        np.savetxt(args['<tablefile>'], table, delimiter=',', fmt='%s',
+                   header=','.join(TABLE_DTYPE.names), comments='')
+    else:
+        np.save(args['<tablefile>'], table)
+
+    # print the phases ordered by their total wall time
+    print('%-20s %12s %10s %12s' % ('phase', 'wall time/s', 'fraction',
+                                    'peak RSS/MB'))
+    for phase, wall_time, fraction, peak_rss in summarizePhases(table):
+        print('%-20s %12.2f %10.3f %12.1f' % (
+            phase, wall_time, fraction, peak_rss
+        ))
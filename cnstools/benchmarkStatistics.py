@@ -0,0 +1,109 @@
+"""Benchmark the throughput of the spike statistics kernel.
+
+Usage:
+    benchmarkStatistics.py [options]
+
+Run from the repository root as: python -m cnstools.benchmarkStatistics
+
+Generates synthetic Poissonian spike trains with the given total numbers of
+spikes, ordered by spike time as returned by a spike detector, and measures
+the time calculateSpikeStatistics needs to process them.
+
+Options:
+    --num_spikes=<n>        comma separated total numbers of spikes
+                            [default: 1e5,1e6,1e7]
+    --rate=<rate>           firing rate of each neuron in spks/s [default: 5.0]
+    --simtime=<T>           duration of the spike trains in ms
+                            [default: 10000.0]
+    --bin_width=<bin>       bin width for the Fano factor in ms, none to skip
+                            the Fano factor [default: none]
+    --repetitions=<r>       number of timed repetitions [default: 3]
+    --seed=<seed>           seed of the random number generator [default: 0]
+    --output=<file>         save results to a yaml file for comparison
+                            across revisions
+"""
+
+import time
+import numpy as np
+
+from cnstools.spikeStatistics import calculateSpikeStatistics
+
+
+def syntheticSpikes(num_spikes, rate, simtime, rng):
+    """Generate Poissonian spike trains with a given total number of spikes.
+
+    Parameters:
+        num_spikes      total number of spikes
+        rate            firing rate of each neuron in spks/s
+        simtime         duration of the spike trains in ms
+        rng             numpy RandomState
+
+    Returns:
+        senders, times: time ordered arrays of spike senders and spike times
+    """
+    num_neurons = max(int(round(num_spikes / (1e-3 * rate * simtime))), 1)
+    senders = rng.randint(1, num_neurons + 1, num_spikes).astype(np.int64)
+    times = np.sort(rng.uniform(0., simtime, num_spikes))
+    return senders, times
+
+
+def benchmarkStatistics(num_spikes, rate, simtime, bin_width, repetitions,
+                        seed):
+    """Time calculateSpikeStatistics on synthetic spike trains.
+
+    Parameters:
+        num_spikes      total number of spikes
+        rate            firing rate of each neuron in spks/s
+        simtime         duration of the spike trains in ms
+        bin_width       bin width for the Fano factor in ms or None
+        repetitions     number of timed repetitions
+        seed            seed of the random number generator
+
+    Returns:
+        result:         dict with the fastest wall time in s and the
+                        corresponding throughput in spikes/s
+    """
+    senders, times = syntheticSpikes(
+        num_spikes, rate, simtime, np.random.RandomState(seed)
+    )
+    wall_times = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        calculateSpikeStatistics(
+            senders, times, simtime, senders.min(), senders.max(), bin_width
+        )
+        wall_times.append(time.perf_counter() - start)
+    return {
+        'num_spikes': num_spikes,
+        'wall_time': min(wall_times),
+        'throughput': num_spikes / min(wall_times)
+    }
+
+
+if __name__ == '__main__':
+    from docopt import docopt
+
+    # parse command line parameters
+    args = docopt(__doc__)
+    bin_width = None
+    if args['--bin_width'] != 'none':
+        bin_width = float(args['--bin_width'])
+
+    results = []
+    for n in args['--num_spikes'].split(','):
+        result = benchmarkStatistics(
+            num_spikes=int(float(n)), rate=float(args['--rate']),
+            simtime=float(args['--simtime']), bin_width=bin_width,
+            repetitions=int(args['--repetitions']),
+            seed=int(args['--seed'])
+        )
+        print('%12i spikes: %8.3f s, %.3e spikes/s' % (
+            result['num_spikes'], result['wall_time'], result['throughput']
+        ))
+        results.append(result)
+
+    # save results
+    if args['--output'] is not None:
+        import yaml
+        with open(args['--output'], 'w') as output_file:
+            yaml.dump(results, output_file)
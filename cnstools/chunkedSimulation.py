@@ -0,0 +1,322 @@
+"""Chunked simulation with spike read-out, early abort and checkpoints.
+
+nest.Simulate(simtime) is split into nest.Prepare(), one nest.Run(chunk_time)
+per chunk and nest.Cleanup(). After every chunk the spikes are read out of
+the spike detectors, which are emptied such that the spikes do not pile up in
+NEST, the population rate of the chunk is compared to the rate bounds and,
+optionally, a checkpoint is written:
+
+    <checkpoint_dir>/state.npz          simulated time, number of chunks and
+                                        state variables of all local neurons
+    <checkpoint_dir>/chunk_<n>.npz      spikes of the n-th chunk
+
+With more than one MPI process, each rank writes its checkpoint to
+<checkpoint_dir>/rank_<rank>. A job that is killed, e.g. at the time limit
+of the cluster, and started again with the same checkpoint directory
+rebuilds the network, restores the neuron states and simulates only the
+remaining time:
+
+    checkpoint = Checkpoint('checkpoint', key=hashInputs([], g=g))
+    spikes, elapsed, aborted = runChunked(
+        simtime, spike_detectors, chunk_time=100., num_neurons=N,
+        rate_bounds=(0.1, 100.), neurons=neurons, checkpoint=checkpoint
+    )
+    ...  # save the spikes
+    checkpoint.remove()
+
+NEST cannot save spikes in transit, refractory counters or the state of its
+random number generators, hence a resumed simulation continues the previous
+one statistically but not bit by bit.
+"""
+
+import os
+import shutil
+import numpy as np
+import nest
+
+from .instrumentation import PhaseTimer
+from .spikeStore import shardPath
+
+
+def localNeurons(gids):
+    """Select the neurons of this MPI process.
+
+    Neurons are distributed round robin over the virtual processes
+    (vp = gid % N_vp) and the virtual processes round robin over the MPI
+    processes (rank = vp % N_procs).
+
+    Parameters:
+        gids            gids of neurons
+
+    Returns:
+        local_gids:     sorted array of the gids of the local neurons
+    """
+    gids = np.sort(np.asarray(gids, dtype=np.int64))
+    N_vp = nest.GetKernelStatus('total_num_virtual_procs')
+    return gids[gids % N_vp % nest.NumProcesses() == nest.Rank()]
+
+
+def stateVariables(gids):
+    """Names of the state variables of neurons that can be read and set.
+
+    These are the recordables of the neuron model which are part of the
+    status dictionary, e.g. V_m of iaf_psc_delta.
+
+    Parameters:
+        gids            gids of local neurons of one model
+
+    Returns:
+        names:          list of the names of the state variables
+    """
+    if len(gids) == 0:
+        return []
+    status = nest.GetStatus([int(gids[0])])[0]
+    return [name for name in status.get('recordables', ()) if name in status]
+
+
+def _globalSum(values):
+    """
+    Helper function to sum an array over all MPI processes.
+    """
+    if nest.NumProcesses() == 1:
+        return values
+    from mpi4py import MPI
+    return MPI.COMM_WORLD.allreduce(values, op=MPI.SUM)
+
+
+def _saveAtomically(path, **arrays):
+    """
+    Helper function to write an npz file such that an interrupted job never
+    leaves a broken file.
+    """
+    tmp_path = path + '.tmp.npz'
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+
+class Checkpoint(object):
+    """Simulation state and spikes of the finished chunks of a simulation.
+
+    Parameters:
+        path            directory of the checkpoint; each MPI process uses
+                        the subdirectory rank_<rank> if there are several
+        key             identifier of the simulated network and parameters,
+                        a checkpoint with a different key is not resumed
+    """
+
+    def __init__(self, path, key=''):
+        if nest.NumProcesses() > 1:
+            path = shardPath(path, nest.Rank())
+        self.path = path
+        self.key = key
+
+    def _chunkPath(self, index):
+        return os.path.join(self.path, 'chunk_%06i.npz' % index)
+
+    def load(self):
+        """Load the saved state if it belongs to the same simulation.
+
+        Returns:
+            state:          dict with the entries elapsed, num_chunks,
+                            chunk_time, gids and states (dict of arrays of
+                            the state variables), None if there is no
+                            matching checkpoint
+        """
+        state_path = os.path.join(self.path, 'state.npz')
+        if not os.path.exists(state_path):
+            return None
+        with np.load(state_path) as data:
+            N_vp = nest.GetKernelStatus('total_num_virtual_procs')
+            if str(data['key']) != self.key or int(data['num_vp']) != N_vp:
+                print('Ignoring checkpoint %s of a different simulation' %
+                      self.path)
+                return None
+            names = [str(name) for name in data['names']]
+            return {
+                'elapsed': float(data['elapsed']),
+                'num_chunks': int(data['num_chunks']),
+                'chunk_time': float(data['chunk_time']),
+                'gids': data['gids'],
+                'states': {name: data['state_' + name] for name in names}
+            }
+
+    def spikes(self, num_chunks, num_detectors):
+        """Load the spikes of the finished chunks.
+
+        Parameters:
+            num_chunks      number of finished chunks
+            num_detectors   number of spike detectors
+
+        Returns:
+            spikes:         list of (senders, times) of each spike detector,
+                            each a list with one array per chunk
+        """
+        spikes = [([], []) for _ in range(num_detectors)]
+        for index in range(num_chunks):
+            with np.load(self._chunkPath(index)) as data:
+                for ii, (senders, times) in enumerate(spikes):
+                    senders.append(data['senders_%i' % ii])
+                    times.append(data['times_%i' % ii])
+        return spikes
+
+    def save(self, elapsed, num_chunks, chunk_time, gids, chunk_spikes):
+        """Save the spikes of the last chunk and the simulation state.
+
+        The state is written after the spikes, such that a job killed in
+        between resumes from the previous chunk.
+
+        Parameters:
+            elapsed         simulated time in ms
+            num_chunks      number of finished chunks including the last one
+            chunk_time      simulation time of a chunk in ms
+            gids            gids of the local neurons
+            chunk_spikes    list of (senders, times) of each spike detector
+                            in the last chunk
+        """
+        os.makedirs(self.path, exist_ok=True)
+        arrays = {}
+        for ii, (senders, times) in enumerate(chunk_spikes):
+            arrays['senders_%i' % ii] = senders
+            arrays['times_%i' % ii] = times
+        _saveAtomically(self._chunkPath(num_chunks - 1), **arrays)
+
+        names = stateVariables(gids)
+        arrays = {
+            'state_' + name: np.array(nest.GetStatus(gids.tolist(), name))
+            for name in names
+        }
+        _saveAtomically(
+            os.path.join(self.path, 'state.npz'), key=self.key,
+            num_vp=nest.GetKernelStatus('total_num_virtual_procs'),
+            elapsed=elapsed, num_chunks=num_chunks, chunk_time=chunk_time,
+            gids=gids, names=np.array(names), **arrays
+        )
+
+    def remove(self):
+        """Remove the checkpoint, e.g. after the results are saved."""
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def _restoreState(state, gids):
+    """
+    Helper function to set the state variables of the local neurons to the
+    values of a checkpoint.
+    """
+    if not np.array_equal(state['gids'], gids):
+        raise ValueError('The local neurons differ from the checkpoint')
+    for name, values in state['states'].items():
+        nest.SetStatus(gids.tolist(), name, values.tolist())
+
+
+def runChunked(simtime, spike_detectors, chunk_time=None, num_neurons=None,
+               rate_bounds=None, neurons=None, checkpoint=None, timer=None):
+    """Simulate in chunks, reading out the spike detectors after each chunk.
+
+    Parameters:
+        simtime             simulation time in ms
+        spike_detectors     list of gid lists of spike detectors
+        chunk_time          simulation time of a chunk in ms, simtime if None
+        num_neurons         number of neurons recorded by all spike detectors
+                            on all MPI processes, used for the population rate
+        rate_bounds         minimal and maximal population rate in spks/s; the
+                            simulation is aborted after the first chunk with
+                            a rate outside of them (never if None)
+        neurons             gids of all neurons whose state is saved in the
+                            checkpoint
+        checkpoint          Checkpoint to resume from and to update after
+                            every chunk (optional); only spikes recorded to
+                            memory can be saved
+        timer               cnstools.instrumentation.PhaseTimer to record
+                            the phases simulate, readout and checkpoint
+                            (optional)
+
+    Returns:
+        spikes:             list of (senders, times) of each spike detector,
+                            sorted by time and relative to the start of the
+                            simulation
+        elapsed:            simulated time in ms
+        aborted:            True if the rate left the rate bounds
+    """
+    if chunk_time is None:
+        chunk_time = simtime
+    if timer is None:
+        timer = PhaseTimer()
+    if rate_bounds is not None and num_neurons is None:
+        raise ValueError('Rate bounds need the number of recorded neurons')
+    if checkpoint is not None and neurons is None:
+        raise ValueError('Checkpoints need the neurons to save')
+    local_gids = None if neurons is None else localNeurons(neurons)
+
+    # resume from the checkpoint
+    elapsed, num_chunks = 0., 0
+    with timer.phase('checkpoint'):
+        state = None if checkpoint is None else checkpoint.load()
+        if state is not None and state['chunk_time'] == chunk_time:
+            _restoreState(state, local_gids)
+            elapsed, num_chunks = state['elapsed'], state['num_chunks']
+            spikes = checkpoint.spikes(num_chunks, len(spike_detectors))
+            if nest.Rank() == 0:
+                print('Resuming at %.1f ms after %i chunks' % (
+                    elapsed, num_chunks
+                ))
+        else:
+            spikes = [([], []) for _ in spike_detectors]
+    # spike times are relative to the start, also if the network was
+    # simulated before
+    t_offset = elapsed - nest.GetKernelStatus('time')
+
+    aborted = False
+    with timer.phase('simulate'):
+        nest.Prepare()
+    try:
+        while elapsed < simtime and not aborted:
+            duration = min(chunk_time, simtime - elapsed)
+            with timer.phase('simulate'):
+                nest.Run(duration)
+
+            # read out and empty the spike detectors
+            with timer.phase('readout'):
+                chunk_spikes = []
+                num_spikes = 0
+                for spike_detector in spike_detectors:
+                    status = nest.GetStatus(spike_detector)[0]
+                    num_spikes += status['n_events']
+                    events = status['events']
+                    order = events['times'].argsort(kind='stable')
+                    chunk_spikes.append((events['senders'][order],
+                                         events['times'][order] + t_offset))
+                    nest.SetStatus(spike_detector, 'n_events', 0)
+                for (senders, times), (chunk_senders, chunk_times) in zip(
+                        spikes, chunk_spikes):
+                    senders.append(chunk_senders)
+                    times.append(chunk_times)
+            elapsed += duration
+            num_chunks += 1
+
+            # check the population rate of the chunk
+            if num_neurons is not None:
+                rate = 1e3 * _globalSum(num_spikes) / (num_neurons * duration)
+                if nest.Rank() == 0:
+                    print('%.1f / %.1f ms: %.2f spks/s' % (
+                        elapsed, simtime, rate
+                    ))
+                if rate_bounds is not None and \
+                        not rate_bounds[0] <= rate <= rate_bounds[1]:
+                    aborted = True
+                    if nest.Rank() == 0:
+                        print('Aborted: rate outside of [%g, %g] spks/s' %
+                              tuple(rate_bounds))
+
+            if checkpoint is not None and not aborted:
+                with timer.phase('checkpoint'):
+                    checkpoint.save(elapsed, num_chunks, chunk_time,
+                                    local_gids, chunk_spikes)
+    finally:
+        with timer.phase('simulate'):
+            nest.Cleanup()
+
+    with timer.phase('readout'):
+        spikes = [(np.concatenate(senders) if senders else np.zeros(0, int),
+                   np.concatenate(times) if times else np.zeros(0))
+                  for senders, times in spikes]
+    return spikes, elapsed, aborted
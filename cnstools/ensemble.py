@@ -0,0 +1,127 @@
+"""Ensembles of independent trials of a simulation.
+
+A simulation with master seed s and N_tp virtual processes seeds its
+numpy and NEST random number generators with
+
+    s, ..., s + N_tp - 1                    pyrngs (one per virtual process)
+    s + N_tp                                grng_seed
+    s + N_tp + 1, ..., s + 2 * N_tp         rng_seeds
+    s + 2 * N_tp + 1                        bulk connectivity rng
+
+i.e. with a block of 2 * N_tp + 2 consecutive seeds. The trials of an
+ensemble get consecutive blocks, such that no two trials share a random
+number stream. The statistics of the trials are reduced to the mean over
+trials and the half width of its 95% confidence interval (Student's t
+distribution), which shrinks with the square root of the number of trials.
+"""
+
+import numpy as np
+
+
+# two-sided 95% quantiles of Student's t distribution for 1 to 30 degrees
+# of freedom
+T_95 = (12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262,
+        2.228, 2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093,
+        2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045,
+        2.042)
+
+
+def seedBlockSize(N_tp=1):
+    """Number of consecutive seeds used by a simulation.
+
+    Parameters:
+        N_tp            total number of virtual processes
+
+    Returns:
+        size:           number of seeds from the master seed on
+    """
+    return 2 * N_tp + 2
+
+
+def trialSeeds(master_seed, num_trials, N_tp=1):
+    """Master seeds of trials with non-overlapping seed blocks.
+
+    Parameters:
+        master_seed     master seed of the first trial
+        num_trials      number of trials
+        N_tp            total number of virtual processes of each trial
+
+    Returns:
+        seeds:          list of the master seeds of the trials
+    """
+    return [master_seed + trial * seedBlockSize(N_tp)
+            for trial in range(num_trials)]
+
+
+def _tQuantile(df):
+    """
+    Helper function to get the two-sided 95% quantile of Student's t
+    distribution, using the Cornish-Fisher expansion beyond the table.
+    """
+    if df <= len(T_95):
+        return T_95[df - 1]
+    z = 1.959964
+    return z + (z**3 + z) / (4. * df) + \
+        (5. * z**5 + 16. * z**3 + 3. * z) / (96. * df**2)
+
+
+def confidenceInterval(samples):
+    """Mean and 95% confidence interval of the mean of independent trials.
+
+    Parameters:
+        samples         array of the values of the trials; NaN values,
+                        e.g. of undefined statistics, are ignored
+
+    Returns:
+        mean:           mean over trials (NaN without valid trials)
+        ci:             half width of the confidence interval (NaN with
+                        less than two valid trials)
+        num_trials:     number of valid trials
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    samples = samples[np.isfinite(samples)]
+    num_trials = len(samples)
+    if num_trials == 0:
+        return np.nan, np.nan, 0
+    mean = samples.mean()
+    if num_trials == 1:
+        return mean, np.nan, 1
+    sem = samples.std(ddof=1) / np.sqrt(num_trials)
+    return mean, _tQuantile(num_trials - 1) * sem, num_trials
+
+
+def reduceTrials(table, keys, fields):
+    """Reduce a table with one row per trial to one row per configuration.
+
+    Parameters:
+        table           structured array with one row per trial
+        keys            names of the fields identifying a configuration,
+                        e.g. ['g', 'nu_ex']
+        fields          names of the fields to reduce, e.g. ['CV']
+
+    Returns:
+        reduced:        structured array sorted by the keys with the keys,
+                        the mean <field> and the confidence interval
+                        <field>_ci of each field (see confidenceInterval)
+                        and num_trials, the minimal number of valid trials
+                        of the fields
+    """
+    dtype = np.dtype(
+        [(key, table.dtype[key]) for key in keys] +
+        [(name, np.float64) for field in fields
+         for name in (field, field + '_ci')] +
+        [('num_trials', np.int64)]
+    )
+    configurations, inverse = np.unique(table[keys], return_inverse=True)
+    reduced = np.zeros(len(configurations), dtype=dtype)
+    for ii, configuration in enumerate(configurations):
+        trials = table[inverse.ravel() == ii]
+        for key in keys:
+            reduced[ii][key] = configuration[key]
+        num_trials = []
+        for field in fields:
+            mean, ci, num = confidenceInterval(trials[field])
+            reduced[ii][field], reduced[ii][field + '_ci'] = mean, ci
+            num_trials.append(num)
+        reduced[ii]['num_trials'] = min(num_trials)
+    return reduced
@@ -0,0 +1,116 @@
+"""Timing and memory instrumentation of the phases of a simulation.
+
+    timer = PhaseTimer()
+    with timer.phase('create'):
+        neurons = nest.Create('iaf_psc_delta', 100)
+    with timer.phase('connect'):
+        nest.Connect(neurons, neurons)
+    timer.save(sidecarPath('simulation_config.yaml'), parameters={...})
+
+For every phase, the sidecar file lists the wall time, the peak resident set
+size of the process at its end and the NEST kernel counters KERNEL_COUNTERS
+at its end, as far as the NEST version provides them. Entering a phase again,
+e.g. once per simulation chunk, adds to its wall time. With more than one
+MPI process, every rank writes its own sidecar file. aggregateInstrumentation
+collects the sidecar files of a sweep into one table.
+"""
+
+import contextlib
+import os
+import resource
+import sys
+import time
+
+
+KERNEL_COUNTERS = ('num_connections', 'local_spike_counter', 'network_size',
+                   'time')
+
+
+def peakRSS():
+    """Peak resident set size of this process in MB.
+
+    Returns:
+        peak_rss:       maximal resident set size since the start in MB
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 2.**20 if sys.platform == 'darwin' else peak / 2.**10
+
+
+def _kernelCounters():
+    """
+    Helper function to read the available kernel counters, empty if the
+    script did not import NEST.
+    """
+    nest = sys.modules.get('nest')
+    if nest is None:
+        return {}
+    status = nest.GetKernelStatus()
+    return {name: status[name].item() if hasattr(status[name], 'item')
+            else status[name] for name in KERNEL_COUNTERS if name in status}
+
+
+def sidecarPath(path, rank=None):
+    """Path of the instrumentation sidecar of an output file.
+
+    Parameters:
+        path            output file, e.g. simulation_config.yaml
+        rank            MPI rank if there are several processes, None
+                        otherwise
+
+    Returns:
+        path:           <path without extension>.instrumentation.yaml or,
+                        with a rank, .instrumentation.rank_<rank>.yaml
+    """
+    base = os.path.splitext(path)[0] + '.instrumentation'
+    if rank is not None:
+        base += '.rank_%04i' % rank
+    return base + '.yaml'
+
+
+class PhaseTimer(object):
+    """Wall time, peak memory and kernel counters of named phases."""
+
+    def __init__(self):
+        self.phases = {}
+        self.order = []
+        self.start = time.time()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Context manager recording the phase with the given name."""
+        phase_start = time.time()
+        try:
+            yield
+        finally:
+            record = self.phases.get(name)
+            if record is None:
+                record = self.phases[name] = {'wall_time': 0.}
+                self.order.append(name)
+            record['wall_time'] += time.time() - phase_start
+            record['peak_rss'] = peakRSS()
+            record.update(_kernelCounters())
+
+    def save(self, path, **info):
+        """Save all phases to a yaml file.
+
+        Parameters:
+            path            sidecar file, see sidecarPath
+            info            additional entries, e.g. the parameters
+        """
+        import yaml
+
+        nest = sys.modules.get('nest')
+        sidecar = {
+            'rank': 0 if nest is None else nest.Rank(),
+            'num_processes': 1 if nest is None else nest.NumProcesses(),
+            'num_threads': 1 if nest is None else
+            nest.GetKernelStatus('local_num_threads'),
+            'total_wall_time': time.time() - self.start,
+            'peak_rss': peakRSS(),
+            'phases': [dict(name=name, **self.phases[name])
+                       for name in self.order]
+        }
+        sidecar.update(info)
+        with open(path, 'w') as f:
+            yaml.dump(sidecar, f, default_flow_style=False)
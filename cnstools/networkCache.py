@@ -0,0 +1,133 @@
+"""Content-addressed on-disk cache of network construction artifacts.
+
+Each entry is a directory <cache_dir>/<key> holding one npy file per array,
+where the key is a hash of the contents of the input files and of all
+parameters the arrays are derived from:
+
+    cache = NetworkCache('.network_cache', budget=10e9)
+    key = hashInputs(['synapse_matrix.npy'], N_scale=0.01, K_scale=0.01)
+    arrays = cache.load(key)
+    if arrays is None:
+        arrays = {'synapses': ...}
+        cache.save(key, arrays)
+
+Entries are written to a temporary directory and renamed, such that an
+interrupted or concurrent run never sees a half written entry. Loading an
+entry marks it as recently used; if the entries exceed the disk budget, the
+least recently used ones are removed.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import numpy as np
+
+
+def hashInputs(filenames, chunk_bytes=2**24, **params):
+    """Hash the contents of files together with parameters.
+
+    Parameters:
+        filenames       list of input files
+        chunk_bytes     size of the chunks read at once
+        params          parameters the cached data depends on
+
+    Returns:
+        key:            hexadecimal sha1 digest
+    """
+    digest = hashlib.sha1()
+    for fn in filenames:
+        with open(fn, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_bytes), b''):
+                digest.update(chunk)
+    for name in sorted(params):
+        digest.update(('%s=%r;' % (name, params[name])).encode())
+    return digest.hexdigest()
+
+
+def _entrySize(path):
+    """
+    Helper function to get the total size of the files of an entry in bytes.
+    """
+    return sum(
+        os.path.getsize(os.path.join(path, fn)) for fn in os.listdir(path)
+    )
+
+
+class NetworkCache(object):
+    """Cache of named arrays with least recently used eviction.
+
+    Parameters:
+        cache_dir       directory of the cache, created if necessary
+        budget          maximal total size of all entries in bytes, None for
+                        no limit
+    """
+
+    def __init__(self, cache_dir, budget=None):
+        self.cache_dir = cache_dir
+        self.budget = budget
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def entryPath(self, key):
+        """Directory of the entry with the given key."""
+        return os.path.join(self.cache_dir, key)
+
+    def load(self, key, mmap_mode='r'):
+        """Load the arrays of an entry and mark it as recently used.
+
+        Parameters:
+            key             key of the entry
+            mmap_mode       mmap_mode of np.load
+
+        Returns:
+            arrays:         dict of arrays or None if there is no entry
+        """
+        path = self.entryPath(key)
+        if not os.path.isdir(path):
+            return None
+        os.utime(path)
+        return {
+            os.path.splitext(fn)[0]: np.load(
+                os.path.join(path, fn), mmap_mode=mmap_mode
+            ) for fn in os.listdir(path)
+        }
+
+    def save(self, key, arrays):
+        """Save arrays as an entry and evict old entries beyond the budget.
+
+        Parameters:
+            key             key of the entry
+            arrays          dict of arrays
+        """
+        path = self.entryPath(key)
+        tmp_path = tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp_')
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_path, name + '.npy'), array)
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # another process saved the same entry in the meantime
+            shutil.rmtree(tmp_path)
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """Remove the least recently used entries until the budget is met.
+
+        Parameters:
+            keep            key of an entry that is never removed
+        """
+        if self.budget is None:
+            return
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            path = self.entryPath(key)
+            if key.startswith('.') or not os.path.isdir(path):
+                continue
+            entries.append((os.path.getmtime(path), _entrySize(path), key))
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in sorted(entries):
+            if total <= self.budget:
+                break
+            if key != keep:
+                shutil.rmtree(self.entryPath(key))
+                total -= size
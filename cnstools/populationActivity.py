@@ -0,0 +1,59 @@
+"""Binned population activity computed in a streaming pass.
+
+The spikes of a spike store are read chunk by chunk; for each chunk the
+population and time bin of every spike are combined into one index, such
+that a single np.bincount accumulates the (populations x bins) histogram.
+"""
+
+import numpy as np
+
+
+def populationHistogram(spikes, simtime, bin_width, chunk_size=2**22):
+    """Count the spikes of each population in time bins.
+
+    Parameters:
+        spikes          SpikeStore
+        simtime         simulation time in ms
+        bin_width       bin width in ms
+        chunk_size      number of spikes processed at once
+
+    Returns:
+        counts:         (populations x bins) array of spike counts
+    """
+    num_pops = len(spikes.populations)
+    num_bins = int(np.ceil(simtime / bin_width))
+    stops = spikes.populations['stop']
+
+    counts = np.zeros(num_pops * num_bins, dtype=np.int64)
+    for start in range(0, len(spikes.times), chunk_size):
+        times = spikes.times[start:start+chunk_size]
+        positions = np.arange(start, start + len(times))
+        pop_index = np.searchsorted(stops, positions, 'right')
+        bin_index = np.clip((times // bin_width).astype(np.int64),
+                            0, num_bins - 1)
+        counts += np.bincount(pop_index * num_bins + bin_index,
+                              minlength=num_pops * num_bins)
+
+    return counts.reshape(num_pops, num_bins)
+
+
+def populationRates(spikes, simtime, bin_width, chunk_size=2**22):
+    """Population averaged firing rates in time bins.
+
+    Parameters:
+        spikes          SpikeStore
+        simtime         simulation time in ms
+        bin_width       bin width in ms
+        chunk_size      number of spikes processed at once
+
+    Returns:
+        rates:          (populations x bins) float32 array of rates in spks/s;
+                        if simtime is not a multiple of bin_width, the rate
+                        of the last bin is taken over its shorter duration
+    """
+    counts = populationHistogram(spikes, simtime, bin_width, chunk_size)
+    neurons = spikes.populations['max_id'] - spikes.populations['min_id'] + 1
+    widths = np.full(counts.shape[1], float(bin_width))
+    widths[-1] = simtime - (counts.shape[1] - 1) * bin_width
+    rates = 1e3 * counts / widths / neurons[:, np.newaxis]
+    return rates.astype(np.float32)
@@ -0,0 +1,289 @@
+"""Prediction of the memory and run time of a NEST simulation.
+
+Usage:
+    resourceModel.py [options] <model_file> <sidecar>...
+
+Run from the repository root as: python -m cnstools.resourceModel
+
+The memory per MPI process and the wall times of network construction and
+simulation are modelled as linear in the number of neurons N and synapses
+(connections) S of the network, distributed over P MPI processes and
+VP = P x threads virtual processes:
+
+    memory (MB)             base + neurons * N / P + synapses * S / P
+    build time (s)          base + neurons * N / VP + synapses * S / VP
+    simulation time (s)     base + neuron_steps * N * (simtime / dt) / VP
+                                 + synapse_seconds * S * simtime (s) / VP
+
+The default coefficients are rough values of NEST 2.x on a current CPU.
+Calibrate them with the instrumentation sidecar files of a few measured
+small runs (see cnstools/instrumentation.py): the command above fits the
+coefficients to the peak memory, the time of the simulate and readout
+phases (simulation) and the remaining wall time (build) of the sidecars and
+saves them to the yaml file <model_file>, which the simulation scripts
+read with --resource_model. Prints the coefficients and the relative error
+of the fit for every sidecar.
+"""
+
+import math
+import numpy as np
+
+
+TERMS = {
+    'memory': ('base', 'neurons', 'synapses'),
+    'build': ('base', 'neurons', 'synapses'),
+    'simulate': ('base', 'neuron_steps', 'synapse_seconds')
+}
+
+DEFAULT_COEFFICIENTS = {
+    'memory': {'base': 400., 'neurons': 2e-3, 'synapses': 5e-5},
+    'build': {'base': 5., 'neurons': 2e-5, 'synapses': 1e-6},
+    'simulate': {'base': 1., 'neuron_steps': 5e-8, 'synapse_seconds': 2e-7}
+}
+
+# phases of the sidecar files which belong to the simulation
+SIMULATION_PHASES = ('simulate', 'readout')
+
+
+def _features(num_neurons, num_synapses, simtime, dt, num_processes,
+              num_threads):
+    """
+    Helper function to calculate the terms of the linear models.
+    """
+    num_vp = num_processes * num_threads
+    return {
+        'memory': {'base': 1., 'neurons': num_neurons / num_processes,
+                   'synapses': num_synapses / num_processes},
+        'build': {'base': 1., 'neurons': num_neurons / num_vp,
+                  'synapses': num_synapses / num_vp},
+        'simulate': {
+            'base': 1., 'neuron_steps': num_neurons * simtime / dt / num_vp,
+            'synapse_seconds': num_synapses * simtime * 1e-3 / num_vp
+        }
+    }
+
+
+def _fitNonnegative(features, targets):
+    """
+    Helper function to fit the coefficients of a linear model by least
+    squares, excluding terms with negative coefficients until all are
+    positive.
+    """
+    active = np.ones(features.shape[1], dtype=bool)
+    coefficients = np.zeros(features.shape[1])
+    while active.any():
+        # relative errors, such that small and large runs count alike
+        scale = 1. / np.maximum(np.abs(targets), 1e-12)
+        fit = np.linalg.lstsq(features[:, active] * scale[:, None],
+                              targets * scale, rcond=None)[0]
+        if (fit >= 0.).all():
+            coefficients[active] = fit
+            break
+        active[np.flatnonzero(active)[fit < 0.]] = False
+    return coefficients
+
+
+def _sidecarSample(sidecar):
+    """
+    Helper function to extract the network size, the parameters and the
+    measured resources of a sidecar file.
+    """
+    counters = {}
+    for phase in sidecar['phases']:
+        for name in ('network_size', 'num_connections'):
+            if name in phase:
+                counters[name] = max(counters.get(name, 0), phase[name])
+    if len(counters) < 2:
+        raise ValueError('The sidecar has no network_size and '
+                         'num_connections, which need NEST 2.16 or later')
+    simulation_time = sum(phase['wall_time'] for phase in sidecar['phases']
+                          if phase['name'] in SIMULATION_PHASES)
+    return _features(
+        counters['network_size'], counters['num_connections'],
+        sidecar['parameters']['simtime'], sidecar['parameters']['dt'],
+        sidecar['num_processes'], sidecar['num_threads']
+    ), {
+        'memory': sidecar['peak_rss'],
+        'build': sidecar['total_wall_time'] - simulation_time,
+        'simulate': simulation_time
+    }
+
+
+class ResourceModel(object):
+    """Linear model of the memory and run time of a simulation.
+
+    Parameters:
+        coefficients    dict of the coefficients of the models memory,
+                        build and simulate (see TERMS), the defaults
+                        DEFAULT_COEFFICIENTS if None
+    """
+
+    def __init__(self, coefficients=None):
+        if coefficients is None:
+            coefficients = DEFAULT_COEFFICIENTS
+        self.coefficients = {
+            model: {term: float(coefficients[model][term]) for term in terms}
+            for model, terms in TERMS.items()
+        }
+
+    @classmethod
+    def load(cls, path):
+        """Load a model saved with save."""
+        import yaml
+
+        with open(path, 'r') as f:
+            return cls(yaml.load(f, Loader=yaml.FullLoader))
+
+    def save(self, path):
+        """Save the coefficients to a yaml file."""
+        import yaml
+
+        with open(path, 'w') as f:
+            yaml.dump(self.coefficients, f, default_flow_style=False)
+
+    @classmethod
+    def calibrate(cls, sidecars):
+        """Fit the coefficients to measured runs.
+
+        Parameters:
+            sidecars        list of instrumentation sidecar files
+
+        Returns:
+            model:          ResourceModel
+        """
+        import yaml
+
+        samples = []
+        for path in sidecars:
+            with open(path, 'r') as f:
+                samples.append(_sidecarSample(
+                    yaml.load(f, Loader=yaml.FullLoader)
+                ))
+        coefficients = {}
+        for model, terms in TERMS.items():
+            features = np.array([[features[model][term] for term in terms]
+                                 for features, _ in samples])
+            targets = np.array([measured[model] for _, measured in samples])
+            coefficients[model] = dict(zip(
+                terms, _fitNonnegative(features, targets)
+            ))
+        return cls(coefficients)
+
+    def predict(self, num_neurons, num_synapses, simtime, dt,
+                num_processes=1, num_threads=1):
+        """Predict the memory and run time of a simulation.
+
+        Parameters:
+            num_neurons     number of neurons (and devices)
+            num_synapses    number of synapses (and device connections)
+            simtime         simulation time in ms
+            dt              simulation timestep in ms
+            num_processes   number of MPI processes
+            num_threads     number of threads per MPI process
+
+        Returns:
+            prediction:     dict with the memory per MPI process in MB and
+                            the build, simulation and total wall time in s
+        """
+        features = _features(num_neurons, num_synapses, simtime, dt,
+                             num_processes, num_threads)
+        prediction = {
+            model: sum(self.coefficients[model][term] * features[model][term]
+                       for term in terms)
+            for model, terms in TERMS.items()
+        }
+        return {
+            'memory': prediction['memory'],
+            'build_time': prediction['build'],
+            'simulation_time': prediction['simulate'],
+            'wall_time': prediction['build'] + prediction['simulate']
+        }
+
+
+def jobResources(prediction, num_processes=1, num_threads=1,
+                 memory_margin=1.5, time_margin=2.0, min_runtime=10):
+    """Resources of a cluster job for a predicted simulation.
+
+    The memory of a job with several MPI processes is requested per CPU
+    (sbatch --mem-per-cpu), because sbatch --mem is per node and the
+    number of processes per node is up to the scheduler.
+
+    Parameters:
+        prediction      dict returned by ResourceModel.predict
+        num_processes   number of MPI processes of the job
+        num_threads     number of threads (CPUs) per MPI process
+        memory_margin   factor applied to the predicted memory
+        time_margin     factor applied to the predicted wall time
+        min_runtime     lower bound of the runtime in minutes, which covers
+                        the start-up of the job and the import of NEST
+
+    Returns:
+        resources:      dict with the snakemake resources mem_mb (total of
+                        all processes), mem_mb_per_cpu and runtime (minutes)
+                        and mem_mb_per_process, rounded up
+    """
+    mem_mb_per_process = int(math.ceil(prediction['memory'] * memory_margin))
+    return {
+        'mem_mb': mem_mb_per_process * num_processes,
+        'mem_mb_per_cpu': int(math.ceil(mem_mb_per_process / num_threads)),
+        'mem_mb_per_process': mem_mb_per_process,
+        'runtime': max(int(math.ceil(
+            prediction['wall_time'] * time_margin / 60.
+        )), min_runtime)
+    }
+
+
+def formatPrediction(num_neurons, num_synapses, prediction, resources):
+    """Summary of a prediction for the dry runs of the simulation scripts.
+
+    Parameters:
+        num_neurons     number of neurons (and devices)
+        num_synapses    number of synapses (and device connections)
+        prediction      dict returned by ResourceModel.predict
+        resources       dict returned by jobResources
+
+    Returns:
+        summary:        multi-line string
+    """
+    return '\n'.join([
+        'Neurons: %i' % num_neurons,
+        'Synapses: %i' % num_synapses,
+        'Predicted memory per process: %.0f MB' % prediction['memory'],
+        'Predicted build time: %.1f s' % prediction['build_time'],
+        'Predicted simulation time: %.1f s' % prediction['simulation_time'],
+        'Job resources: mem_mb=%i mem_mb_per_cpu=%i runtime=%i' % (
+            resources['mem_mb'], resources['mem_mb_per_cpu'],
+            resources['runtime']
+        )
+    ])
+
+
+if __name__ == '__main__':
+    import yaml
+    from docopt import docopt
+
+    # parse command line parameters
+    args = docopt(__doc__)
+
+    # fit and save the model
+    model = ResourceModel.calibrate(args['<sidecar>'])
+    model.save(args['<model_file>'])
+    print(yaml.dump(model.coefficients, default_flow_style=False))
+
+    # relative error of every calibration run
+    print('%-50s %10s %10s %10s' % ('sidecar', 'memory', 'build',
+                                    'simulate'))
+    for path in args['<sidecar>']:
+        with open(path, 'r') as f:
+            features, measured = _sidecarSample(
+                yaml.load(f, Loader=yaml.FullLoader)
+            )
+        errors = []
+        for model_name, terms in TERMS.items():
+            predicted = sum(model.coefficients[model_name][term] *
+                            features[model_name][term] for term in terms)
+            errors.append((predicted - measured[model_name]) /
+                          max(measured[model_name], 1e-12))
+        print('%-50s %+9.1f%% %+9.1f%% %+9.1f%%' % (
+            (path[-50:],) + tuple(100. * error for error in errors)
+        ))
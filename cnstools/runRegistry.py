@@ -0,0 +1,237 @@
+"""SQLite registry of simulation runs, their outputs and statistics.
+
+Every run is identified by a key, the hash of its full parameter set and of
+the contents of its input files (see runKey). The simulation scripts
+register the parameters and output files of a run, the statistics scripts
+add the reduced statistics of the outputs, and sweep drivers look up
+finished runs instead of simulating them again:
+
+    registry = RunRegistry('runs.sqlite')
+    key = runKey({'g': 5.0, 'nu_ex': 2.0, 'master_seed': 1})
+    run = registry.finished(key)
+    if run is None:
+        ...  # simulate and save spikes.npy
+        registry.register(key, 'simulateBrunel', parameters, ['spikes.npy'])
+    registry.addStatistics(key, 'E', {'CV': 0.8})
+    registry.query(g=5.0)   # all runs with g = 5
+
+The registry consists of the tables
+
+    runs        key, script, parameters (json), created (unix time)
+    outputs     path, key
+    statistics  key, label (e.g. population), name, value
+
+Concurrent jobs may write to the same registry, SQLite locks the file;
+file systems without reliable locks (e.g. some NFS mounts) need one registry
+per job.
+"""
+
+import json
+import os
+import sqlite3
+import time
+import numpy as np
+
+from .networkCache import hashInputs
+
+
+def _jsonable(value):
+    """
+    Helper function to convert numpy scalars and arrays (also in nested
+    dicts and lists) to the corresponding python types.
+    """
+    if isinstance(value, dict):
+        return {str(key): _jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_jsonable(item) for item in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def runKey(parameters, inputs=()):
+    """Key of a run: hash of its parameters and the contents of its inputs.
+
+    Parameters:
+        parameters      dict of all parameters of the run, which may
+                        contain nested dicts (e.g. neuron parameters)
+        inputs          list of input files of the run (optional)
+
+    Returns:
+        key:            hexadecimal sha1 digest
+    """
+    return hashInputs(list(inputs), parameters=json.dumps(
+        _jsonable(parameters), sort_keys=True
+    ))
+
+
+class RunRegistry(object):
+    """Registry of simulation runs in an SQLite database.
+
+    Parameters:
+        path            database file, created if necessary
+        timeout         time in s to wait for a lock of another process
+    """
+
+    def __init__(self, path, timeout=60.):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=timeout)
+        with self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS runs (
+                    key TEXT PRIMARY KEY, script TEXT, parameters TEXT,
+                    created REAL);
+                CREATE TABLE IF NOT EXISTS outputs (
+                    path TEXT PRIMARY KEY, key TEXT);
+                CREATE TABLE IF NOT EXISTS statistics (
+                    key TEXT, label TEXT, name TEXT, value REAL,
+                    PRIMARY KEY (key, label, name));
+                CREATE INDEX IF NOT EXISTS outputs_key ON outputs (key);
+            """)
+
+    def close(self):
+        """Close the database connection."""
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def register(self, key, script, parameters, outputs=()):
+        """Register a run and its output files.
+
+        A run registered before under the same key is replaced, its outputs
+        and statistics are kept.
+
+        Parameters:
+            key             key of the run (see runKey)
+            script          name of the simulation script
+            parameters      dict of all parameters of the run
+            outputs         list of output files
+        """
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?)',
+                (key, script, json.dumps(_jsonable(parameters),
+                                         sort_keys=True), time.time())
+            )
+        self.addOutputs(key, outputs)
+
+    def addOutputs(self, key, outputs):
+        """Add output files to a run, e.g. copies or derived files.
+
+        Parameters:
+            key             key of the run
+            outputs         list of output files
+        """
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO outputs VALUES (?, ?)',
+                [(os.path.abspath(path), key) for path in outputs]
+            )
+
+    def addStatistics(self, key, label, statistics):
+        """Add reduced statistics to a run.
+
+        Parameters:
+            key             key of the run
+            label           label of the statistics, e.g. the population
+            statistics      dict of names and values, e.g. {'CV': 0.8}
+        """
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO statistics VALUES (?, ?, ?, ?)',
+                [(key, label, name, float(value))
+                 for name, value in statistics.items()]
+            )
+
+    def keyOf(self, path):
+        """Key of the run that wrote an output file, None if unknown."""
+        row = self.connection.execute(
+            'SELECT key FROM outputs WHERE path = ?',
+            (os.path.abspath(path),)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def run(self, key):
+        """Look up a run.
+
+        Parameters:
+            key             key of the run
+
+        Returns:
+            run:            dict with the entries key, script, parameters,
+                            created, outputs (list of paths) and statistics
+                            (dict of labels and dicts of names and values),
+                            None if the run is not registered
+        """
+        row = self.connection.execute(
+            'SELECT key, script, parameters, created FROM runs '
+            'WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        statistics = {}
+        for label, name, value in self.connection.execute(
+                'SELECT label, name, value FROM statistics WHERE key = ?',
+                (key,)):
+            statistics.setdefault(label, {})[name] = value
+        return {
+            'key': row[0], 'script': row[1],
+            'parameters': json.loads(row[2]), 'created': row[3],
+            'outputs': [path for path, in self.connection.execute(
+                'SELECT path FROM outputs WHERE key = ? ORDER BY path',
+                (key,)
+            )],
+            'statistics': statistics
+        }
+
+    def finished(self, key, require_outputs=True):
+        """Look up a run whose output files all still exist.
+
+        Parameters:
+            key             key of the run
+            require_outputs whether runs without output files (e.g. with
+                            statistics only) are unfinished
+
+        Returns:
+            run:            see run, None if the run is not registered, an
+                            output file is missing or, with require_outputs,
+                            the run has no output files
+        """
+        run = self.run(key)
+        if run is None or not all(os.path.exists(path)
+                                  for path in run['outputs']):
+            return None
+        if require_outputs and len(run['outputs']) == 0:
+            return None
+        return run
+
+    def query(self, script=None, **parameters):
+        """Find all runs with the given parameters.
+
+        Parameters:
+            script          name of the simulation script (any if None)
+            parameters      values of top level parameters of the runs,
+                            e.g. g=5.0
+
+        Returns:
+            runs:           list of runs (see run), oldest first
+        """
+        if script is None:
+            rows = self.connection.execute(
+                'SELECT key, parameters FROM runs ORDER BY created'
+            )
+        else:
+            rows = self.connection.execute(
+                'SELECT key, parameters FROM runs WHERE script = ? '
+                'ORDER BY created', (script,)
+            )
+        parameters = _jsonable(parameters)
+        keys = [key for key, run_parameters in rows.fetchall() if all(
+            json.loads(run_parameters).get(name) == value
+            for name, value in parameters.items()
+        )]
+        return [self.run(key) for key in keys]
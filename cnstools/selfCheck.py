@@ -0,0 +1,250 @@
+"""Check the shared tools against small cases with known results.
+
+Usage:
+    selfCheck.py [options]
+
+Run from the repository root as: python -m cnstools.selfCheck
+
+Runs without NEST and checks the spike statistics against hand-computed
+values and a per-neuron reference, the dense and sparse matrix helpers
+against each other, the confidence intervals and seed blocks of ensembles,
+the lattice of the adaptive refinement of the phase diagram
+(part2_snakemake/scripts/refinePhaseDiagram.py) and the run registry. Prints
+one line per check and exits with status 1 if any of them fails.
+
+Options:
+    --seed=<seed>       seed of the random number generator [default: 0]
+"""
+
+import os
+import sys
+import tempfile
+import numpy as np
+
+from cnstools.ensemble import (confidenceInterval, reduceTrials,
+                               seedBlockSize, trialSeeds)
+from cnstools.runRegistry import RunRegistry, runKey
+from cnstools.sparseMatrix import (SparseMatrix, blockSums, entriesAt,
+                                   mapEntries, matrixArrays,
+                                   matrixFromArrays, nonzeroEntries)
+from cnstools.spikeStatistics import calculateSpikeStatistics, isiHistogram
+
+
+def _check(condition, message):
+    """
+    Helper function to raise an AssertionError with the message if the
+    condition does not hold (unlike assert also with python -O).
+    """
+    if not condition:
+        raise AssertionError(message)
+
+
+def checkSpikeStatistics(rng):
+    """Check the spike statistics against known values.
+
+    Parameters:
+        rng             numpy RandomState for the reference comparison
+    """
+    # regular, irregular, single-spike and (with the id range) silent neuron
+    senders = np.array([2, 1, 1, 3, 2, 1, 2, 1])
+    times = np.array([10., 10., 20., 5., 30., 30., 40., 40.])
+    stats = calculateSpikeStatistics(senders, times, simtime=100., min_id=1,
+                                     max_id=4, bin_width=50.)
+    _check(np.array_equal(stats['spike_count'], [4, 3, 1, 0]),
+           'spike counts %s' % stats['spike_count'])
+    _check(np.allclose(stats['rate'], [40., 30., 10., 0.]),
+           'rates %s' % stats['rate'])
+    _check(np.isclose(stats['rate_pop'], 20.),
+           'population rate %g' % stats['rate_pop'])
+    # ISIs 10, 10, 10 and 20, 10
+    _check(np.allclose(stats['CV'][:2], [0., 1. / 3.]) and
+           np.all(np.isnan(stats['CV'][2:])), 'CVs %s' % stats['CV'])
+    _check(np.allclose(stats['LV'][:2], [0., 1. / 3.]),
+           'LVs %s' % stats['LV'])
+    _check(np.isclose(stats['CV_pop'], 1. / 12.),
+           'population CV %g' % stats['CV_pop'])
+    # counts (4, 0), (3, 0) and (1, 0) in the two bins
+    _check(np.allclose(stats['FF'][:3], [2., 1.5, 0.5]) and
+           np.isnan(stats['FF'][3]), 'Fano factors %s' % stats['FF'])
+    hist, _ = isiHistogram(senders, times, [0., 15., 25.])
+    _check(np.array_equal(hist, [4, 1]), 'ISI histogram %s' % hist)
+    try:
+        calculateSpikeStatistics(senders, times, bin_width=50.)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('bin_width without simtime was accepted')
+
+    # random spike trains against a loop over neurons
+    senders = rng.randint(1, 21, 2000)
+    times = rng.uniform(0., 1000., 2000)
+    stats = calculateSpikeStatistics(senders, times, simtime=1000.)
+    for ii, sender in enumerate(stats['ids']):
+        isis = np.diff(np.sort(times[senders == sender]))
+        _check(np.isclose(stats['CV'][ii], isis.std() / isis.mean()),
+               'CV of neuron %d' % sender)
+        LV = np.mean(3. * ((isis[:-1] - isis[1:]) /
+                           (isis[:-1] + isis[1:]))**2)
+        _check(np.isclose(stats['LV'][ii], LV), 'LV of neuron %d' % sender)
+
+
+def checkSparseMatrix(rng):
+    """Check that dense and sparse matrices give the same results.
+
+    Parameters:
+        rng             numpy RandomState for the test matrix
+    """
+    dense = rng.uniform(0., 1., (7, 6)) * (rng.uniform(0., 1., (7, 6)) < 0.4)
+    sparse = SparseMatrix.fromDense(dense)
+    _check(np.array_equal(sparse.toDense(), dense), 'fromDense/toDense')
+
+    for name, matrix in (('dense', dense), ('sparse', sparse)):
+        row, col, data = nonzeroEntries(matrix)
+        _check(np.array_equal(dense[row, col], data) and
+               len(data) == np.count_nonzero(dense),
+               'nonzeroEntries of the %s matrix' % name)
+        rows, cols = np.indices(dense.shape)
+        _check(np.array_equal(entriesAt(matrix, rows, cols), dense),
+               'entriesAt of the %s matrix' % name)
+        _check(np.allclose(blockSums(matrix, 3, num_cols=5),
+                           blockSums(dense[:, :5], 3)),
+               'blockSums of the %s matrix' % name)
+        doubled = mapEntries(matrix, lambda x: 2. * x)
+        _check(np.array_equal(entriesAt(doubled, rows, cols), 2. * dense),
+               'mapEntries of the %s matrix' % name)
+        restored = matrixFromArrays('w', matrixArrays('w', matrix))
+        _check(type(restored) is type(matrix) and np.array_equal(
+            entriesAt(restored, rows, cols), dense
+        ), 'matrixArrays/matrixFromArrays of the %s matrix' % name)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'matrix.npz')
+        sparse.save(path)
+        _check(np.array_equal(SparseMatrix.load(path).toDense(), dense),
+               'save/load')
+
+
+def checkEnsemble():
+    """Check the confidence intervals and seed blocks of ensembles."""
+    mean, ci, num_trials = confidenceInterval([1., 2., np.nan, 3.])
+    _check(np.isclose(mean, 2.) and np.isclose(ci, 4.303 / np.sqrt(3.)) and
+           num_trials == 3, 'confidence interval %g +- %g (%d)'
+           % (mean, ci, num_trials))
+    _, ci, _ = confidenceInterval(np.arange(1001.))
+    _check(np.isclose(ci, 1.9623 * np.arange(1001.).std(ddof=1) /
+                      np.sqrt(1001.), rtol=1e-4),
+           'confidence interval beyond the t table')
+    _check(np.isnan(confidenceInterval([1.])[1]),
+           'confidence interval of a single trial')
+
+    seeds = trialSeeds(1, 3, N_tp=2)
+    _check(seeds == [1, 7, 13] and seedBlockSize(2) == 6,
+           'trial seeds %s' % seeds)
+
+    table = np.array([(5., 1.), (5., 3.), (4., 2.)],
+                     dtype=[('g', np.float64), ('CV', np.float64)])
+    reduced = reduceTrials(table, ['g'], ['CV'])
+    _check(np.array_equal(reduced['g'], [4., 5.]) and
+           np.array_equal(reduced['CV'], [2., 2.]) and
+           np.array_equal(reduced['num_trials'], [1, 2]),
+           'reduceTrials %s' % reduced)
+
+
+def checkRefinement():
+    """Check that the refinement simulates each lattice point only once."""
+    sys.path.insert(0, os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), os.pardir,
+        'part2_snakemake', 'scripts'
+    ))
+    from refinePhaseDiagram import refinePhaseDiagram
+
+    # step in the CV between g = 3 and g = 5
+    simulated = []
+
+    def simulate(points):
+        simulated.extend(points)
+        return [float(g > 4.5) for g, _ in points]
+
+    table = refinePhaseDiagram(simulate, g_min=1., g_stepsize=2., g_steps=4,
+                               nu_ex_min=0., nu_ex_stepsize=1., nu_ex_steps=2,
+                               depth=2, threshold=0.1)
+    _check(len(set(simulated)) == len(simulated) == len(table),
+           'points simulated more than once')
+    _check(np.sum(table['level'] == 0) == 8, 'coarse grid')
+    refined = table[table['level'] > 0]
+    _check(len(refined) > 0 and np.all(refined['g'] >= 3.) and
+           np.all(refined['g'] <= 5.), 'refinement away from the step')
+    _check(np.allclose(table['g'] * 2., np.round(table['g'] * 2.)) and
+           np.allclose(table['nu_ex'] * 4., np.round(table['nu_ex'] * 4.)),
+           'points off the finest lattice')
+    _check(np.array_equal(table['CV'], (table['g'] > 4.5).astype(float)),
+           'CVs of the table')
+
+
+def checkRegistry():
+    """Check keys, lookups and queries of the run registry."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        spikes = os.path.join(tmpdir, 'spikes.npy')
+        inputs = os.path.join(tmpdir, 'network.yaml')
+        with open(inputs, 'w') as f:
+            f.write('N: 10\n')
+
+        key = runKey({'g': 5., 'nu_ex': 2.}, [inputs])
+        _check(key == runKey({'nu_ex': 2., 'g': np.float64(5.)}, [inputs]),
+               'key depends on the order or type of the parameters')
+        _check(key != runKey({'g': 4., 'nu_ex': 2.}, [inputs]),
+               'key ignores the parameters')
+        with open(inputs, 'w') as f:
+            f.write('N: 20\n')
+        _check(key != runKey({'g': 5., 'nu_ex': 2.}, [inputs]),
+               'key ignores the contents of the inputs')
+
+        with RunRegistry(os.path.join(tmpdir, 'runs.sqlite')) as registry:
+            np.save(spikes, np.zeros((2, 0)))
+            registry.register(key, 'check', {'g': 5., 'nu_ex': 2.},
+                              [spikes])
+            registry.addStatistics(key, 'E', {'CV': 0.8})
+            run = registry.finished(key)
+            _check(run is not None and run['statistics'] == {'E': {
+                'CV': 0.8
+            }}, 'finished run %s' % run)
+            _check(registry.keyOf(spikes) == key, 'keyOf')
+            _check([r['key'] for r in registry.query(g=5.)] == [key] and
+                   registry.query(g=4.) == [], 'query')
+            os.remove(spikes)
+            _check(registry.finished(key) is None,
+                   'run with a missing output is finished')
+
+            registry.register('statistics_only', 'check', {'g': 4.})
+            _check(registry.finished('statistics_only') is None and
+                   registry.finished('statistics_only',
+                                     require_outputs=False) is not None,
+                   'run without outputs')
+
+
+if __name__ == '__main__':
+    from docopt import docopt
+
+    # parse command line parameters
+    args = docopt(__doc__)
+    seed = int(args['--seed'])
+
+    checks = [
+        ('spike statistics',
+         lambda: checkSpikeStatistics(np.random.RandomState(seed))),
+        ('sparse matrices',
+         lambda: checkSparseMatrix(np.random.RandomState(seed))),
+        ('ensemble', checkEnsemble),
+        ('refinement lattice', checkRefinement),
+        ('run registry', checkRegistry)
+    ]
+    failed = 0
+    for name, check in checks:
+        try:
+            check()
+        except AssertionError as error:
+            print('%-20s FAILED: %s' % (name, error))
+            failed += 1
+        else:
+            print('%-20s ok' % name)
+    sys.exit(1 if failed > 0 else 0)
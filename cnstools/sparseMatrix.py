@@ -0,0 +1,192 @@
+"""Sparse storage of connectivity matrices.
+
+The structural data of the multi-area model are matrices with one row per
+target population and one column per source population (plus a last column
+for the external input). For models with thousands of populations most
+entries are zero, so besides dense npy files they can be stored as npz
+files with the COO arrays row, col and data of the non-zero entries in
+row-major order and the shape of the matrix:
+
+    synapses = SparseMatrix.fromDense(np.load('synapse_matrix.npy'))
+    synapses.save('synapse_matrix.npz')
+
+loadMatrix loads both formats and nonzeroEntries iterates the non-zero
+entries of either without creating the dense matrix.
+"""
+
+import os
+import numpy as np
+
+
+class SparseMatrix(object):
+    """Matrix in COO format with its entries in row-major order.
+
+    Parameters:
+        row             row indices of the non-zero entries
+        col             column indices of the non-zero entries
+        data            values of the non-zero entries
+        shape           shape of the matrix
+    """
+
+    def __init__(self, row, col, data, shape):
+        order = np.lexsort((col, row))
+        self.row = np.asarray(row, dtype=np.int64)[order]
+        self.col = np.asarray(col, dtype=np.int64)[order]
+        self.data = np.asarray(data)[order]
+        self.shape = tuple(int(n) for n in shape)
+
+    @classmethod
+    def fromDense(cls, dense):
+        """Sparse matrix of the non-zero entries of a dense matrix."""
+        row, col = np.nonzero(dense)
+        return cls(row, col, dense[row, col], dense.shape)
+
+    @classmethod
+    def load(cls, path):
+        """Load a sparse matrix from an npz file."""
+        with np.load(path) as f:
+            return cls(f['row'], f['col'], f['data'], f['shape'])
+
+    def save(self, path):
+        """Save the sparse matrix to an npz file."""
+        np.savez(path, row=self.row, col=self.col, data=self.data,
+                 shape=np.array(self.shape))
+
+    def toDense(self):
+        """Dense matrix with the same entries."""
+        dense = np.zeros(self.shape, dtype=self.data.dtype)
+        dense[self.row, self.col] = self.data
+        return dense
+
+    def withData(self, data):
+        """Sparse matrix with the same non-zero pattern and new values."""
+        matrix = SparseMatrix.__new__(SparseMatrix)
+        matrix.row, matrix.col, matrix.shape = self.row, self.col, self.shape
+        matrix.data = np.asarray(data)
+        return matrix
+
+
+def loadMatrix(path):
+    """Load a dense (npy) or sparse (npz) matrix.
+
+    Parameters:
+        path            npy or npz file
+
+    Returns:
+        matrix:         ndarray or SparseMatrix
+    """
+    if os.path.splitext(path)[1] == '.npz':
+        return SparseMatrix.load(path)
+    return np.load(path)
+
+
+def mapEntries(matrix, func):
+    """Apply an elementwise function to a dense or sparse matrix.
+
+    For a sparse matrix, func is only applied to the stored entries, hence
+    it has to map zero to zero.
+
+    Parameters:
+        matrix          ndarray or SparseMatrix
+        func            elementwise function of an array
+
+    Returns:
+        matrix:         matrix of the same kind
+    """
+    if isinstance(matrix, SparseMatrix):
+        return matrix.withData(func(matrix.data))
+    return func(matrix)
+
+
+def nonzeroEntries(matrix):
+    """Non-zero entries of a dense or sparse matrix in row-major order.
+
+    Parameters:
+        matrix          ndarray or SparseMatrix
+
+    Returns:
+        row, col, data: arrays of the row and column indices and values
+    """
+    if isinstance(matrix, SparseMatrix):
+        keep = matrix.data != 0
+        return matrix.row[keep], matrix.col[keep], matrix.data[keep]
+    row, col = np.nonzero(matrix)
+    return row, col, matrix[row, col]
+
+
+def entriesAt(matrix, row, col):
+    """Entries of a dense or sparse matrix at the given positions.
+
+    Parameters:
+        matrix          ndarray or SparseMatrix
+        row             row indices
+        col             column indices
+
+    Returns:
+        values:         array of the entries, zero where nothing is stored
+    """
+    if not isinstance(matrix, SparseMatrix):
+        return matrix[row, col]
+    # binary search in the row-major linear indices of the stored entries
+    stored = matrix.row * matrix.shape[1] + matrix.col
+    wanted = np.asarray(row) * matrix.shape[1] + np.asarray(col)
+    if len(stored) == 0:
+        return np.zeros(wanted.shape, dtype=matrix.data.dtype)
+    index = np.minimum(np.searchsorted(stored, wanted), len(stored) - 1)
+    return np.where(stored[index] == wanted, matrix.data[index], 0)
+
+
+def blockSums(matrix, block_size, num_cols=None):
+    """Sum the entries of a dense or sparse matrix in square blocks.
+
+    Parameters:
+        matrix          ndarray or SparseMatrix
+        block_size      number of rows and columns per block
+        num_cols        only sum the first num_cols columns (all if None)
+
+    Returns:
+        blocks:         dense array of the block sums
+    """
+    num_rows = matrix.shape[0]
+    num_cols = matrix.shape[1] if num_cols is None else num_cols
+    row, col, data = nonzeroEntries(matrix)
+    keep = col < num_cols
+    blocks = np.zeros((-(-num_rows // block_size), -(-num_cols // block_size)))
+    np.add.at(blocks, (row[keep] // block_size, col[keep] // block_size),
+              data[keep])
+    return blocks
+
+
+def matrixArrays(name, matrix):
+    """Flat dict of arrays of a dense or sparse matrix, e.g. for np.save.
+
+    Parameters:
+        name            name of the matrix, used as prefix of sparse arrays
+        matrix          ndarray or SparseMatrix
+
+    Returns:
+        arrays:         dict {name: matrix} for a dense matrix and
+                        {name_row, name_col, name_data, name_shape} for a
+                        sparse one
+    """
+    if not isinstance(matrix, SparseMatrix):
+        return {name: matrix}
+    return {name + '_row': matrix.row, name + '_col': matrix.col,
+            name + '_data': matrix.data,
+            name + '_shape': np.array(matrix.shape)}
+
+
+def matrixFromArrays(name, arrays):
+    """Inverse of matrixArrays.
+
+    Parameters:
+        name            name of the matrix
+        arrays          dict of arrays returned by matrixArrays
+
+    Returns:
+        matrix:         ndarray or SparseMatrix
+    """
+    if name in arrays:
+        return np.array(arrays[name])
+    return SparseMatrix(arrays[name + '_row'], arrays[name + '_col'],
+                        arrays[name + '_data'], arrays[name + '_shape'])
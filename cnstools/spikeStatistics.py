@@ -0,0 +1,196 @@
+"""Vectorized spike train statistics.
+
+All statistics are computed from flat (senders, times) arrays in a single
+pass: the spikes are sorted once by (sender, time), the boundaries between
+the spike trains of different neurons are located, and the interspike
+interval (ISI) statistics of all neurons are obtained with np.add.reduceat.
+
+Population averages are taken over all neurons of the population, where
+neurons with an undefined statistic (e.g. less than two ISIs for the CV)
+contribute zero. If no id range is given, the population consists of all
+neurons that emitted at least one spike.
+"""
+
+import numpy as np
+
+
+def sortSpikes(senders, times):
+    """Sort spikes by sender and, for equal senders, by spike time.
+
+    Parameters:
+        senders         array of spike senders
+        times           array of spike times
+
+    Returns:
+        senders, times: sorted copies of the input arrays
+    """
+    # lexsort is stable and sorts by the last key first
+    order = np.lexsort((times, senders))
+    return senders[order], times[order]
+
+
+def _segmentStarts(senders):
+    """
+    Helper function to find the first index of each sender in sorted senders.
+    """
+    if len(senders) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.flatnonzero(np.r_[True, senders[1:] != senders[:-1]])
+
+
+def _isis(senders, times):
+    """
+    Helper function to calculate the ISIs of sorted spikes. Returns an array
+    of the same length as times and a mask of the entries which are actual
+    ISIs, i.e. which do not span two neurons or pad the end.
+    """
+    isis = np.zeros(len(times))
+    within = np.zeros(len(times), dtype=bool)
+    if len(times) > 1:
+        within[:-1] = senders[1:] == senders[:-1]
+        isis[:-1] = np.diff(times)
+        isis[~within] = 0.
+    return isis, within
+
+
+def _segmentMean(values, mask, starts, counts):
+    """
+    Helper function to average the masked values over all segments; empty
+    segments yield NaN.
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.add.reduceat(np.where(mask, values, 0.), starts) / counts
+
+
+def calculateSpikeStatistics(senders, times, simtime=None, min_id=None,
+                             max_id=None, bin_width=None):
+    """Calculate rates, CVs, LVs and Fano factors of a population.
+
+    Parameters:
+        senders         array of spike senders
+        times           array of spike times in ms
+        simtime         simulation time in ms; required for rates and
+                        Fano factors
+        min_id          smallest id of the population (optional)
+        max_id          largest id of the population (optional)
+        bin_width       bin width for the spike counts of the Fano factor
+                        in ms; the Fano factor is omitted if None and
+                        requires simtime otherwise
+
+    Returns:
+        stats:          dict with the population ids 'ids', the per-neuron
+                        arrays 'spike_count', 'CV', 'LV', 'rate' (spks/s)
+                        and 'FF' as well as the population averages
+                        'CV_pop', 'LV_pop', 'rate_pop' and 'FF_pop'; the
+                        latter two of each are only present if simtime
+                        (and bin_width) are given
+    """
+    if bin_width is not None and simtime is None:
+        raise ValueError('the Fano factor (bin_width) requires simtime')
+
+    senders = np.asarray(senders).astype(np.int64)
+    times = np.asarray(times, dtype=np.float64)
+
+    senders, times = sortSpikes(senders, times)
+    starts = _segmentStarts(senders)
+    counts = np.diff(np.r_[starts, len(senders)])
+
+    # ids of the population and index of each spike train in the population
+    if min_id is None or max_id is None:
+        ids = senders[starts]
+        segment_index = np.arange(len(starts))
+    else:
+        ids = np.arange(min_id, max_id + 1)
+        segment_index = senders[starts] - min_id
+    neurons_pop = len(ids)
+
+    isis, within = _isis(senders, times)
+    num_isis = counts - 1
+
+    CV_segments = np.full(len(starts), np.nan)
+    LV_segments = np.full(len(starts), np.nan)
+    if len(starts) > 0:
+        # mean and standard deviation of the ISIs (two-pass)
+        isi_mean = _segmentMean(isis, within, starts, num_isis)
+        deviations = isis - np.repeat(isi_mean, counts)
+        isi_std = np.sqrt(
+            _segmentMean(deviations**2, within, starts, num_isis)
+        )
+        valid = num_isis > 1
+        CV_segments[valid] = isi_std[valid] / isi_mean[valid]
+
+        # local variation from consecutive ISI pairs of the same neuron
+        pairs = within & np.r_[within[1:], False]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            isis_next = np.r_[isis[1:], 0.]
+            terms = 3. * ((isis - isis_next) / (isis + isis_next))**2
+        LV_segments[valid] = _segmentMean(
+            terms, pairs, starts, num_isis - 1
+        )[valid]
+
+    # scatter segment results to all neurons of the population
+    spike_count = np.zeros(neurons_pop, dtype=np.int64)
+    spike_count[segment_index] = counts
+    CV = np.full(neurons_pop, np.nan)
+    CV[segment_index] = CV_segments
+    LV = np.full(neurons_pop, np.nan)
+    LV[segment_index] = LV_segments
+
+    stats = {
+        'ids': ids,
+        'spike_count': spike_count,
+        'CV': CV,
+        'LV': LV,
+        'CV_pop': np.nansum(CV) / max(neurons_pop, 1),
+        'LV_pop': np.nansum(LV) / max(neurons_pop, 1)
+    }
+    if simtime is not None:
+        stats['rate'] = 1e3 * spike_count / simtime
+        stats['rate_pop'] = 1e3 * len(times) / simtime / max(neurons_pop, 1)
+    if bin_width is not None:
+        stats['FF'] = fanoFactor(senders, times, simtime, bin_width, ids)
+        stats['FF_pop'] = np.nansum(stats['FF']) / max(neurons_pop, 1)
+
+    return stats
+
+
+def fanoFactor(senders, times, simtime, bin_width, ids):
+    """Calculate the Fano factor of the binned spike counts of each neuron.
+
+    Parameters:
+        senders         array of spike senders
+        times           array of spike times in ms
+        simtime         simulation time in ms
+        bin_width       bin width in ms
+        ids             sorted array of neuron ids
+
+    Returns:
+        FF:             Fano factor of each neuron, NaN for silent neurons
+    """
+    num_bins = int(np.ceil(simtime / bin_width))
+    neuron_index = np.searchsorted(ids, senders)
+    bin_index = np.minimum((times // bin_width).astype(np.int64),
+                           num_bins - 1)
+    counts = np.bincount(
+        neuron_index * num_bins + bin_index,
+        minlength=len(ids) * num_bins
+    ).reshape(len(ids), num_bins)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return counts.var(axis=1) / counts.mean(axis=1)
+
+
+def isiHistogram(senders, times, bins):
+    """Histogram of the ISIs of all neurons.
+
+    Parameters:
+        senders         array of spike senders
+        times           array of spike times in ms
+        bins            bins as accepted by np.histogram
+
+    Returns:
+        hist, bin_edges: as returned by np.histogram
+    """
+    senders = np.asarray(senders).astype(np.int64)
+    times = np.asarray(times, dtype=np.float64)
+    isis, within = _isis(*sortSpikes(senders, times))
+    return np.histogram(isis[within], bins=bins)
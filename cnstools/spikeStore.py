@@ -0,0 +1,516 @@
+"""Columnar on-disk storage of spike data.
+
+A spike store is a directory holding the flat arrays
+
+    senders.npy         uint32 spike senders
+    times.npy           float32 spike times in ms
+    populations.npy     population table with the fields name, min_id,
+                        max_id, start and stop
+
+where the spikes of population p are senders[start_p:stop_p] and
+times[start_p:stop_p]. Stores are written chunk by chunk with memory-mapped
+arrays, such that converting the text files of NEST's spike detectors
+(gdf files with one 'sender time' line per spike) never holds all spikes in
+memory. All arrays can be loaded with np.load(..., mmap_mode='r') and
+SpikeStore reads the spikes of single populations without loading the rest:
+
+    spikes = SpikeStore('simulated_activity/spikes')
+    senders, times = spikes.population('V1-4-E', t_min=100., t_max=200.)
+
+Indexing a store (indexSpikeStore) sorts the spikes by (sender, time) and
+adds two offset tables, such that time windows and id ranges are found by
+binary search without touching the rest of the data:
+
+    neuron_offsets.npy  spikes of neuron min_id + i are senders[o_i:o_i+1]
+    by_time/            time-sorted copy of senders.npy and times.npy with
+                        the bin edges time_bins.npy and the offsets
+                        offsets.npy of the spikes in each bin
+"""
+
+import glob
+import os
+import numpy as np
+
+
+SENDER_DTYPE = np.uint32
+TIME_DTYPE = np.float32
+POPULATION_DTYPE = np.dtype([
+    ('name', 'U32'), ('min_id', np.int64), ('max_id', np.int64),
+    ('start', np.int64), ('stop', np.int64)
+])
+
+
+def populationLabel(index):
+    """Label of the spike detector of the population with the given index.
+
+    Parameters:
+        index           index of the population in the population table
+
+    Returns:
+        label:          label used as prefix of the gdf files
+    """
+    return 'spikes_%04i' % index
+
+
+def gdfFiles(data_path, label):
+    """Find all gdf files of the spike detector with the given label.
+
+    Parameters:
+        data_path       directory of the gdf files
+        label           label of the spike detector
+
+    Returns:
+        filenames:      sorted list of the files of all threads and ranks
+    """
+    return sorted(glob.glob(os.path.join(data_path, label + '-*.gdf')))
+
+
+def countGdf(filenames, chunk_bytes=2**24):
+    """Count the spikes in gdf files without parsing them.
+
+    Parameters:
+        filenames       list of gdf files
+        chunk_bytes     size of the chunks read at once
+
+    Returns:
+        count:          total number of lines
+    """
+    count = 0
+    for fn in filenames:
+        with open(fn, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_bytes), b''):
+                count += chunk.count(b'\n')
+    return count
+
+
+def iterGdf(filenames, chunk_bytes=2**24):
+    """Iterate over the spikes in gdf files chunk by chunk.
+
+    Parameters:
+        filenames       list of gdf files
+        chunk_bytes     size of the chunks read at once
+
+    Yields:
+        senders, times: arrays of the spikes of one chunk
+    """
+    for fn in filenames:
+        with open(fn, 'rb') as f:
+            remainder = b''
+            for chunk in iter(lambda: f.read(chunk_bytes), b''):
+                # only parse complete lines, keep the rest for the next chunk
+                chunk = remainder + chunk
+                split = chunk.rfind(b'\n') + 1
+                remainder = chunk[split:]
+                if split > 0:
+                    yield _parseGdf(chunk[:split])
+            if len(remainder.strip()) > 0:
+                yield _parseGdf(remainder)
+
+
+def _parseGdf(lines):
+    """
+    Helper function to parse complete lines of a gdf file.
+    """
+    values = np.array(lines.split(), dtype=np.float64).reshape(-1, 2)
+    return values[:, 0].astype(SENDER_DTYPE), values[:, 1].astype(TIME_DTYPE)
+
+
+def _openArrays(path, num_spikes):
+    """
+    Helper function to create the memory-mapped arrays of a new store.
+    """
+    os.makedirs(path, exist_ok=True)
+    senders = np.lib.format.open_memmap(
+        os.path.join(path, 'senders.npy'), mode='w+', dtype=SENDER_DTYPE,
+        shape=(num_spikes,)
+    )
+    times = np.lib.format.open_memmap(
+        os.path.join(path, 'times.npy'), mode='w+', dtype=TIME_DTYPE,
+        shape=(num_spikes,)
+    )
+    return senders, times
+
+
+def saveSpikeStore(path, populations, index=True):
+    """Save the spikes of all populations in a spike store.
+
+    Parameters:
+        path            directory of the spike store
+        populations     list of (name, min_id, max_id, senders, times) of
+                        all populations
+        index           index the store afterwards, see indexSpikeStore
+    """
+    counts = np.array([len(pop[3]) for pop in populations], dtype=np.int64)
+    table = np.zeros(len(populations), dtype=POPULATION_DTYPE)
+    table['name'] = [pop[0] for pop in populations]
+    table['min_id'] = [pop[1] for pop in populations]
+    table['max_id'] = [pop[2] for pop in populations]
+    table['stop'] = np.cumsum(counts)
+    table['start'] = table['stop'] - counts
+
+    senders, times = _openArrays(path, int(counts.sum()))
+    for ii, pop in enumerate(populations):
+        senders[table['start'][ii]:table['stop'][ii]] = pop[3]
+        times[table['start'][ii]:table['stop'][ii]] = pop[4]
+    senders.flush()
+    times.flush()
+    del senders, times
+
+    np.save(os.path.join(path, 'populations.npy'), table)
+    if index:
+        indexSpikeStore(path)
+
+
+def convertGdf(path, populations, data_path, chunk_bytes=2**24,
+               index=True):
+    """Convert the gdf files of all populations into a spike store.
+
+    Parameters:
+        path            directory of the spike store
+        populations     population table (POPULATION_DTYPE); the spike
+                        detector of row i has the label populationLabel(i)
+        data_path       directory of the gdf files
+        chunk_bytes     size of the chunks read at once
+        index           index the store afterwards, see indexSpikeStore
+    """
+    populations = np.array(populations, dtype=POPULATION_DTYPE)
+    files = [gdfFiles(data_path, populationLabel(ii))
+             for ii in range(len(populations))]
+
+    # first pass: count the spikes to determine the population offsets
+    counts = np.array([countGdf(fns, chunk_bytes) for fns in files],
+                      dtype=np.int64)
+    populations['stop'] = np.cumsum(counts)
+    populations['start'] = populations['stop'] - counts
+
+    # second pass: stream the spikes into the memory-mapped arrays
+    senders, times = _openArrays(path, int(counts.sum()))
+    for ii, fns in enumerate(files):
+        position = populations['start'][ii]
+        for senders_chunk, times_chunk in iterGdf(fns, chunk_bytes):
+            stop = position + len(senders_chunk)
+            senders[position:stop] = senders_chunk
+            times[position:stop] = times_chunk
+            position = stop
+        senders.flush()
+        times.flush()
+    del senders, times
+
+    np.save(os.path.join(path, 'populations.npy'), populations)
+    if index:
+        indexSpikeStore(path)
+
+
+def shardPath(path, rank):
+    """Directory of the spike store of one MPI rank within a shard directory.
+
+    Parameters:
+        path            directory of all shards
+        rank            MPI rank
+
+    Returns:
+        path:           directory of the spike store of the rank
+    """
+    return os.path.join(path, 'rank_%04i' % rank)
+
+
+def mergeSpikeStores(path, shard_paths, index=True):
+    """Merge the spike stores of all MPI ranks into one spike store.
+
+    The spikes are copied population by population and shard by shard, such
+    that at most one population of one shard is in memory at a time.
+
+    Parameters:
+        path            directory of the merged spike store
+        shard_paths     directories of the spike stores of all ranks
+        index           index the store afterwards, see indexSpikeStore
+    """
+    shards = [SpikeStore(shard_path) for shard_path in shard_paths]
+    table = shards[0].populations.copy()
+    counts = np.sum([shard.populations['stop'] - shard.populations['start']
+                     for shard in shards], axis=0)
+    table['stop'] = np.cumsum(counts)
+    table['start'] = table['stop'] - counts
+
+    senders, times = _openArrays(path, int(counts.sum()))
+    for ii, name in enumerate(table['name']):
+        position = table['start'][ii]
+        for shard in shards:
+            senders_shard, times_shard = shard.population(name)
+            stop = position + len(senders_shard)
+            senders[position:stop] = senders_shard
+            times[position:stop] = times_shard
+            position = stop
+    senders.flush()
+    times.flush()
+    del senders, times
+
+    np.save(os.path.join(path, 'populations.npy'), table)
+    if index:
+        indexSpikeStore(path)
+
+
+def mergeMemory(shard_paths, chunk_size=2**22):
+    """Peak memory of mergeSpikeStores, predicted from the shard sizes.
+
+    The merge itself copies one population of one shard at a time. Indexing
+    the merged store sorts its largest population in memory (see
+    _sortBySender) and distributes the spikes to time bins in chunks of
+    chunk_size spikes (see _sortByTime), whichever needs more.
+
+    Parameters:
+        shard_paths     directories of the spike stores of all ranks
+        chunk_size      number of spikes processed at once when indexing
+
+    Returns:
+        memory:         peak memory of the arrays in bytes, without the
+                        interpreter
+    """
+    counts, num_neurons = 0, 0
+    for shard_path in shard_paths:
+        populations = np.load(os.path.join(shard_path, 'populations.npy'))
+        counts = counts + (populations['stop'] - populations['start'])
+        if len(populations) > 0:
+            num_neurons = int(populations['max_id'].max() -
+                              populations['min_id'].min() + 1)
+    largest = int(np.max(counts)) if np.size(counts) > 0 else 0
+    spike_bytes = np.dtype(SENDER_DTYPE).itemsize + \
+        np.dtype(TIME_DTYPE).itemsize
+    # sort: copies of senders and times, the sort order and the reordered
+    # copies; bins: the int64 bins, order, positions and their temporaries
+    return max(largest * (2 * spike_bytes + 16),
+               chunk_size * (spike_bytes + 64)) + 24 * num_neurons
+
+
+def _sortBySender(path, populations):
+    """
+    Helper function to sort the spikes of all populations by (sender, time)
+    in place and to create the neuron offset table. Populations are sorted
+    one at a time.
+    """
+    senders = np.load(os.path.join(path, 'senders.npy'), mmap_mode='r+')
+    times = np.load(os.path.join(path, 'times.npy'), mmap_mode='r+')
+    min_gid = populations['min_id'].min() if len(populations) > 0 else 0
+    max_gid = populations['max_id'].max() if len(populations) > 0 else -1
+    neuron_counts = np.zeros(max_gid - min_gid + 1, dtype=np.int64)
+    for pop in populations:
+        senders_pop = np.array(senders[pop['start']:pop['stop']])
+        times_pop = np.array(times[pop['start']:pop['stop']])
+        order = np.lexsort((times_pop, senders_pop))
+        senders[pop['start']:pop['stop']] = senders_pop[order]
+        times[pop['start']:pop['stop']] = times_pop[order]
+        neuron_counts[pop['min_id']-min_gid:pop['max_id']-min_gid+1] = \
+            np.bincount(senders_pop.astype(np.int64) - pop['min_id'],
+                        minlength=pop['max_id'] - pop['min_id'] + 1)
+    senders.flush()
+    times.flush()
+    del senders, times
+
+    np.save(os.path.join(path, 'neuron_offsets.npy'),
+            np.r_[0, np.cumsum(neuron_counts)])
+
+
+def _sortByTime(path, bin_width, chunk_size):
+    """
+    Helper function to create the time-sorted copy of a store by a bucket
+    sort: the spikes are distributed chunk by chunk to time bins of width
+    bin_width, and each bin is sorted on its own afterwards.
+    """
+    senders = np.load(os.path.join(path, 'senders.npy'), mmap_mode='r')
+    times = np.load(os.path.join(path, 'times.npy'), mmap_mode='r')
+    chunks = range(0, len(times), chunk_size)
+
+    # first pass: count the spikes per time bin
+    bin_counts = np.zeros(1, dtype=np.int64)
+    for start in chunks:
+        counts = np.bincount(
+            (times[start:start+chunk_size] // bin_width).astype(np.int64)
+        )
+        bin_counts = np.r_[bin_counts, np.zeros(
+            max(len(counts) - len(bin_counts), 0), dtype=np.int64
+        )]
+        bin_counts[:len(counts)] += counts
+    offsets = np.r_[0, np.cumsum(bin_counts)]
+
+    # second pass: distribute the spikes to their time bins
+    by_time = os.path.join(path, 'by_time')
+    senders_sorted, times_sorted = _openArrays(by_time, len(times))
+    cursors = offsets[:-1].copy()
+    for start in chunks:
+        bins = (times[start:start+chunk_size] // bin_width).astype(np.int64)
+        order = np.argsort(bins, kind='stable')
+        bins_sorted = bins[order]
+        counts = np.bincount(bins_sorted, minlength=len(cursors))
+        first = np.r_[0, np.cumsum(counts)][bins_sorted]
+        positions = cursors[bins_sorted] + np.arange(len(order)) - first
+        senders_sorted[positions] = senders[start:start+chunk_size][order]
+        times_sorted[positions] = times[start:start+chunk_size][order]
+        cursors += counts
+
+    # third pass: sort each time bin
+    for start, stop in zip(offsets[:-1], offsets[1:]):
+        order = np.argsort(times_sorted[start:stop], kind='stable')
+        senders_sorted[start:stop] = senders_sorted[start:stop][order]
+        times_sorted[start:stop] = times_sorted[start:stop][order]
+    senders_sorted.flush()
+    times_sorted.flush()
+    del senders_sorted, times_sorted
+
+    np.save(os.path.join(by_time, 'offsets.npy'), offsets)
+    np.save(os.path.join(by_time, 'time_bins.npy'),
+            bin_width * np.arange(len(offsets)))
+
+
+def indexSpikeStore(path, bin_width=10., chunk_size=2**22):
+    """Sort a spike store by sender and add a time-sorted view.
+
+    Parameters:
+        path            directory of the spike store
+        bin_width       width of the time bins of the time offsets in ms
+        chunk_size      number of spikes processed at once
+    """
+    populations = np.load(os.path.join(path, 'populations.npy'))
+    _sortBySender(path, populations)
+    _sortByTime(path, bin_width, chunk_size)
+
+
+class SpikeStore(object):
+    """Memory-mapped read access to a spike store.
+
+    Parameters:
+        path            directory of the spike store
+
+    Attributes:
+        senders         memory-mapped array of all spike senders
+        times           memory-mapped array of all spike times
+        populations     population table (POPULATION_DTYPE)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.senders = np.load(os.path.join(path, 'senders.npy'),
+                               mmap_mode='r')
+        self.times = np.load(os.path.join(path, 'times.npy'), mmap_mode='r')
+        self.populations = np.load(os.path.join(path, 'populations.npy'))
+        self._index = {name: ii for ii, name in
+                       enumerate(self.populations['name'])}
+        self.indexed = os.path.exists(os.path.join(path, 'by_time'))
+        if self.indexed:
+            self._loadIndex()
+
+    def _loadIndex(self):
+        """
+        Helper function to memory-map the offset tables and the time-sorted
+        view of an indexed store.
+        """
+        by_time = os.path.join(self.path, 'by_time')
+        self.neuron_offsets = np.load(
+            os.path.join(self.path, 'neuron_offsets.npy'), mmap_mode='r'
+        )
+        self.senders_by_time = np.load(
+            os.path.join(by_time, 'senders.npy'), mmap_mode='r'
+        )
+        self.times_by_time = np.load(
+            os.path.join(by_time, 'times.npy'), mmap_mode='r'
+        )
+        self.time_offsets = np.load(os.path.join(by_time, 'offsets.npy'))
+        self.time_bins = np.load(os.path.join(by_time, 'time_bins.npy'))
+
+    def __len__(self):
+        return len(self.populations)
+
+    def __iter__(self):
+        """Iterate over (name, min_id, max_id, senders, times) of all
+        populations."""
+        for pop in self.populations:
+            senders, times = self.population(pop['name'])
+            yield pop['name'], pop['min_id'], pop['max_id'], senders, times
+
+    @property
+    def names(self):
+        """Names of all populations."""
+        return [str(name) for name in self.populations['name']]
+
+    def idRange(self, name):
+        """Smallest and largest id of a population.
+
+        Parameters:
+            name            name of the population
+
+        Returns:
+            min_id, max_id: id range of the population
+        """
+        pop = self.populations[self._index[name]]
+        return pop['min_id'], pop['max_id']
+
+    def population(self, name, t_min=None, t_max=None):
+        """Spikes of one population, optionally within [t_min, t_max).
+
+        Parameters:
+            name            name of the population
+            t_min           start of the time window in ms (optional)
+            t_max           end of the time window in ms (optional)
+
+        Returns:
+            senders, times: memory-mapped views of the spikes of the
+                            population, copies if a time window is given
+        """
+        pop = self.populations[self._index[name]]
+        senders = self.senders[pop['start']:pop['stop']]
+        times = self.times[pop['start']:pop['stop']]
+        if t_min is None and t_max is None:
+            return senders, times
+        window = np.ones(len(times), dtype=bool)
+        if t_min is not None:
+            window &= times >= t_min
+        if t_max is not None:
+            window &= times < t_max
+        return senders[window], times[window]
+
+    def window(self, t_min, t_max):
+        """Spikes of all populations within [t_min, t_max).
+
+        Requires an indexed store; the window is found by binary search in
+        the time-sorted view.
+
+        Parameters:
+            t_min           start of the time window in ms
+            t_max           end of the time window in ms
+
+        Returns:
+            senders, times: memory-mapped views of the spikes, sorted by time
+        """
+        # compare in the precision of the stored times
+        t_min, t_max = TIME_DTYPE(t_min), TIME_DTYPE(t_max)
+
+        # narrow down to the time bins containing the window
+        first_bin = max(np.searchsorted(self.time_bins, t_min, 'right') - 1, 0)
+        last_bin = min(np.searchsorted(self.time_bins, t_max, 'left'),
+                       len(self.time_offsets) - 1)
+        start = self.time_offsets[first_bin]
+        stop = self.time_offsets[last_bin]
+        times = self.times_by_time[start:stop]
+        stop = start + np.searchsorted(times, t_max, 'left')
+        start = start + np.searchsorted(times, t_min, 'left')
+        return self.senders_by_time[start:stop], self.times_by_time[start:stop]
+
+    def neurons(self, min_id, max_id):
+        """Spikes of all neurons with ids in [min_id, max_id].
+
+        Requires an indexed store; the spikes are found with the neuron
+        offset table.
+
+        Parameters:
+            min_id          smallest id
+            max_id          largest id
+
+        Returns:
+            senders, times: memory-mapped views of the spikes, sorted by
+                            (sender, time)
+        """
+        min_gid = self.populations['min_id'].min()
+        first = np.clip(min_id - min_gid, 0, len(self.neuron_offsets) - 1)
+        last = np.clip(max_id - min_gid + 1, 0, len(self.neuron_offsets) - 1)
+        start = self.neuron_offsets[first]
+        stop = self.neuron_offsets[last]
+        return self.senders[start:stop], self.times[start:stop]
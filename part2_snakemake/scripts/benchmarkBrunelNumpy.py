@@ -0,0 +1,177 @@
+"""Benchmark and validate the numpy simulation of the Brunel network.
+
+Usage:
+    benchmarkBrunelNumpy.py [options] <network_file>
+
+Measures the throughput of simulateBrunelNumpy.py in neuron updates per
+second (number of neurons times number of time steps per wall time) for
+several N_scale at g=5, nu_ex=2. Then simulates the regimes of Brunel (2000)
+J Comput Neurosci 8:183, Fig. 8, which uses the parameters of
+brunel_parameters.yaml, and checks the activity of the recorded excitatory
+neurons after the transient:
+
+    regime              g       nu_ex   CV
+    SR                  3.0     2.0     below CV_regular
+    AI                  5.0     2.0     above CV_irregular
+    SI fast             6.0     4.0     above CV_irregular
+    SI slow             4.5     0.9     above CV_irregular
+
+In all regimes the rate has to agree with the stationary rate of
+meanFieldBrunel.py within the relative rate tolerance. Exits with status 1
+if a check fails.
+
+Options:
+    --N_scale=<list>        comma separated N_scale of the throughput
+                            benchmark [default: 0.1,0.2,0.5]
+    --validation_N_scale=<N_scale>  N_scale of the validation [default: 0.2]
+    --simtime=<T>           simulation time in ms [default: 1000.0]
+    --transient=<T>         initial time in ms excluded from the statistics
+                            [default: 200.0]
+    --dt=<dt>               simulation timestep in ms [default: 0.1]
+    --master_seed=<seed>    seed for random numbers [default: 1]
+    --rate_tolerance=<tol>  relative tolerance of the rate [default: 0.2]
+    --CV_regular=<CV>       maximal CV of regular firing [default: 0.2]
+    --CV_irregular=<CV>     minimal CV of irregular firing [default: 0.4]
+    --output=<file>         save results to a yaml file for comparison
+                            across revisions
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+# make the shared cnstools package importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, os.pardir))
+from cnstools.spikeStatistics import calculateSpikeStatistics  # noqa: E402
+from meanFieldBrunel import solveBrunel  # noqa: E402
+from simulateBrunelNumpy import simulateBrunel  # noqa: E402
+
+
+# name, g, nu_ex and whether the firing is regular
+REGIMES = (('SR', 3.0, 2.0, True), ('AI', 5.0, 2.0, False),
+           ('SI fast', 6.0, 4.0, False), ('SI slow', 4.5, 0.9, False))
+
+
+def _scaledConfig(network_config, N_scale, g, nu_ex):
+    """
+    Helper function to scale the neuron numbers and set g and nu_ex.
+    """
+    network_config = dict(network_config, g=g, nu_ex=nu_ex)
+    network_config['NE'] = int(round(N_scale * network_config['NE']))
+    network_config['NI'] = int(round(N_scale * network_config['NI']))
+    return network_config
+
+
+def benchmarkBrunelNumpy(network_config, N_scale, simtime, dt, master_seed):
+    """Time a simulation of the Brunel network in the AI regime.
+
+    Parameters:
+        network_config  keyword arguments for buildBrunel
+        N_scale         scaling factor for neuron number
+        simtime         simulation time in ms
+        dt              simulation timestep in ms
+        master_seed     seed for random numbers
+
+    Returns:
+        result:         dict with the number of neurons, the wall time in s
+                        and the throughput in neuron updates/s
+    """
+    network_config = _scaledConfig(network_config, N_scale, 5.0, 2.0)
+    num_neurons = network_config['NE'] + network_config['NI']
+    start = time.perf_counter()
+    simulateBrunel(simtime, dt, network_config, master_seed)
+    wall_time = time.perf_counter() - start
+    return {
+        'N_scale': N_scale, 'num_neurons': num_neurons,
+        'wall_time': wall_time,
+        'throughput': num_neurons * int(round(simtime / dt)) / wall_time
+    }
+
+
+def validateBrunelNumpy(network_config, N_scale, simtime, transient, dt,
+                        master_seed, rate_tolerance, CV_regular,
+                        CV_irregular):
+    """Compare the simulated regimes of Brunel (2000) to the expectations.
+
+    Parameters:
+        network_config  keyword arguments for buildBrunel
+        N_scale         scaling factor for neuron number
+        simtime         simulation time in ms
+        transient       initial time in ms excluded from the statistics
+        dt              simulation timestep in ms
+        master_seed     seed for random numbers
+        rate_tolerance  relative tolerance of the rate
+        CV_regular      maximal CV of regular firing
+        CV_irregular    minimal CV of irregular firing
+
+    Returns:
+        results:        list of dicts with the regime, the simulated rate
+                        and CV, the mean-field rate and whether the checks
+                        passed
+    """
+    results = []
+    for name, g, nu_ex, regular in REGIMES:
+        (ids_e, times_e), _, _ = simulateBrunel(
+            simtime, dt, _scaledConfig(network_config, N_scale, g, nu_ex),
+            master_seed
+        )
+        stationary = times_e >= transient
+        stats = calculateSpikeStatistics(
+            ids_e[stationary], times_e[stationary], simtime - transient,
+            1, network_config['N_rec']
+        )
+        rate_theory = float(solveBrunel(g, nu_ex, network_config)[0])
+        rate, CV = float(stats['rate_pop']), float(stats['CV_pop'])
+        passed = abs(rate - rate_theory) <= rate_tolerance * rate_theory and \
+            (CV <= CV_regular if regular else CV >= CV_irregular)
+        results.append({'regime': name, 'g': g, 'nu_ex': nu_ex, 'rate': rate,
+                        'rate_theory': rate_theory, 'CV': CV,
+                        'passed': bool(passed)})
+    return results
+
+
+if __name__ == '__main__':
+    import yaml
+    from docopt import docopt
+
+    # parse command line parameters
+    args = docopt(__doc__)
+    with open(args['<network_file>'], 'r') as f:
+        network_config = yaml.load(f, Loader=yaml.FullLoader)
+    simtime, dt = float(args['--simtime']), float(args['--dt'])
+    master_seed = int(args['--master_seed'])
+
+    # throughput
+    benchmark = []
+    for N_scale in args['--N_scale'].split(','):
+        result = benchmarkBrunelNumpy(
+            network_config, float(N_scale), simtime, dt, master_seed
+        )
+        print('%8i neurons: %8.2f s, %.3e neuron updates/s' % (
+            result['num_neurons'], result['wall_time'], result['throughput']
+        ))
+        benchmark.append(result)
+
+    # statistical agreement with the regimes of Brunel (2000)
+    validation = validateBrunelNumpy(
+        network_config, float(args['--validation_N_scale']), simtime,
+        float(args['--transient']), dt, master_seed,
+        float(args['--rate_tolerance']), float(args['--CV_regular']),
+        float(args['--CV_irregular'])
+    )
+    for result in validation:
+        print('%-8s rate %7.2f spks/s (theory %7.2f), CV %.2f: %s' % (
+            result['regime'], result['rate'], result['rate_theory'],
+            result['CV'], 'passed' if result['passed'] else 'FAILED'
+        ))
+
+    # save results
+    if args['--output'] is not None:
+        with open(args['--output'], 'w') as output_file:
+            yaml.dump({'benchmark': benchmark, 'validation': validation},
+                      output_file)
+
+    if not all(result['passed'] for result in validation):
+        sys.exit(1)
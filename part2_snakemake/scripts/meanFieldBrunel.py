@@ -0,0 +1,280 @@
+"""Predict the state of a Brunel network with mean-field theory.
+
+Usage:
+    meanFieldBrunel.py [options] <network_file> <config_file> <tablefile>
+
+Solves the stationary self-consistency equation of the Brunel network
+
+    nu_0 = Phi(mu(nu_0), sigma(nu_0))
+
+for every point of the (g, nu_ex) grid of the Snakemake config file
+<config_file>, where Phi is the Siegert formula for the rate of a leaky
+integrate-and-fire neuron driven by white noise with mean mu and standard
+deviation sigma (Brunel 2000, J Comput Neurosci 8:183). Takes all other
+network parameters from the yaml file <network_file> and saves a table with
+the fields g, nu_ex, rate, mu, sigma, state and simulate to <tablefile>.
+
+Each grid point is classified as
+
+    quiescent           rate below the quiescent rate
+    saturated           rate above the saturated fraction of 1 / t_ref
+    mean_driven         mean input above threshold, regular firing
+    fluctuation_driven  mean input below threshold, irregular firing
+
+Only points at the boundary between two states (and a coarse subgrid of
+every stride-th point in each direction) need to be simulated; these are
+marked in the field simulate.
+
+Prediction options:
+    --quiescent_rate=<r>        rate in spks/s below which a network is
+                                quiescent [default: 0.1]
+    --saturated_fraction=<f>    fraction of the maximal rate 1 / t_ref
+                                above which a network is saturated
+                                [default: 0.5]
+    --stride=<n>                simulate every n-th point in each direction
+                                also away from boundaries, 0 for none
+                                [default: 2]
+"""
+
+import math
+import numpy as np
+
+
+STATES = ('quiescent', 'fluctuation_driven', 'mean_driven', 'saturated')
+
+TABLE_DTYPE = np.dtype([
+    ('g', np.float64), ('nu_ex', np.float64), ('rate', np.float64),
+    ('mu', np.float64), ('sigma', np.float64), ('state', 'U20'),
+    ('simulate', bool)
+])
+
+_erf = np.frompyfunc(math.erf, 1, 1)
+
+
+def _logSiegertIntegrand(u):
+    """
+    Helper function to calculate log(exp(u^2) * (1 + erf(u))) without
+    overflow, using the asymptotic expansion of erfc for u < -5.
+    """
+    u = np.asarray(u, dtype=np.float64)
+    log_f = np.empty_like(u)
+    small = u < -5.
+    x = -u[small]
+    log_f[small] = np.log(
+        (1. - 1. / (2. * x**2) + 3. / (4. * x**4)) / (x * np.sqrt(np.pi))
+    )
+    large = ~small
+    log_f[large] = u[large]**2 + np.log(
+        1. + _erf(u[large]).astype(np.float64)
+    )
+    return log_f
+
+
+def siegertRate(mu, sigma, tau_m, t_ref, V_th, V_reset, num_nodes=100):
+    """Rate of a LIF neuron driven by white noise (Siegert formula).
+
+    The integral is calculated with Gauss-Legendre quadrature in log space,
+    such that it does not overflow far below threshold.
+
+    Parameters:
+        mu              mean input in mV (array)
+        sigma           standard deviation of the input in mV (array)
+        tau_m           membrane time constant in ms
+        t_ref           refractory period in ms
+        V_th            spike threshold in mV
+        V_reset         reset membrane potential in mV
+        num_nodes       number of quadrature nodes
+
+    Returns:
+        rate:           firing rate in spks/s (array)
+    """
+    mu, sigma = np.broadcast_arrays(np.asarray(mu, dtype=np.float64),
+                                    np.asarray(sigma, dtype=np.float64))
+    y_reset = (V_reset - mu) / sigma
+    y_th = (V_th - mu) / sigma
+    # map the nodes from [-1, 1] to [y_reset, y_th]
+    nodes, weights = np.polynomial.legendre.leggauss(num_nodes)
+    half_width = 0.5 * (y_th - y_reset)
+    u = 0.5 * (y_th + y_reset)[..., None] + half_width[..., None] * nodes
+    log_terms = np.log(weights) + _logSiegertIntegrand(u)
+    log_max = log_terms.max(axis=-1)
+    log_integral = np.log(half_width) + log_max + np.log(
+        np.exp(log_terms - log_max[..., None]).sum(axis=-1)
+    )
+    with np.errstate(over='ignore'):
+        return 1e3 / (
+            t_ref + tau_m * np.sqrt(np.pi) * np.exp(log_integral)
+        )
+
+
+def _inputStatistics(rate, g, nu_ex, CE, CI, w, neuron_params):
+    """
+    Helper function to calculate the mean and standard deviation of the
+    input in mV for a given rate in spks/s of all neurons.
+    """
+    tau_m = neuron_params['tau_m']
+    # external input, see simulateBrunelModular._poissonRate
+    nu_th = neuron_params['V_th'] / (w * tau_m)
+    nu_ext = nu_ex * nu_th
+    nu = 1e-3 * rate
+    mu = tau_m * w * (nu_ext + nu * (CE - g * CI))
+    sigma = np.sqrt(tau_m * w**2 * (nu_ext + nu * (CE + g**2 * CI)))
+    return mu, sigma
+
+
+def solveBrunel(g, nu_ex, network_config, num_iterations=60):
+    """Solve the stationary self-consistency equation of a Brunel network.
+
+    The rate is found by bisection on [0, 1 / t_ref], where Phi(nu) - nu
+    changes sign, simultaneously for all parameters.
+
+    Parameters:
+        g               relative inhibitory to excitatory synaptic weight
+                        (array)
+        nu_ex           external rate relative to threshold rate (array)
+        network_config  keyword arguments for buildBrunel, of which CE, CI,
+                        w and neuron_params are used
+        num_iterations  number of bisection steps
+
+    Returns:
+        rate, mu, sigma: stationary rate in spks/s and mean and standard
+                        deviation of the input in mV (arrays)
+    """
+    CE, CI, w, neuron_params = (network_config[key] for key in
+                                ('CE', 'CI', 'w', 'neuron_params'))
+    g, nu_ex = np.broadcast_arrays(np.asarray(g, dtype=np.float64),
+                                   np.asarray(nu_ex, dtype=np.float64))
+    low = np.zeros(g.shape)
+    high = np.full(g.shape, 1e3 / neuron_params['t_ref'])
+    for _ in range(num_iterations):
+        rate = 0.5 * (low + high)
+        mu, sigma = _inputStatistics(rate, g, nu_ex, CE, CI, w, neuron_params)
+        above = siegertRate(
+            mu, sigma, neuron_params['tau_m'], neuron_params['t_ref'],
+            neuron_params['V_th'], neuron_params['V_reset']
+        ) > rate
+        low = np.where(above, rate, low)
+        high = np.where(above, high, rate)
+    rate = 0.5 * (low + high)
+    mu, sigma = _inputStatistics(rate, g, nu_ex, CE, CI, w, neuron_params)
+    return rate, mu, sigma
+
+
+def classifyStates(rate, mu, neuron_params, quiescent_rate=0.1,
+                   saturated_fraction=0.5):
+    """Classify the stationary states, see STATES.
+
+    Parameters:
+        rate                stationary rate in spks/s (array)
+        mu                  mean input in mV (array)
+        neuron_params       parameter dictionary for lif_psc_delta neurons
+        quiescent_rate      rate in spks/s below which a network is
+                            quiescent
+        saturated_fraction  fraction of 1 / t_ref above which a network is
+                            saturated
+
+    Returns:
+        states:             array of the names of the states
+    """
+    states = np.where(mu >= neuron_params['V_th'], 'mean_driven',
+                      'fluctuation_driven').astype('U20')
+    states[rate < quiescent_rate] = 'quiescent'
+    states[rate > saturated_fraction * 1e3 / neuron_params['t_ref']] = \
+        'saturated'
+    return states
+
+
+def boundaryPoints(states, stride=0):
+    """Mark the points of a grid next to a different state.
+
+    Parameters:
+        states          2d array of states on a (g, nu_ex) grid
+        stride          additionally mark every stride-th point in each
+                        direction, 0 for none
+
+    Returns:
+        mask:           2d boolean array, True for points to simulate
+    """
+    mask = np.zeros(states.shape, dtype=bool)
+    for axis in range(2):
+        # views with the current axis first
+        swapped_states = np.swapaxes(states, 0, axis)
+        swapped_mask = np.swapaxes(mask, 0, axis)
+        differs = swapped_states[1:] != swapped_states[:-1]
+        swapped_mask[1:] |= differs
+        swapped_mask[:-1] |= differs
+    if stride > 0:
+        mask[::stride, ::stride] = True
+    return mask
+
+
+def predictPhaseDiagram(G, NU_EX, network_config, quiescent_rate=0.1,
+                        saturated_fraction=0.5, stride=2):
+    """Predict the states on a (g, nu_ex) grid and select points to simulate.
+
+    Parameters:
+        G                   list of g values
+        NU_EX               list of nu_ex values
+        network_config      keyword arguments for buildBrunel
+        quiescent_rate      see classifyStates
+        saturated_fraction  see classifyStates
+        stride              see boundaryPoints
+
+    Returns:
+        table:              structured array with the fields of TABLE_DTYPE
+                            with one row per grid point
+    """
+    g, nu_ex = np.meshgrid(G, NU_EX, indexing='ij')
+    rate, mu, sigma = solveBrunel(g, nu_ex, network_config)
+    states = classifyStates(rate, mu, network_config['neuron_params'],
+                            quiescent_rate, saturated_fraction)
+    simulate = boundaryPoints(states, stride)
+
+    table = np.zeros(g.size, dtype=TABLE_DTYPE)
+    for name, values in (('g', g), ('nu_ex', nu_ex), ('rate', rate),
+                         ('mu', mu), ('sigma', sigma), ('state', states),
+                         ('simulate', simulate)):
+        table[name] = values.ravel()
+    return table
+
+
+def configGrid(config):
+    """Grid of the Snakemake config, as calculated in the Snakefile.
+
+    Parameters:
+        config          dict with the entries g and nu_ex, each with min,
+                        stepsize and steps
+
+    Returns:
+        G, NU_EX:       lists of g and nu_ex values
+    """
+    return [[config[p]['min'] + n*config[p]['stepsize']
+             for n in range(config[p]['steps'])] for p in ('g', 'nu_ex')]
+
+
+if __name__ == '__main__':
+    import yaml
+    from docopt import docopt
+
+    # parse command line parameters
+    args = docopt(__doc__)
+
+    # load network config and grid
+    with open(args['<network_file>'], 'r') as f:
+        network_config = yaml.load(f, Loader=yaml.FullLoader)
+    with open(args['<config_file>'], 'r') as f:
+        G, NU_EX = configGrid(yaml.load(f, Loader=yaml.FullLoader))
+
+    # predict the phase diagram and save the table
+    table = predictPhaseDiagram(
+        G, NU_EX, network_config,
+        quiescent_rate=float(args['--quiescent_rate']),
+        saturated_fraction=float(args['--saturated_fraction']),
+        stride=int(args['--stride'])
+    )
+    np.save(args['<tablefile>'], table)
+    for state in STATES:
+        print('%-20s %5i points' % (state, np.sum(table['state'] == state)))
+    print('%-20s %5i of %i points' % (
+        'to simulate', table['simulate'].sum(), len(table)
+    ))
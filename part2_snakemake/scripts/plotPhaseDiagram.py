@@ -2,10 +2,18 @@
 
 Usage:
     plotPhaseDiagram.py [options] <plotfile> <spikefile>...
+    plotPhaseDiagram.py [options] --table=<tablefile> <plotfile>
 
 Arguments:
     plotfile    Output file for plot.
     spikefile   Input file(s) with spike data.
+    tablefile   Table of CVs produced by reducePhaseDiagram.py or
+                refinePhaseDiagram.py, used instead of spike files. The
+                points of refined tables are plotted with markers of
+                decreasing size for increasing refinement level. For
+                tables of ensembles of trials (reducePhaseDiagram.py
+                --trials) the confidence interval of the mean CV is
+                plotted next to it.
 
 Plotting options:
     --g_min=<g_min>             Minimal g value plotted [default: 1]
@@ -14,11 +22,12 @@ Plotting options:
     --nu_ex_max=<nu_ex_max>     Maximal nu_ex value plotted [default: 4]
     --CV_min=<CV_min>           Minimal CV value in colorscale [default: 0]
     --CV_max=<CV_max>           Maximal CV value in colorscale [default: 1]
+    --CV_ci_max=<CV_ci_max>     Maximal confidence interval in colorscale
+                                [default: 0.2]
     --markersize=<markersize>   Markersize [default: 500]
 """
 
-import os
-import numpy as np
+from reducePhaseDiagram import loadTable, reduceSpikefile
 
 
 def _calculateCV(spikefiles):
@@ -34,26 +43,9 @@ def _calculateCV(spikefiles):
     nu_ex_list = []
     CV_list = []
     for sf in spikefiles:
-        # extract name of the file
-        fn = os.path.splitext(os.path.basename(sf))[0]
-
-        # extract parameters from filename
-        g_list.append(float(fn.split('_')[1]))
-        nu_ex_list.append(float(fn.split('_')[2]))
-
-        # load the spike file
-        ids, times = np.load(sf)
-        ids = ids.astype(np.int)
-
-        # calculate CV for current setting
-        CV = 0.
-        unique_ids = set(ids)
-        if len(unique_ids) > 0:
-            for id in unique_ids:
-                ISIs = np.diff(times[ids == id])
-                if len(ISIs) > 1:
-                    CV += np.std(ISIs) / np.mean(ISIs)
-            CV /= len(unique_ids)
+        g, nu_ex, CV = reduceSpikefile(sf)[:3]
+        g_list.append(g)
+        nu_ex_list.append(nu_ex)
         CV_list.append(CV)
 
     return g_list, nu_ex_list, CV_list
@@ -61,27 +53,49 @@ def _calculateCV(spikefiles):
 
 if __name__ == '__main__':
     from docopt import docopt
+    import numpy as np
     import matplotlib.pyplot as plt
 
     # parse command line parameters
     args = docopt(__doc__)
 
-    # calculate CV for all simulation
-    g_list, nu_ex_list, CV_list = _calculateCV(args['<spikefile>'])
-
-    # make scatter plot, CV indicated by color
-    plt.scatter(
-        g_list, nu_ex_list, c=CV_list, marker='s',
-        s=float(args['--markersize']), vmin=float(args['--CV_min']),
-        vmax=float(args['--CV_max'])
-    )
-    # set axis range and label
-    plt.xlim(float(args['--g_min']), float(args['--g_max']))
-    plt.xlabel('$g$')
-    plt.ylim(float(args['--nu_ex_min']), float(args['--nu_ex_max']))
-    plt.ylabel('$\\nu_{ext}/\\nu_{thr}$')
-    # add colorbar and title
-    plt.colorbar()
-    plt.title('Coefficient of Variation')
+    # read CVs from the reduced table or calculate CV for all simulation
+    markersize = float(args['--markersize'])
+    CV_ci = None
+    if args['--table'] is not None:
+        table = loadTable(args['--table'])
+        if 'level' in table.dtype.names:
+            # every refinement halves the spacing of the points, coarse
+            # points are drawn first such that finer ones stay visible
+            table = table[np.argsort(table['level'], kind='stable')]
+            markersize = markersize / 4.**table['level']
+        g_list, nu_ex_list, CV_list = table['g'], table['nu_ex'], table['CV']
+        if 'CV_ci' in table.dtype.names:
+            CV_ci = table['CV_ci']
+    else:
+        g_list, nu_ex_list, CV_list = _calculateCV(args['<spikefile>'])
+
+    # make scatter plot, CV indicated by color, and for ensembles a second
+    # one of the half width of the confidence interval of the mean CV
+    panels = [(CV_list, 'Coefficient of Variation',
+               float(args['--CV_min']), float(args['--CV_max']))]
+    if CV_ci is not None:
+        panels.append((CV_ci, 'Half width of the 95% CI of the CV', 0.,
+                       float(args['--CV_ci_max'])))
+    fig, axes = plt.subplots(1, len(panels), squeeze=False,
+                             figsize=(6.4 * len(panels), 4.8))
+    for ax, (values, title, vmin, vmax) in zip(axes[0], panels):
+        points = ax.scatter(
+            g_list, nu_ex_list, c=values, marker='s', s=markersize,
+            vmin=vmin, vmax=vmax
+        )
+        # set axis range and label
+        ax.set_xlim(float(args['--g_min']), float(args['--g_max']))
+        ax.set_xlabel('$g$')
+        ax.set_ylim(float(args['--nu_ex_min']), float(args['--nu_ex_max']))
+        ax.set_ylabel('$\\nu_{ext}/\\nu_{thr}$')
+        # add colorbar and title
+        fig.colorbar(points, ax=ax)
+        ax.set_title(title)
 
     plt.savefig(args['<plotfile>'])
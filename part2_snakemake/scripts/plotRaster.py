@@ -0,0 +1,86 @@
+"""Plot the spiking activity of a Brunel network simulation.
+
+Usage:
+    plotRaster.py [options] <spikefile> <rasterfile>
+
+Reads the spikes of the recorded excitatory neurons saved by
+simulateBrunel.py (or its modular and numpy variants) and plots them in
+<rasterfile>. Windows with up to max_markers spikes are plotted as one
+marker per spike; windows with more spikes are binned into an image of
+width x height pixels of spike counts, such that the time and memory of
+the plot depend on the image size instead of the number of spikes.
+
+Plotting options:
+    --raster_tmin=<t_min>   minimal x value t_min plotted [default: 400.0]
+    --raster_tmax=<t_max>   maximal x value t_max plotted [default: 500.0]
+    --max_markers=<n>       maximal number of spikes plotted as markers
+                            [default: 10000]
+    --width=<n>             number of time bins of the image [default: 1000]
+    --height=<n>            maximal number of neuron bins of the image
+                            [default: 500]
+"""
+
+import numpy as np
+
+
+def spikeImage(ids, times, t_min, t_max, width, height):
+    """Bin spikes into an image of spike counts.
+
+    Parameters:
+        ids             spike senders
+        times           spike times in ms
+        t_min           start of the first time bin in ms
+        t_max           end of the last time bin in ms
+        width           number of time bins
+        height          maximal number of neuron bins; each bin spans the
+                        same number of neurons between the smallest and
+                        the largest sender
+
+    Returns:
+        image:          2d array of spike counts (neuron bin x time bin)
+        extent:         (t_min, t_max, min_id - 0.5, max_id + 0.5) of the
+                        image
+    """
+    min_id, max_id = (ids.min(), ids.max()) if len(ids) > 0 else (1, 1)
+    ids_per_bin = -(-(max_id - min_id + 1) // height)
+    height = -(-(max_id - min_id + 1) // ids_per_bin)
+    time_bins = ((times - t_min) * (width / (t_max - t_min))).astype(np.int64)
+    time_bins = np.minimum(time_bins, width - 1)
+    id_bins = (ids - min_id) // ids_per_bin
+    image = np.bincount(id_bins * width + time_bins,
+                        minlength=height * width).reshape(height, width)
+    extent = (t_min, t_max, min_id - 0.5,
+              min_id + height * ids_per_bin - 0.5)
+    return image, extent
+
+
+if __name__ == '__main__':
+    from docopt import docopt
+    import matplotlib.pyplot as plt
+
+    # parse command line parameters
+    args = docopt(__doc__)
+
+    # load spikes, which are sorted by time, and find the plotted window by
+    # binary search
+    ids_e, times_e = np.load(args['<spikefile>'])
+    ids_e = ids_e.astype(np.int64)
+    t_min, t_max = float(args['--raster_tmin']), float(args['--raster_tmax'])
+    window = slice(*np.searchsorted(times_e, [t_min, t_max]))
+    ids_e, times_e = ids_e[window], times_e[window]
+
+    # raster plot of spiking activity, as markers or as an image of counts
+    if len(times_e) <= int(args['--max_markers']):
+        plt.plot(times_e, ids_e, 'o')
+    else:
+        image, extent = spikeImage(
+            ids_e, times_e, t_min, t_max, int(args['--width']),
+            int(args['--height'])
+        )
+        plt.imshow(np.ma.masked_equal(image, 0), aspect='auto',
+                   origin='lower', extent=extent, interpolation='none',
+                   cmap='Greys')
+        plt.colorbar(label='spikes per bin')
+    plt.xlabel('Time (ms)')
+    plt.xlim(t_min, t_max)
+    plt.savefig(args['<rasterfile>'])
@@ -0,0 +1,210 @@
+"""Reduce spike files to a table of CVs for the phase diagram.
+
+Usage:
+    reducePhaseDiagram.py [options] <tablefile> <spikefile>...
+
+Calculates the CV of all standardized input files spikes_{g}_{nu_ex}.npy
+in parallel and saves the results as a table with the fields g, nu_ex and
+CV (plus the file name, size and modification time) to <tablefile>.
+
+With --trials the input files are independent trials
+spikes_{g}_{nu_ex}_{trial}.npy and the table has one row per parameter set
+with the fields g, nu_ex, the mean CV over trials, the half width CV_ci of
+its 95% confidence interval and num_trials (see cnstools/ensemble.py).
+
+Arguments:
+    tablefile   Output file for the table.
+    spikefile   Input file(s) with spike data.
+
+Reduction options:
+    --processes=<n>     number of worker processes, 0 for one per core
+                        [default: 0]
+    --cache=<file>      table of a previous reduction; files whose size and
+                        modification time did not change are not reduced
+                        again and the cache is updated afterwards
+    --trials            reduce the CVs of the trials of each parameter set
+                        to their mean and confidence interval
+    --registry=<file>   SQLite run registry (see cnstools/runRegistry.py) to
+                        add the CV of every registered spike file to
+"""
+
+import os
+import sys
+import numpy as np
+
+# make the shared cnstools package importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, os.pardir))
+from cnstools.ensemble import reduceTrials  # noqa: E402
+from cnstools.runRegistry import RunRegistry  # noqa: E402
+from cnstools.spikeStatistics import calculateSpikeStatistics  # noqa: E402
+
+
+TABLE_DTYPE = np.dtype([
+    ('g', np.float64), ('nu_ex', np.float64), ('CV', np.float64),
+    ('file', 'U128'), ('size', np.int64), ('mtime', np.int64)
+])
+
+
+def _fileKey(spikefile):
+    """
+    Helper function to get the (file, size, mtime) key of a spike file.
+    """
+    stat = os.stat(spikefile)
+    return spikefile, stat.st_size, stat.st_mtime_ns
+
+
+def tableDtype(spikefiles):
+    """Data type of the table of some spike files.
+
+    Like TABLE_DTYPE, but the file field is wide enough for the longest path
+    such that no path is truncated.
+
+    Parameters:
+        spikefiles      list of spikefiles
+
+    Returns:
+        dtype:          structured data type with the fields of TABLE_DTYPE
+    """
+    width = max([TABLE_DTYPE['file'].itemsize // 4] +
+                [len(sf) for sf in spikefiles])
+    return np.dtype([
+        (name, 'U%d' % width if name == 'file' else TABLE_DTYPE[name])
+        for name in TABLE_DTYPE.names
+    ])
+
+
+def parseSpikefile(spikefile):
+    """Extract the parameters from a standardized file name spikes_{g}_{nu_ex}
+
+    The trial of file names spikes_{g}_{nu_ex}_{trial} is ignored.
+
+    Parameters:
+        spikefile       path of the spike file
+
+    Returns:
+        g, nu_ex:       parameters of the simulation
+    """
+    fn = os.path.splitext(os.path.basename(spikefile))[0]
+    return float(fn.split('_')[1]), float(fn.split('_')[2])
+
+
+def reduceSpikefile(spikefile):
+    """Calculate the CV from a standardized input file: spikes_{g}_{nu_ex}.npy
+
+    Parameters:
+        spikefile       path of the spike file
+
+    Returns:
+        row:            tuple (g, nu_ex, CV, file, size, mtime)
+    """
+    # extract parameters from filename
+    g, nu_ex = parseSpikefile(spikefile)
+
+    # load the spike file and calculate the CV averaged over all recorded
+    # neurons that spiked at least once; the statistics sort copies of the
+    # spikes anyway, hence memory-mapping the file would not save memory
+    ids, times = np.load(spikefile)
+    CV = calculateSpikeStatistics(ids, times)['CV_pop']
+
+    return (g, nu_ex, CV) + _fileKey(spikefile)
+
+
+def loadTable(tablefile):
+    """Load a phase diagram table, empty if the file does not exist.
+
+    Parameters:
+        tablefile       path of the table
+
+    Returns:
+        table:          structured array with the fields of TABLE_DTYPE
+    """
+    if not os.path.exists(tablefile):
+        return np.zeros(0, dtype=TABLE_DTYPE)
+    return np.load(tablefile)
+
+
+def saveTable(tablefile, table):
+    """Atomically save a phase diagram table.
+
+    Parameters:
+        tablefile       path of the table
+        table           structured array with the fields of TABLE_DTYPE
+    """
+    tmpfile = tablefile + '.tmp.npy'
+    np.save(tmpfile, table)
+    os.replace(tmpfile, tablefile)
+
+
+def reducePhaseDiagram(spikefiles, processes=None, cachefile=None,
+                       flush_every=64):
+    """Reduce all spike files in parallel, reusing cached results.
+
+    Parameters:
+        spikefiles      list of spikefiles
+        processes       number of worker processes, None for one per core
+        cachefile       path of the table of a previous reduction or None;
+                        it is updated every flush_every reduced files such
+                        that an interrupted reduction can be resumed
+        flush_every     number of reduced files between cache updates
+
+    Returns:
+        table:          structured array with the fields of TABLE_DTYPE
+    """
+    from multiprocessing import Pool
+
+    # reuse rows of files that did not change since the last reduction
+    cached = {}
+    if cachefile is not None:
+        for row in loadTable(cachefile):
+            cached[(row['file'], row['size'], row['mtime'])] = tuple(row)
+    rows = []
+    todo = []
+    for sf in spikefiles:
+        key = _fileKey(sf)
+        if key in cached:
+            rows.append(cached[key])
+        else:
+            todo.append(sf)
+
+    # stream the results of the remaining files from the worker pool
+    dtype = tableDtype(spikefiles)
+    if len(todo) > 0:
+        processes = processes or os.cpu_count()
+        chunksize = max(len(todo) // (4 * processes), 1)
+        with Pool(processes) as pool:
+            results = pool.imap_unordered(
+                reduceSpikefile, todo, chunksize=chunksize
+            )
+            for ii, row in enumerate(results):
+                rows.append(row)
+                if cachefile is not None and (ii + 1) % flush_every == 0:
+                    saveTable(cachefile, np.array(rows, dtype=dtype))
+
+    table = np.sort(np.array(rows, dtype=dtype), order=['g', 'nu_ex'])
+    if cachefile is not None:
+        saveTable(cachefile, table)
+
+    return table
+
+
+if __name__ == '__main__':
+    from docopt import docopt
+
+    # parse command line parameters
+    args = docopt(__doc__)
+
+    # reduce all spike files and save the table
+    table = reducePhaseDiagram(
+        args['<spikefile>'], processes=int(args['--processes']) or None,
+        cachefile=args['--cache']
+    )
+    if args['--registry'] is not None:
+        with RunRegistry(args['--registry']) as registry:
+            for row in table:
+                key = registry.keyOf(row['file'])
+                if key is not None:
+                    registry.addStatistics(key, 'E', {'CV': row['CV']})
+    if args['--trials']:
+        table = reduceTrials(table, ['g', 'nu_ex'], ['CV'])
+    saveTable(args['<tablefile>'], table)
@@ -0,0 +1,238 @@
+"""Calculate the phase diagram of the Brunel network with adaptive refinement.
+
+Usage:
+    refinePhaseDiagram.py [options] <network_file> <tablefile>
+
+Starts with a coarse grid of g_steps x nu_ex_steps points, simulates all of
+them and calculates their CV. Every grid cell whose corners differ by more
+than the threshold in CV is split into four cells, up to the given depth,
+and only the new corners are simulated. Hence, the simulations concentrate
+at the boundaries of the phase diagram. Takes all network parameters from
+the yaml file <network_file> and saves a table with the fields g, nu_ex, CV
+and level (the depth of the refinement at which a point was added) to
+<tablefile>, which can be plotted with plotPhaseDiagram.py --table.
+
+Grid options:
+    --g_min=<g_min>             minimal g [default: 1.0]
+    --g_stepsize=<g_step>       step of g of the coarse grid [default: 2.0]
+    --g_steps=<g_steps>         number of g values of the coarse grid
+                                [default: 4]
+    --nu_ex_min=<nu_ex_min>     minimal nu_ex [default: 0.0]
+    --nu_ex_stepsize=<nu_step>  step of nu_ex of the coarse grid
+                                [default: 1.0]
+    --nu_ex_steps=<nu_steps>    number of nu_ex values of the coarse grid
+                                [default: 5]
+
+Refinement options:
+    --depth=<depth>             maximal number of refinements [default: 2]
+    --threshold=<threshold>     maximal difference in CV within a cell that
+                                is not refined [default: 0.1]
+
+Simulation options:
+    --simtime=<T>               simulation time in ms [default: 500.0]
+    --dt=<dt>                   simulation timestep in ms [default: 0.1]
+    --master_seed=<seed>        master seed for random numbers (NEST default
+                                seeds if not given)
+    --reuse_topology            build the connectivity only once
+
+Network options:
+    --N_scale=<N_scale>         scaling factor for neuron number [default: 0.5]
+
+Registry options:
+    --registry=<file>           SQLite run registry (see
+                                cnstools/runRegistry.py); points with a
+                                finished run in it take its CV instead of
+                                being simulated, all others are registered
+                                with their CV (none if not given); with
+                                --reuse_topology, the points simulated
+                                before on the shared network are part of
+                                the parameters of a run
+"""
+
+import numpy as np
+
+
+REFINED_DTYPE = np.dtype([
+    ('g', np.float64), ('nu_ex', np.float64), ('CV', np.float64),
+    ('level', np.int64)
+])
+
+
+def refinePhaseDiagram(simulate, g_min, g_stepsize, g_steps, nu_ex_min,
+                       nu_ex_stepsize, nu_ex_steps, depth, threshold):
+    """Refine a grid of parameters where the CV changes by the threshold.
+
+    The points are kept on an integer lattice with the spacing of the finest
+    level, such that points shared by neighbouring cells are simulated only
+    once.
+
+    Parameters:
+        simulate            function mapping a list of (g, nu_ex) to a list
+                            of CVs
+        g_min               minimal g
+        g_stepsize          step of g of the coarse grid
+        g_steps             number of g values of the coarse grid
+        nu_ex_min           minimal nu_ex
+        nu_ex_stepsize      step of nu_ex of the coarse grid
+        nu_ex_steps         number of nu_ex values of the coarse grid
+        depth               maximal number of refinements
+        threshold           maximal difference in CV within a cell that is
+                            not refined
+
+    Returns:
+        table:              structured array with the fields of
+                            REFINED_DTYPE, one row per simulated point
+    """
+    scale = 2**depth
+    CVs = {}
+    levels = {}
+
+    def addPoints(points, level):
+        points = [p for p in sorted(set(points)) if p not in CVs]
+        results = simulate([(g_min + i * g_stepsize / scale,
+                             nu_ex_min + j * nu_ex_stepsize / scale)
+                            for i, j in points])
+        for point, CV in zip(points, results):
+            CVs[point] = CV
+            levels[point] = level
+
+    # coarse grid, cells are given by their lower left corner and size
+    size = scale
+    addPoints([(i * size, j * size) for i in range(g_steps)
+               for j in range(nu_ex_steps)], 0)
+    cells = [(i * size, j * size) for i in range(g_steps - 1)
+             for j in range(nu_ex_steps - 1)]
+
+    for level in range(1, depth + 1):
+        # split the cells with a large difference in CV
+        refine = []
+        for i, j in cells:
+            corners = [CVs[(i + di, j + dj)] for di in (0, size)
+                       for dj in (0, size)]
+            if np.nanmax(corners) - np.nanmin(corners) > threshold or \
+                    np.any(np.isnan(corners)):
+                refine.append((i, j))
+        size //= 2
+        cells = [(i + di, j + dj) for i, j in refine for di in (0, size)
+                 for dj in (0, size)]
+        addPoints([(i + di, j + dj) for i, j in cells for di in (0, size)
+                   for dj in (0, size)], level)
+        if len(cells) == 0:
+            break
+
+    return np.array([
+        (g_min + i * g_stepsize / scale,
+         nu_ex_min + j * nu_ex_stepsize / scale, CVs[(i, j)], levels[(i, j)])
+        for i, j in sorted(CVs)
+    ], dtype=REFINED_DTYPE)
+
+
+if __name__ == '__main__':
+    import os
+    import sys
+    from docopt import docopt
+    from reducePhaseDiagram import saveTable
+
+    # make the shared cnstools package importable
+    sys.path.insert(0, os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir
+    ))
+    from cnstools.runRegistry import RunRegistry, runKey
+    from cnstools.spikeStatistics import calculateSpikeStatistics
+    from simulateBrunelModular import buildBrunel, configureKernel, \
+        loadNetworkConfig, runBrunel, runParameters, simulateBrunel, \
+        updateBrunel
+
+    # parse command line parameters
+    args = docopt(__doc__)
+
+    # load network config from network_file
+    network_config = loadNetworkConfig(
+        args['<network_file>'], float(args['--N_scale'])
+    )
+    simtime, dt = float(args['--simtime']), float(args['--dt'])
+    master_seed = args['--master_seed']
+    master_seed = None if master_seed is None else int(master_seed)
+
+    # with --reuse_topology, the network is built once for all levels and
+    # every point continues the points simulated on it before
+    network, previous_points = None, None
+    if args['--reuse_topology']:
+        configureKernel(dt, master_seed)
+        network = buildBrunel(**network_config)
+        previous_points = []
+    registry = None
+    if args['--registry'] is not None:
+        registry = RunRegistry(args['--registry'])
+
+    def registeredCV(key):
+        """
+        Helper function to get the CV of a finished run of the registry from
+        its statistics or, if they are missing, from its spike file; runs
+        registered by this script have statistics but no spike file.
+        """
+        run = registry.finished(key, require_outputs=False)
+        if run is None:
+            return None
+        if 'CV' not in run['statistics'].get('E', {}):
+            if len(run['outputs']) == 0:
+                return None
+            ids_e, times_e = np.load(run['outputs'][0])
+            registry.addStatistics(key, 'E', {
+                'CV': calculateSpikeStatistics(ids_e, times_e)['CV_pop']
+            })
+            run = registry.run(key)
+        return run['statistics']['E']['CV']
+
+    def simulate(points):
+        CVs = []
+        num_simulated = 0
+        for g, nu_ex in points:
+            network_config['g'], network_config['nu_ex'] = g, nu_ex
+
+            # reuse a finished run with the same parameters
+            if registry is not None:
+                parameters = runParameters(simtime, dt, network_config,
+                                           master_seed, previous_points)
+                key = runKey(parameters)
+                CV = registeredCV(key)
+                if CV is not None:
+                    CVs.append(CV)
+                    continue
+
+            if network is not None:
+                pgen, neurons_e, neurons_i, spikes_e, spikes_i = network
+                updateBrunel(
+                    pgen, neurons_e, neurons_i, network_config['w'], g,
+                    network_config['neuron_params'], nu_ex
+                )
+                (ids_e, times_e), _, _ = runBrunel(simtime, spikes_e,
+                                                   spikes_i)
+                previous_points.append((g, nu_ex))
+            else:
+                (ids_e, times_e), _, _ = simulateBrunel(
+                    simtime=simtime, dt=dt, network_config=network_config,
+                    master_seed=master_seed
+                )
+            CVs.append(calculateSpikeStatistics(ids_e, times_e)['CV_pop'])
+            num_simulated += 1
+            if registry is not None:
+                registry.register(key, 'refinePhaseDiagram', parameters)
+                registry.addStatistics(key, 'E', {'CV': CVs[-1]})
+        print('Simulated %i of %i points' % (num_simulated, len(points)))
+        return CVs
+
+    # refine the phase diagram and save the table
+    table = refinePhaseDiagram(
+        simulate,
+        g_min=float(args['--g_min']),
+        g_stepsize=float(args['--g_stepsize']),
+        g_steps=int(args['--g_steps']),
+        nu_ex_min=float(args['--nu_ex_min']),
+        nu_ex_stepsize=float(args['--nu_ex_stepsize']),
+        nu_ex_steps=int(args['--nu_ex_steps']),
+        depth=int(args['--depth']), threshold=float(args['--threshold'])
+    )
+    saveTable(args['<tablefile>'], table)
+    if registry is not None:
+        registry.close()
@@ -1,12 +1,14 @@
 """Simulate a Brunel network.
 
 Usage:
-    simulateBrunel.py [options] <network_file> <spikefile> <rasterfile>
+    simulateBrunel.py [options] <network_file> <spikefile>
 
 Simulates a Brunel network with standard parameters using NEST.
 Takes all network parameters from the yaml file <network_file>.
 Saves the spiking activity of recorded excitatory neurons
-to <spikefile> and plots it in <rasterfile>.
+to <spikefile>, which plotRaster.py can plot. The wall time, peak memory and
+NEST kernel counters of every phase of the script are saved to
+<spikefile without extension>.instrumentation.yaml.
 
 Naive implementation: concatenation of the cells in 2_brunel_network.ipynb
 supplemented by a standardized input and output.
@@ -14,6 +16,8 @@ supplemented by a standardized input and output.
 Simulation options:
     --simtime=<T>           simulation time in ms [default: 500.0]
     --dt=<dt>               simulation timestep in ms [default: 0.1]
+    --master_seed=<seed>    master seed for random numbers (NEST default
+                            seeds if not given)
 
 Network options:
     --g=<g>                 relative inhibitory to excitatory synaptic weight
@@ -22,18 +26,26 @@ Network options:
                             [default: 2.0]
     --N_scale=<N_scale>     scaling factor for neuron number [default: 0.5]
 
-Plotting options:
-    --raster_tmin=<t_min>   minimal x value t_min plotted [default: 400.0]
-    --raster_tmax=<t_max>   maximal x value t_max plotted [default: 500.0]
+Registry options:
+    --registry=<file>       SQLite run registry to register the parameters
+                            and the spike file of the run in (none if not
+                            given), see cnstools/runRegistry.py
 """
 
+import os
+import sys
 import yaml
 from docopt import docopt
 import numpy as np
-import matplotlib.pyplot as plt
 
 import nest
 
+# make the shared cnstools package importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, os.pardir))
+from cnstools.instrumentation import PhaseTimer, sidecarPath  # noqa: E402
+from cnstools.runRegistry import RunRegistry, runKey  # noqa: E402
+
 
 # ========== input ==========
 
@@ -47,6 +59,8 @@ with open(args['<network_file>'], 'r') as network_file:
 # extract simulation parameters from arguments
 simtime = float(args['--simtime'])
 dt = float(args['--dt'])
+master_seed = args['--master_seed']
+master_seed = None if master_seed is None else int(master_seed)
 # extract g and nu_ex from arguments
 g = float(args['--g'])
 nu_ex = float(args['--nu_ex'])
@@ -68,70 +82,98 @@ p_rate = 1e3 * nu_ex * nu_th  # spks/ms -> spks/s
 
 # ========== simulation ==========
 
-# configure kernel
-nest.ResetKernel()
-nest.SetKernelStatus({'resolution': dt, 'print_time': True})
-
-# set default parameters for neurons and create neurons
-nest.SetDefaults('iaf_psc_delta', neuron_params)
-neurons_e = nest.Create('iaf_psc_delta', NE)
-neurons_i = nest.Create('iaf_psc_delta', NI)
-
-# create poisson generator
-pgen = nest.Create('poisson_generator', params={'rate': p_rate})
-
-# create spike detectors
-nest.SetDefaults('spike_detector', {'withtime': True,
-                                    'withgid': True,
-                                    'to_file': False})
-spikes_e = nest.Create('spike_detector')
-spikes_i = nest.Create('spike_detector')
-
-# create excitatory connections
-# synapse specification
-syn_exc = {'delay': d, 'weight': w}
-# connection specification
-conn_exc = {'rule': 'fixed_indegree', 'indegree': CE}
-# connect excitatory neurons
-nest.Connect(neurons_e, neurons_e, conn_exc, syn_exc)
-nest.Connect(neurons_e, neurons_i, conn_exc, syn_exc)
-
-# create inhibitory connections
-# synapse specification
-syn_inh = {'delay': d, 'weight': - g * w}
-# connection specification
-conn_inh = {'rule': 'fixed_indegree', 'indegree': CI}
-# connect inhibitory neurons
-nest.Connect(neurons_i, neurons_e, conn_inh, syn_inh)
-nest.Connect(neurons_i, neurons_i, conn_inh, syn_inh)
-
-# connect poisson generator using the excitatory connection weight
-nest.Connect(pgen, neurons_i, syn_spec=syn_exc)
-nest.Connect(pgen, neurons_e, syn_spec=syn_exc)
-
-# connect N_rec excitatory / inhibitory neurons to spike detector
-nest.Connect(neurons_e[:N_rec], spikes_e)
-nest.Connect(neurons_i[:N_rec], spikes_i)
-
-# simulate
-nest.Simulate(simtime)
-
-# read out spikes from spikedetector
-data_e = nest.GetStatus(spikes_e, 'events')[0]
-ids_e = data_e['senders']
-times_e = data_e['times']
-data_i = nest.GetStatus(spikes_i, 'events')[0]
-ids_i = data_i['senders']
-times_i = data_i['times']
+# record wall time, memory and kernel counters of each phase
+timer = PhaseTimer()
+
+with timer.phase('configure'):
+    # configure kernel
+    nest.ResetKernel()
+    nest.SetKernelStatus({'resolution': dt, 'print_time': True})
+
+    # seed all random number generators
+    if master_seed is not None:
+        N_tp = nest.GetKernelStatus(['total_num_virtual_procs'])[0]
+        nest.SetKernelStatus({
+            'grng_seed': master_seed + N_tp,
+            'rng_seeds': list(range(master_seed+1+N_tp, master_seed+1+2*N_tp))
+        })
+
+with timer.phase('create'):
+    # set default parameters for neurons and create neurons
+    nest.SetDefaults('iaf_psc_delta', neuron_params)
+    neurons_e = nest.Create('iaf_psc_delta', NE)
+    neurons_i = nest.Create('iaf_psc_delta', NI)
+
+    # create poisson generator
+    pgen = nest.Create('poisson_generator', params={'rate': p_rate})
+
+    # create spike detectors
+    nest.SetDefaults('spike_detector', {'withtime': True,
+                                        'withgid': True,
+                                        'to_file': False})
+    spikes_e = nest.Create('spike_detector')
+    spikes_i = nest.Create('spike_detector')
+
+with timer.phase('connect'):
+    # create excitatory connections
+    # synapse specification
+    syn_exc = {'delay': d, 'weight': w}
+    # connection specification
+    conn_exc = {'rule': 'fixed_indegree', 'indegree': CE}
+    # connect excitatory neurons
+    nest.Connect(neurons_e, neurons_e, conn_exc, syn_exc)
+    nest.Connect(neurons_e, neurons_i, conn_exc, syn_exc)
+
+    # create inhibitory connections
+    # synapse specification
+    syn_inh = {'delay': d, 'weight': - g * w}
+    # connection specification
+    conn_inh = {'rule': 'fixed_indegree', 'indegree': CI}
+    # connect inhibitory neurons
+    nest.Connect(neurons_i, neurons_e, conn_inh, syn_inh)
+    nest.Connect(neurons_i, neurons_i, conn_inh, syn_inh)
+
+    # connect poisson generator using the excitatory connection weight
+    nest.Connect(pgen, neurons_i, syn_spec=syn_exc)
+    nest.Connect(pgen, neurons_e, syn_spec=syn_exc)
+
+    # connect N_rec excitatory / inhibitory neurons to spike detector
+    nest.Connect(neurons_e[:N_rec], spikes_e)
+    nest.Connect(neurons_i[:N_rec], spikes_i)
+
+with timer.phase('simulate'):
+    nest.Simulate(simtime)
+
+with timer.phase('readout'):
+    # read out spikes from spikedetector
+    data_e = nest.GetStatus(spikes_e, 'events')[0]
+    ids_e = data_e['senders']
+    times_e = data_e['times']
+    data_i = nest.GetStatus(spikes_i, 'events')[0]
+    ids_i = data_i['senders']
+    times_i = data_i['times']
 
 
 # ========== output ==========
 
-# save spikes
-np.save(args['<spikefile>'], [ids_e, times_e])
-
-# raster plot of spiking activity using matplotlib
-plt.plot(times_e, ids_e, 'o')
-plt.xlabel('Time (ms)')
-plt.xlim(float(args['--raster_tmin']), float(args['--raster_tmax']))
-plt.savefig(args['<rasterfile>'])
+with timer.phase('output'):
+    # sort spikes by time (NEST returns them in order of arrival)
+    order = np.argsort(times_e, kind='stable')
+    ids_e, times_e = ids_e[order], times_e[order]
+
+    # save spikes
+    np.save(args['<spikefile>'], [ids_e, times_e])
+
+# save the instrumentation next to the spikes
+timer.save(sidecarPath(args['<spikefile>']), script='simulateBrunel',
+           parameters={'simtime': simtime, 'dt': dt, 'g': g, 'nu_ex': nu_ex,
+                       'NE': NE, 'NI': NI})
+
+# register the run with the same parameters as simulateBrunelModular.py
+if args['--registry'] is not None:
+    parameters = dict(network_config, NE=NE, NI=NI, g=g, nu_ex=nu_ex,
+                      simtime=simtime, dt=dt, master_seed=master_seed,
+                      backend='nest')
+    with RunRegistry(args['--registry']) as registry:
+        registry.register(runKey(parameters), 'simulateBrunel', parameters,
+                          [args['<spikefile>']])
@@ -1,18 +1,35 @@
 """Simulate a Brunel network.
 
 Usage:
-    simulateBrunel.py [options] <network_file> <spikefile> <rasterfile>
+    simulateBrunel.py [options] <network_file> <spikefile>
 
 Simulates a Brunel network with standard parameters using NEST.
 Takes all network parameters from the yaml file <network_file>.
 Saves the spiking activity of recorded excitatory neurons
-to <spikefile> and plots it in <rasterfile>.
+to <spikefile>, which plotRaster.py can plot. The wall time, peak memory and
+NEST kernel counters of every phase of the script are saved to
+<spikefile without extension>.instrumentation.yaml.
 
 Modular code structure to make it a building block for future use.
 
 Simulation options:
     --simtime=<T>           simulation time in ms [default: 500.0]
     --dt=<dt>               simulation timestep in ms [default: 0.1]
+    --master_seed=<seed>    master seed for random numbers (NEST default
+                            seeds if not given)
+
+Chunking options:
+    --chunk_time=<T>        simulate in chunks of T ms, reading out the spikes
+                            after each chunk (one chunk if not given)
+    --rate_min=<rate>       abort after a chunk with a lower rate of the
+                            recorded neurons in spks/s [default: 0.0]
+    --rate_max=<rate>       abort after a chunk with a higher rate of the
+                            recorded neurons in spks/s, e.g. to stop
+                            saturated networks early [default: inf]
+    --checkpoint_dir=<dir>  save the neuron states and spikes after each
+                            chunk to <dir>; a simulation started again with
+                            the same parameters continues after the last
+                            saved chunk (no checkpoints if not given)
 
 Network options:
     --g=<g>                 relative inhibitory to excitatory synaptic weight
@@ -21,15 +38,62 @@ Network options:
                             [default: 2.0]
     --N_scale=<N_scale>     scaling factor for neuron number [default: 0.5]
 
-Plotting options:
-    --raster_tmin=<t_min>   minimal x value t_min plotted [default: 400.0]
-    --raster_tmax=<t_max>   maximal x value t_max plotted [default: 500.0]
+Dry run options:
+    --dry_run               count the neurons and synapses of the network and
+                            predict the memory and the wall time of the
+                            simulation (see cnstools/resourceModel.py)
+                            instead of building and simulating it
+    --resource_model=<file> coefficients of the resource model fitted to
+                            measured runs (defaults if not given)
+
+Registry options:
+    --registry=<file>       SQLite run registry to register the parameters
+                            and the spike file of the run in (none if not
+                            given), see cnstools/runRegistry.py
 """
 
+import os
+import sys
 import nest
 
+# make the shared cnstools package importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, os.pardir))
+from cnstools.chunkedSimulation import runChunked  # noqa: E402
+from cnstools.instrumentation import PhaseTimer  # noqa: E402
 
-def buildBrunel(N_rec, NE, NI, CE, CI, w, g, d, neuron_params, nu_ex):
+
+def _poissonRate(w, neuron_params, nu_ex):
+    """
+    Helper function to calculate the rate of the Poisson generator in spks/s.
+    """
+    # external rate needed to evoke activity in spks/ms
+    nu_th = neuron_params['V_th'] / (w * neuron_params['tau_m'])
+    return 1e3 * nu_ex * nu_th  # spks/ms -> spks/s
+
+
+def configureKernel(dt, master_seed=None):
+    """Reset and configure the NEST kernel.
+
+    Parameters:
+        dt                  simulation timestep in ms
+        master_seed         master seed for random numbers; the NEST default
+                            seeds are used if None
+    """
+    nest.ResetKernel()
+    nest.SetKernelStatus({'resolution': dt, 'print_time': True})
+
+    # seed all random number generators
+    if master_seed is not None:
+        N_tp = nest.GetKernelStatus(['total_num_virtual_procs'])[0]
+        nest.SetKernelStatus({
+            'grng_seed': master_seed + N_tp,
+            'rng_seeds': list(range(master_seed+1+N_tp, master_seed+1+2*N_tp))
+        })
+
+
+def buildBrunel(N_rec, NE, NI, CE, CI, w, g, d, neuron_params, nu_ex,
+                timer=None):
     """Build a Brunel network in NEST with the given configuration.
 
     Parameters:
@@ -45,122 +109,317 @@ def buildBrunel(N_rec, NE, NI, CE, CI, w, g, d, neuron_params, nu_ex):
         d               synaptic transmission delay in ms
         neuron_params   parameter dictionary for lif_psc_delta neurons
         nu_ex           external rate relative to threshold rate
+        timer           cnstools.instrumentation.PhaseTimer to record the
+                        phases create and connect (optional)
 
     Returns:
         pgen, neurons_e, neurons_i, spikes_e, spikes_i: lists of GIDs
     """
-    # set default parameters for neurons and create neurons
-    nest.SetDefaults('iaf_psc_delta', neuron_params)
-    neurons_e = nest.Create('iaf_psc_delta', NE)
-    neurons_i = nest.Create('iaf_psc_delta', NI)
-
-    # create poisson generator
-    # external rate needed to evoke activity in spks/ms
-    nu_th = neuron_params['V_th'] / (w * neuron_params['tau_m'])
-    p_rate = 1e3 * nu_ex * nu_th  # spks/ms -> spks/s
-    pgen = nest.Create('poisson_generator', params={'rate': p_rate})
-
-    # create spike detectors
-    nest.SetDefaults('spike_detector', {'withtime': True,
-                                        'withgid': True,
-                                        'to_file': False})
-    spikes_e = nest.Create('spike_detector')
-    spikes_i = nest.Create('spike_detector')
-
-    # create excitatory connections
-    # synapse specification
-    syn_exc = {'delay': d, 'weight': w}
-    # connection specification
-    conn_exc = {'rule': 'fixed_indegree', 'indegree': CE}
-    # connect excitatory neurons
-    nest.Connect(neurons_e, neurons_e, conn_exc, syn_exc)
-    nest.Connect(neurons_e, neurons_i, conn_exc, syn_exc)
-
-    # create inhibitory connections
-    # synapse specification
-    syn_inh = {'delay': d, 'weight': - g * w}
-    # connection specification
-    conn_inh = {'rule': 'fixed_indegree', 'indegree': CI}
-    # connect inhibitory neurons
-    nest.Connect(neurons_i, neurons_e, conn_inh, syn_inh)
-    nest.Connect(neurons_i, neurons_i, conn_inh, syn_inh)
-
-    # connect poisson generator using the excitatory connection weight
-    nest.Connect(pgen, neurons_i, syn_spec=syn_exc)
-    nest.Connect(pgen, neurons_e, syn_spec=syn_exc)
-
-    # connect N_rec excitatory / inhibitory neurons to spike detector
-    nest.Connect(neurons_e[:N_rec], spikes_e)
-    nest.Connect(neurons_i[:N_rec], spikes_i)
+    if timer is None:
+        timer = PhaseTimer()
+
+    with timer.phase('create'):
+        # set default parameters for neurons and create neurons
+        nest.SetDefaults('iaf_psc_delta', neuron_params)
+        neurons_e = nest.Create('iaf_psc_delta', NE)
+        neurons_i = nest.Create('iaf_psc_delta', NI)
+
+        # create poisson generator
+        p_rate = _poissonRate(w, neuron_params, nu_ex)
+        pgen = nest.Create('poisson_generator', params={'rate': p_rate})
+
+        # create spike detectors
+        nest.SetDefaults('spike_detector', {'withtime': True,
+                                            'withgid': True,
+                                            'to_file': False})
+        spikes_e = nest.Create('spike_detector')
+        spikes_i = nest.Create('spike_detector')
+
+    with timer.phase('connect'):
+        # create excitatory connections
+        # synapse specification
+        syn_exc = {'delay': d, 'weight': w}
+        # connection specification
+        conn_exc = {'rule': 'fixed_indegree', 'indegree': CE}
+        # connect excitatory neurons
+        nest.Connect(neurons_e, neurons_e, conn_exc, syn_exc)
+        nest.Connect(neurons_e, neurons_i, conn_exc, syn_exc)
+
+        # create inhibitory connections
+        # synapse specification
+        syn_inh = {'delay': d, 'weight': - g * w}
+        # connection specification
+        conn_inh = {'rule': 'fixed_indegree', 'indegree': CI}
+        # connect inhibitory neurons
+        nest.Connect(neurons_i, neurons_e, conn_inh, syn_inh)
+        nest.Connect(neurons_i, neurons_i, conn_inh, syn_inh)
+
+        # connect poisson generator using the excitatory connection weight
+        nest.Connect(pgen, neurons_i, syn_spec=syn_exc)
+        nest.Connect(pgen, neurons_e, syn_spec=syn_exc)
+
+        # connect N_rec excitatory / inhibitory neurons to spike detector
+        nest.Connect(neurons_e[:N_rec], spikes_e)
+        nest.Connect(neurons_i[:N_rec], spikes_i)
 
     return pgen, neurons_e, neurons_i, spikes_e, spikes_i
 
 
-def simulateBrunel(simtime, dt, network_config):
+def updateBrunel(pgen, neurons_e, neurons_i, w, g, neuron_params, nu_ex):
+    """Change g and nu_ex of a Brunel network without changing connectivity.
+
+    Resets the dynamic state of all neurons, sets the weights of all
+    inhibitory connections to - g * w and adapts the rate of the poisson
+    generator such that the network can be simulated again.
+
+    Parameters:
+        pgen            GIDs of the poisson generator
+        neurons_e       GIDs of the excitatory neurons
+        neurons_i       GIDs of the inhibitory neurons
+        w               excitatory synaptic weight in mV
+        g               relative inhibitory to excitatory synaptic weight:
+                        w_I = - g * w_E
+        neuron_params   parameter dictionary for lif_psc_delta neurons
+        nu_ex           external rate relative to threshold rate
+    """
+    # reset membrane potentials, refractoriness and pending input
+    nest.ResetNetwork()
+
+    # rescale all inhibitory weights at once
+    conns_inh = nest.GetConnections(
+        source=neurons_i, target=neurons_e + neurons_i
+    )
+    nest.SetStatus(conns_inh, 'weight', - g * w)
+
+    # adapt the rate of the poisson generator
+    nest.SetStatus(pgen, 'rate', _poissonRate(w, neuron_params, nu_ex))
+
+
+def runBrunel(simtime, spikes_e, spikes_i, **chunking):
+    """Simulate an already built Brunel network and read out its spikes.
+
+    The spike detectors are emptied afterwards, such that the network can be
+    simulated again.
+
+    Parameters:
+        simtime             simulation time in ms
+        spikes_e            GIDs of the excitatory spike detector
+        spikes_i            GIDs of the inhibitory spike detector
+        chunking            chunk_time, num_neurons, rate_bounds, neurons,
+                            checkpoint and timer, see
+                            cnstools.chunkedSimulation
+
+    Returns:
+        (ids_e, times_e), (ids_i, times_i):     array of spike senders / spike
+                                                times of recorded neurons,
+                                                sorted by time and relative to
+                                                the start of the simulation
+        simulated_time:     simulated time in ms, less than simtime if the
+                            simulation was aborted
+    """
+    # simulate and read out spikes from spikedetector after each chunk
+    (spikes_e, spikes_i), simulated_time, _ = runChunked(
+        simtime, [spikes_e, spikes_i], **chunking
+    )
+
+    return spikes_e, spikes_i, simulated_time
+
+
+def loadNetworkConfig(network_file, N_scale):
+    """Load the network config and scale the neuron numbers.
+
+    Parameters:
+        network_file        yaml file with all network parameters
+        N_scale             scaling factor for neuron number
+
+    Returns:
+        network_config:     keyword arguments for buildBrunel
+    """
+    import yaml
+
+    # load network config from network_file
+    with open(network_file, 'r') as f:
+        network_config = yaml.load(f, Loader=yaml.FullLoader)
+    # scale neuron number (making sure it is an integer)
+    network_config['NE'] = int(round(N_scale * network_config['NE']))
+    network_config['NI'] = int(round(N_scale * network_config['NI']))
+
+    return network_config
+
+
+def networkSize(N_rec, NE, NI, CE, CI, **network_config):
+    """Number of nodes and connections of the Brunel network in NEST.
+
+    Parameters:
+        N_rec               number of recorded neurons per population
+        NE                  number of excitatory neurons
+        NI                  number of inhibitory neurons
+        CE                  indegree from excitatory neurons
+        CI                  indegree from inhibitory neurons
+        network_config      remaining keyword arguments for buildBrunel
+
+    Returns:
+        num_nodes:          number of neurons, generator and detectors
+        num_connections:    number of synapses and device connections
+    """
+    num_nodes = NE + NI + 3
+    num_connections = (NE + NI) * (CE + CI + 1) + min(N_rec, NE) + \
+        min(N_rec, NI)
+    return num_nodes, num_connections
+
+
+def runParameters(simtime, dt, network_config, master_seed=None,
+                  previous_points=None):
+    """Full parameter set of a simulation, e.g. for cnstools.runRegistry.
+
+    Parameters:
+        simtime             simulation time in ms
+        dt                  simulation timestep in ms
+        network_config      keyword arguments for buildBrunel
+        master_seed         master seed for random numbers (optional)
+        previous_points     (g, nu_ex) of the points simulated before on the
+                            same network with reuse_topology, whose
+                            connectivity and random number streams the run
+                            continues (None for a freshly built network)
+
+    Returns:
+        parameters:         dict of the network config, simtime, dt,
+                            master_seed and the backend 'nest', plus
+                            reuse_topology and previous_points if given
+    """
+    parameters = dict(network_config, simtime=simtime, dt=dt,
+                      master_seed=master_seed, backend='nest')
+    if previous_points is not None:
+        parameters['reuse_topology'] = True
+        parameters['previous_points'] = [list(point)
+                                         for point in previous_points]
+    return parameters
+
+
+def simulateBrunel(simtime, dt, network_config, master_seed=None,
+                   chunk_time=None, rate_bounds=None, checkpoint=None,
+                   timer=None):
     """Build a Brunel network and simulate it.
 
     Parameters:
         simtime             simulation time in ms
         dt                  simulation timestep in ms
         network_config      keyword arguments for buildBrunel
+        master_seed         master seed for random numbers (optional)
+        chunk_time          simulation time of a chunk in ms (optional)
+        rate_bounds         minimal and maximal rate of the recorded neurons
+                            in spks/s, the simulation is aborted after a
+                            chunk outside of them (optional)
+        checkpoint          cnstools.chunkedSimulation.Checkpoint to resume
+                            from and to update after each chunk (optional)
+        timer               cnstools.instrumentation.PhaseTimer to record
+                            the phases of the simulation (optional)
 
     Returns:
         (ids_e, times_e), (ids_i, times_i):     array of spike senders / spike
                                                 times of recorded neurons
+        simulated_time:     simulated time in ms, less than simtime if the
+                            simulation was aborted
     """
+    if timer is None:
+        timer = PhaseTimer()
+
     # configure kernel
-    nest.ResetKernel()
-    nest.SetKernelStatus({'resolution': dt, 'print_time': True})
+    with timer.phase('configure'):
+        configureKernel(dt, master_seed)
 
     # build the Brunel network
-    _, _, _, spikes_e, spikes_i = buildBrunel(**network_config)
-
-    # simulate
-    nest.Simulate(simtime)
-
-    # read out spikes from spikedetector
-    data_e = nest.GetStatus(spikes_e, 'events')[0]
-    ids_e = data_e['senders']
-    times_e = data_e['times']
-    data_i = nest.GetStatus(spikes_i, 'events')[0]
-    ids_i = data_i['senders']
-    times_i = data_i['times']
+    _, neurons_e, neurons_i, spikes_e, spikes_i = buildBrunel(
+        timer=timer, **network_config
+    )
 
-    return (ids_e, times_e), (ids_i, times_i)
+    # simulate and read out spikes
+    num_recorded = len(neurons_e[:network_config['N_rec']]) + \
+        len(neurons_i[:network_config['N_rec']])
+    return runBrunel(
+        simtime, spikes_e, spikes_i, chunk_time=chunk_time,
+        num_neurons=num_recorded, rate_bounds=rate_bounds,
+        neurons=neurons_e + neurons_i, checkpoint=checkpoint, timer=timer
+    )
 
 
 if __name__ == '__main__':
-    import yaml
     from docopt import docopt
     import numpy as np
-    import matplotlib.pyplot as plt
+    from cnstools.chunkedSimulation import Checkpoint
+    from cnstools.instrumentation import sidecarPath
+    from cnstools.networkCache import hashInputs
+    from cnstools.runRegistry import RunRegistry, runKey
 
     # parse command line parameters
     args = docopt(__doc__)
 
     # load network config from network_file
-    with open(args['<network_file>'], 'r') as network_file:
-        network_config = yaml.load(network_file, Loader=yaml.FullLoader)
+    network_config = loadNetworkConfig(
+        args['<network_file>'], float(args['--N_scale'])
+    )
     # override g and nu_ex
     network_config['g'] = float(args['--g'])
     network_config['nu_ex'] = float(args['--nu_ex'])
-    # scale neuron number (making sure it is an integer)
-    network_config['NE'] *= float(args['--N_scale'])
-    network_config['NE'] = int(round(network_config['NE']))
-    network_config['NI'] *= float(args['--N_scale'])
-    network_config['NI'] = int(round(network_config['NI']))
-
-    # simulate network
-    (ids_e, times_e), _ = simulateBrunel(
-        simtime=float(args['--simtime']), dt=float(args['--dt']),
-        network_config=network_config
+
+    simtime, dt = float(args['--simtime']), float(args['--dt'])
+
+    # predict the resources instead of simulating
+    if args['--dry_run']:
+        from cnstools.resourceModel import ResourceModel, \
+            formatPrediction, jobResources
+
+        num_nodes, num_connections = networkSize(**network_config)
+        model = ResourceModel() if args['--resource_model'] is None else \
+            ResourceModel.load(args['--resource_model'])
+        prediction = model.predict(num_nodes, num_connections, simtime, dt)
+        print(formatPrediction(num_nodes, num_connections, prediction,
+                               jobResources(prediction)))
+        sys.exit(0)
+
+    # simulate network, the checkpoint is only resumed with the same
+    # parameters
+    master_seed = args['--master_seed']
+    master_seed = None if master_seed is None else int(master_seed)
+    checkpoint = None
+    if args['--checkpoint_dir'] is not None:
+        checkpoint = Checkpoint(args['--checkpoint_dir'], key=hashInputs(
+            [], simtime=simtime, dt=dt, master_seed=master_seed,
+            **network_config
+        ))
+    chunk_time = args['--chunk_time']
+    timer = PhaseTimer()
+    (ids_e, times_e), _, simulated_time = simulateBrunel(
+        simtime=simtime, dt=dt, network_config=network_config,
+        master_seed=master_seed,
+        chunk_time=None if chunk_time is None else float(chunk_time),
+        rate_bounds=(float(args['--rate_min']), float(args['--rate_max'])),
+        checkpoint=checkpoint, timer=timer
     )
 
     # save spikes
-    np.save(args['<spikefile>'], [ids_e, times_e])
+    with timer.phase('output'):
+        np.save(args['<spikefile>'], [ids_e, times_e])
+
+    # save the instrumentation next to the spikes, with the simulated time,
+    # which is shorter for aborted runs
+    timer.save(
+        sidecarPath(args['<spikefile>']), script='simulateBrunelModular',
+        parameters=dict(simtime=simtime, dt=dt, simulated_time=simulated_time,
+                        **{key: network_config[key]
+                           for key in ('g', 'nu_ex', 'NE', 'NI')})
+    )
 
-    # raster plot of spiking activity using matplotlib
-    plt.plot(times_e, ids_e, 'o')
-    plt.xlabel('Time (ms)')
-    plt.xlim(float(args['--raster_tmin']), float(args['--raster_tmax']))
-    plt.savefig(args['<rasterfile>'])
+    # the results are saved, the checkpoint is not needed anymore
+    if checkpoint is not None:
+        checkpoint.remove()
+
+    # register the run, unless it was aborted: its spikes cover less than
+    # simtime and must not be reused for a complete run
+    if args['--registry'] is not None and simulated_time < simtime:
+        print('Not registering the run aborted at %g ms' % simulated_time)
+    elif args['--registry'] is not None:
+        parameters = runParameters(simtime, dt, network_config, master_seed)
+        with RunRegistry(args['--registry']) as registry:
+            registry.register(runKey(parameters), 'simulateBrunelModular',
+                              parameters, [args['<spikefile>']])
@@ -0,0 +1,289 @@
+"""Simulate a Brunel network with numpy.
+
+Usage:
+    simulateBrunelNumpy.py [options] <network_file> <spikefile>
+
+Simulates a Brunel network with standard parameters without NEST, e.g. for
+quick runs at small N_scale or where NEST is not installed. Takes all network
+parameters from the yaml file <network_file>. Saves the spiking activity of
+recorded excitatory neurons to <spikefile> in the same format and with the
+same GIDs as simulateBrunel.py, such that plotRaster.py can plot it.
+
+The iaf_psc_delta neurons are updated with the exact propagator of NEST,
+the fixed indegree connectivity is stored as a compressed sparse row matrix
+of the targets of every source, spikes are delivered after the synaptic
+delay through a ring buffer and the independent Poissonian input of every
+neuron is drawn in blocks of time steps. The realizations of connectivity
+and input differ from NEST, hence results agree only statistically; see
+benchmarkBrunelNumpy.py.
+
+Simulation options:
+    --simtime=<T>           simulation time in ms [default: 500.0]
+    --dt=<dt>               simulation timestep in ms [default: 0.1]
+    --master_seed=<seed>    seed for random numbers (drawn at random, printed
+                            and registered if not given)
+
+Network options:
+    --g=<g>                 relative inhibitory to excitatory synaptic weight
+                            (w_I = - g * w_E) [default: 5.0]
+    --nu_ex=<nu_ex>         external rate relative to threshold rate
+                            [default: 2.0]
+    --N_scale=<N_scale>     scaling factor for neuron number [default: 0.5]
+
+Registry options:
+    --registry=<file>       SQLite run registry to register the parameters
+                            and the spike file of the run in (none if not
+                            given), see cnstools/runRegistry.py
+"""
+
+import numpy as np
+
+
+def _poissonRate(w, neuron_params, nu_ex):
+    """
+    Helper function to calculate the rate of the Poisson input in spks/s,
+    see simulateBrunelModular._poissonRate.
+    """
+    # external rate needed to evoke activity in spks/ms
+    nu_th = neuron_params['V_th'] / (w * neuron_params['tau_m'])
+    return 1e3 * nu_ex * nu_th  # spks/ms -> spks/s
+
+
+class BrunelNumpy(object):
+    """Brunel network of iaf_psc_delta neurons simulated with numpy.
+
+    The GIDs are the ones of NEST after nest.ResetKernel(): 1 to NE for the
+    excitatory and NE + 1 to NE + NI for the inhibitory neurons.
+
+    Parameters:
+        N_rec           record from N_rec excitatory and N_rec
+                        inhibitory neurons
+        NE              number of excitatory neurons
+        NI              number of inhibitory neurons
+        CE              indegree from excitatory neurons
+        CI              indegree from inhibitory neurons
+        w               excitatory synaptic weight in mV
+        g               relative inhibitory to excitatory synaptic weight:
+                        w_I = - g * w_E
+        d               synaptic transmission delay in ms
+        neuron_params   parameter dictionary for lif_psc_delta neurons
+        nu_ex           external rate relative to threshold rate
+        dt              simulation timestep in ms
+        rng             numpy RandomState
+        block_steps     number of time steps of the Poissonian input drawn
+                        at once
+    """
+
+    def __init__(self, N_rec, NE, NI, CE, CI, w, g, d, neuron_params, nu_ex,
+                 dt, rng, block_steps=100):
+        self.N_rec, self.NE, self.NI = N_rec, NE, NI
+        self.w, self.dt, self.rng = w, dt, rng
+        self.neuron_params = neuron_params
+        self.block_steps = block_steps
+        N = NE + NI
+
+        # exact integration of the membrane potential relative to E_L
+        E_L = neuron_params['E_L']
+        self.P33 = np.exp(-dt / neuron_params['tau_m'])
+        self.P30 = neuron_params['tau_m'] / neuron_params['C_m'] * \
+            (1. - self.P33)
+        self.I_e = neuron_params['I_e']
+        self.theta = neuron_params['V_th'] - E_L
+        self.V_reset = neuron_params['V_reset'] - E_L
+        self.V_min = neuron_params.get('V_min', -np.inf) - E_L
+        self.refractory_steps = int(round(neuron_params['t_ref'] / dt))
+        self.V = np.full(N, neuron_params['V_m'] - E_L)
+        self.refractory = np.zeros(N, dtype=np.int64)
+
+        # fixed indegree connectivity with autapses and multapses as in
+        # NEST, sorted by source such that the targets of source i are
+        # targets[indptr[i]:indptr[i+1]]
+        sources = np.concatenate((
+            rng.randint(0, NE, size=(N, CE)), rng.randint(NE, N, size=(N, CI))
+        ), axis=1).ravel()
+        order = np.argsort(sources, kind='stable')
+        self.targets = (order // (CE + CI)).astype(np.int32)
+        self.indptr = np.concatenate(
+            ([0], np.cumsum(np.bincount(sources, minlength=N)))
+        )
+
+        # ring buffer of the input of the next delay_steps time steps
+        self.delay_steps = max(int(round(d / dt)), 1)
+        self.ring = np.zeros((self.delay_steps, N))
+        self.step = 0
+        self.update(g, nu_ex)
+
+    def update(self, g, nu_ex):
+        """Change g and nu_ex without changing connectivity or state.
+
+        Parameters:
+            g               relative inhibitory to excitatory synaptic weight
+            nu_ex           external rate relative to threshold rate
+        """
+        self.source_weights = np.where(
+            np.arange(self.NE + self.NI) < self.NE, self.w, -g * self.w
+        )
+        # mean number of input spikes per neuron and time step
+        self.poisson_mean = 1e-3 * self.dt * _poissonRate(
+            self.w, self.neuron_params, nu_ex
+        )
+
+    def _deliver(self, spiking):
+        """
+        Helper function to add the weights of the spikes of the given sources
+        to the slot of the ring buffer of their arrival.
+        """
+        starts = self.indptr[spiking]
+        lengths = self.indptr[spiking + 1] - starts
+        # indices of the targets of all sources, concatenated
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        index = offsets + np.arange(lengths.sum())
+        self.ring[self.step % self.delay_steps] += np.bincount(
+            self.targets[index],
+            weights=np.repeat(self.source_weights[spiking], lengths),
+            minlength=len(self.V)
+        )
+
+    def run(self, simtime):
+        """Simulate and read out the spikes of the recorded neurons.
+
+        Parameters:
+            simtime         simulation time in ms
+
+        Returns:
+            (ids_e, times_e), (ids_i, times_i):     array of spike senders /
+                                                    spike times of recorded
+                                                    neurons, sorted by time
+                                                    and relative to the
+                                                    start of the simulation
+        """
+        num_steps = int(round(simtime / self.dt))
+        t_start = self.step * self.dt
+        recorded = ([], []), ([], [])
+        for n in range(num_steps):
+            if n % self.block_steps == 0:
+                poisson = self.rng.poisson(self.poisson_mean, size=(
+                    min(self.block_steps, num_steps - n), len(self.V)
+                ))
+
+            # input arriving in this step, spikes during the refractory
+            # period are lost
+            slot = self.step % self.delay_steps
+            jumps = self.ring[slot] + self.w * poisson[n % self.block_steps]
+            self.ring[slot] = 0.
+            active = self.refractory == 0
+            np.copyto(self.V, np.maximum(
+                self.P33 * self.V + self.P30 * self.I_e + jumps, self.V_min
+            ), where=active)
+            np.maximum(self.refractory - 1, 0, out=self.refractory)
+
+            # threshold crossings
+            spiking = np.flatnonzero(self.V >= self.theta)
+            self.V[spiking] = self.V_reset
+            self.refractory[spiking] = self.refractory_steps
+            if len(spiking) > 0:
+                t_spike = (self.step + 1) * self.dt - t_start
+                for (ids, times), first in zip(recorded, (0, self.NE)):
+                    rec = spiking[np.searchsorted(spiking, first):
+                                  np.searchsorted(spiking, first + self.N_rec)]
+                    ids.append(rec + 1)
+                    times.append(np.full(len(rec), t_spike))
+                self._deliver(spiking)
+            self.step += 1
+
+        return tuple(
+            (np.concatenate(ids) if ids else np.zeros(0, dtype=np.int64),
+             np.concatenate(times) if times else np.zeros(0))
+            for ids, times in recorded
+        )
+
+
+def buildBrunel(N_rec, NE, NI, CE, CI, w, g, d, neuron_params, nu_ex, dt=0.1,
+                rng=None):
+    """Build a Brunel network with the given configuration.
+
+    Parameters:
+        see simulateBrunelModular.buildBrunel and BrunelNumpy
+
+    Returns:
+        network:        BrunelNumpy
+    """
+    if rng is None:
+        rng = np.random.RandomState()
+    return BrunelNumpy(N_rec, NE, NI, CE, CI, w, g, d, neuron_params, nu_ex,
+                       dt, rng)
+
+
+def simulateBrunel(simtime, dt, network_config, master_seed=None):
+    """Build a Brunel network and simulate it.
+
+    Parameters:
+        simtime             simulation time in ms
+        dt                  simulation timestep in ms
+        network_config      keyword arguments for buildBrunel
+        master_seed         seed for random numbers (optional)
+
+    Returns:
+        (ids_e, times_e), (ids_i, times_i):     array of spike senders / spike
+                                                times of recorded neurons
+        simulated_time:     simulated time in ms, always simtime as the
+                            numpy backend does not abort simulations; the
+                            same return values as
+                            simulateBrunelModular.simulateBrunel
+    """
+    network = buildBrunel(dt=dt, rng=np.random.RandomState(master_seed),
+                          **network_config)
+    spikes_e, spikes_i = network.run(simtime)
+    return spikes_e, spikes_i, simtime
+
+
+if __name__ == '__main__':
+    import yaml
+    from docopt import docopt
+
+    # parse command line parameters
+    args = docopt(__doc__)
+
+    # load network config from network_file
+    with open(args['<network_file>'], 'r') as f:
+        network_config = yaml.load(f, Loader=yaml.FullLoader)
+    # scale neuron number (making sure it is an integer)
+    N_scale = float(args['--N_scale'])
+    network_config['NE'] = int(round(N_scale * network_config['NE']))
+    network_config['NI'] = int(round(N_scale * network_config['NI']))
+    # override g and nu_ex
+    network_config['g'] = float(args['--g'])
+    network_config['nu_ex'] = float(args['--nu_ex'])
+
+    # simulate network
+    simtime, dt = float(args['--simtime']), float(args['--dt'])
+    # draw a seed if none is given, such that the run can be reproduced and
+    # its registry entry does not match other unseeded runs
+    master_seed = args['--master_seed']
+    if master_seed is None:
+        master_seed = int(np.random.randint(2**31 - 1))
+        print('Drawn master seed: %d' % master_seed)
+    else:
+        master_seed = int(master_seed)
+    (ids_e, times_e), _, _ = simulateBrunel(
+        simtime=simtime, dt=dt, network_config=network_config,
+        master_seed=master_seed
+    )
+
+    # save spikes
+    np.save(args['<spikefile>'], [ids_e, times_e])
+
+    # register the run, the backend distinguishes it from NEST runs
+    if args['--registry'] is not None:
+        import os
+        import sys
+        sys.path.insert(0, os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir
+        ))
+        from cnstools.runRegistry import RunRegistry, runKey
+
+        parameters = dict(network_config, simtime=simtime, dt=dt,
+                          master_seed=master_seed, backend='numpy')
+        with RunRegistry(args['--registry']) as registry:
+            registry.register(runKey(parameters), 'simulateBrunelNumpy',
+                              parameters, [args['<spikefile>']])
@@ -0,0 +1,138 @@
+"""Simulate a Brunel network for a batch of parameters.
+
+Usage:
+    sweepBrunel.py [options] <network_file> <spikefile>...
+
+Simulates a Brunel network for every standardized output file
+spikes_{g}_{nu_ex}.npy using the parameters encoded in its name. All
+simulations run back to back in the same process, such that the costs of
+starting the interpreter and importing NEST are paid only once per batch.
+Takes all other network parameters from the yaml file <network_file>.
+
+With --reuse_topology, the network is built and connected only once; for
+each parameter set only the inhibitory weights, the rate of the poisson
+generator and the state of the neurons are updated. Hence, all simulations
+share the same realization of the connectivity.
+
+Simulation options:
+    --simtime=<T>           simulation time in ms [default: 500.0]
+    --dt=<dt>               simulation timestep in ms [default: 0.1]
+    --master_seed=<seed>    master seed for random numbers (NEST default
+                            seeds if not given)
+    --reuse_topology        build the connectivity only once
+
+Network options:
+    --N_scale=<N_scale>     scaling factor for neuron number [default: 0.5]
+
+Registry options:
+    --registry=<file>       SQLite run registry (see cnstools/runRegistry.py);
+                            parameter sets with a finished run in it are
+                            copied from its spike file instead of simulated,
+                            all others are registered (none if not given);
+                            with --reuse_topology, the points simulated
+                            before on the shared network are part of the
+                            parameters of a run
+"""
+
+import os
+import shutil
+
+from reducePhaseDiagram import parseSpikefile
+from simulateBrunelModular import buildBrunel, configureKernel, \
+    loadNetworkConfig, runBrunel, runParameters, simulateBrunel, \
+    updateBrunel
+from cnstools.runRegistry import RunRegistry, runKey
+
+
+def sweepBrunel(simtime, dt, network_config, spikefiles, master_seed=None,
+                reuse_topology=False, registry=None):
+    """Simulate a Brunel network for all parameters of the spike files.
+
+    Parameters:
+        simtime             simulation time in ms
+        dt                  simulation timestep in ms
+        network_config      keyword arguments for buildBrunel
+        spikefiles          list of standardized output files
+                            spikes_{g}_{nu_ex}.npy
+        master_seed         master seed for random numbers (optional)
+        reuse_topology      build the connectivity only once and only update
+                            weights, input rate and state in between
+        registry            cnstools.runRegistry.RunRegistry to reuse finished
+                            runs from and to register new runs in (optional)
+    """
+    import numpy as np
+
+    # points simulated on the shared network, which the next one continues
+    previous_points = None
+    if reuse_topology:
+        configureKernel(dt, master_seed)
+        pgen, neurons_e, neurons_i, spikes_e, spikes_i = buildBrunel(
+            **network_config
+        )
+        previous_points = []
+
+    for sf in spikefiles:
+        # override g and nu_ex
+        network_config['g'], network_config['nu_ex'] = parseSpikefile(sf)
+
+        # reuse a finished run with the same parameters and a spike file,
+        # runs of refinePhaseDiagram.py without one are simulated again
+        if registry is not None:
+            parameters = runParameters(simtime, dt, network_config,
+                                       master_seed, previous_points)
+            key = runKey(parameters)
+            run = registry.finished(key)
+            if run is not None:
+                if os.path.abspath(sf) not in run['outputs']:
+                    shutil.copyfile(run['outputs'][0], sf)
+                    registry.addOutputs(key, [sf])
+                print('Reusing run %s for %s' % (key, sf))
+                continue
+
+        # simulate network
+        if reuse_topology:
+            updateBrunel(
+                pgen, neurons_e, neurons_i, network_config['w'],
+                network_config['g'], network_config['neuron_params'],
+                network_config['nu_ex']
+            )
+            (ids_e, times_e), _, _ = runBrunel(simtime, spikes_e,
+                                               spikes_i)
+            previous_points.append((network_config['g'],
+                                    network_config['nu_ex']))
+        else:
+            (ids_e, times_e), _, _ = simulateBrunel(
+                simtime=simtime, dt=dt, network_config=network_config,
+                master_seed=master_seed
+            )
+
+        # save spikes
+        np.save(sf, [ids_e, times_e])
+        if registry is not None:
+            registry.register(key, 'sweepBrunel', parameters, [sf])
+
+
+if __name__ == '__main__':
+    from docopt import docopt
+
+    # parse command line parameters
+    args = docopt(__doc__)
+
+    # load network config from network_file
+    network_config = loadNetworkConfig(
+        args['<network_file>'], float(args['--N_scale'])
+    )
+
+    # simulate all parameters of the batch
+    master_seed = args['--master_seed']
+    registry = None
+    if args['--registry'] is not None:
+        registry = RunRegistry(args['--registry'])
+    sweepBrunel(
+        simtime=float(args['--simtime']), dt=float(args['--dt']),
+        network_config=network_config, spikefiles=args['<spikefile>'],
+        master_seed=None if master_seed is None else int(master_seed),
+        reuse_topology=args['--reuse_topology'], registry=registry
+    )
+    if registry is not None:
+        registry.close()
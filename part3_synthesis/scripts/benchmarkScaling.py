@@ -0,0 +1,120 @@
+"""Strong-scaling benchmark of the multi-area network simulation.
+
+Usage:
+    benchmarkScaling.py [options] <neuron_parameter_file> <structure_file>
+                                  <neuron_file> <synapse_file> <weight_file>
+                                  <benchmark_file>
+
+Simulates the same multi-area network, given by the output of
+preprocessStructuralData.py, for all combinations of MPI processes and
+threads per process with a local mpirun and collects the network
+construction and simulation times printed by simulateMultiareaNetwork.py.
+The results are saved as a list of dicts to the yaml file <benchmark_file>.
+Run from the part3_synthesis directory, the spikes of the individual runs
+are written to a temporary directory and discarded.
+
+Benchmark options:
+    --procs=<p>             comma separated numbers of MPI processes
+                            [default: 1,2,4]
+    --threads=<t>           comma separated numbers of threads per process
+                            [default: 1,2,4]
+    --mpi_launcher=<cmd>    command to start the MPI processes, {procs} is
+                            replaced by their number
+                            [default: mpirun -n {procs}]
+
+Simulation options passed to simulateMultiareaNetwork.py:
+    --simtime=<T>           simulation time in ms [default: 500.0]
+    --master_seed=<seed>    master seed for random numbers [default: 0]
+    --N_scale=<N_scale>     further scaling factor for neuron number of the
+                            preprocessed data [default: 1.0]
+    --K_scale=<K_scale>     further scaling factor for indegree of the
+                            preprocessed data [default: 1.0]
+"""
+
+import os
+import re
+import shlex
+import subprocess
+import sys
+import tempfile
+
+
+SIMULATE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               'simulateMultiareaNetwork.py')
+
+TIMERS = {
+    'construction_time': re.compile(r'Network construction time: ([\d.]+) s'),
+    'simulation_time': re.compile(r'Simulation time: ([\d.]+) s')
+}
+
+
+def runSimulation(procs, threads, input_files, options, mpi_launcher):
+    """Run simulateMultiareaNetwork.py once and parse its timers.
+
+    Parameters:
+        procs           number of MPI processes
+        threads         number of threads per MPI process
+        input_files     list of the five input files of the simulation
+        options         list of further command line options
+        mpi_launcher    command to start the MPI processes, {procs} is
+                        replaced by their number
+
+    Returns:
+        result:         dict with procs, threads, the total number of virtual
+                        processes and the construction and simulation time
+                        in s
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        command = shlex.split(mpi_launcher.format(procs=procs)) + [
+            sys.executable, SIMULATE_SCRIPT, '--num_threads', str(threads)
+        ] + options + input_files + [
+            os.path.join(tmpdir, 'spikes'),
+            os.path.join(tmpdir, 'simulation_config.yaml')
+        ]
+        output = subprocess.run(
+            command, stdout=subprocess.PIPE, check=True,
+            universal_newlines=True
+        ).stdout
+
+    result = {'procs': procs, 'threads': threads,
+              'virtual_procs': procs * threads}
+    for key, timer in TIMERS.items():
+        result[key] = float(timer.search(output).group(1))
+    return result
+
+
+if __name__ == '__main__':
+    import yaml
+    from docopt import docopt
+
+    # parse command line parameters
+    args = docopt(__doc__)
+    input_files = [args['<neuron_parameter_file>'], args['<structure_file>'],
+                   args['<neuron_file>'], args['<synapse_file>'],
+                   args['<weight_file>']]
+    options = []
+    for option in ('--simtime', '--master_seed', '--N_scale', '--K_scale'):
+        options += [option, args[option]]
+
+    # run all combinations of processes and threads
+    results = []
+    for procs in [int(p) for p in args['--procs'].split(',')]:
+        for threads in [int(t) for t in args['--threads'].split(',')]:
+            result = runSimulation(procs, threads, input_files, options,
+                                   args['--mpi_launcher'])
+            print('%3i procs x %3i threads: construction %8.2f s, '
+                  'simulation %8.2f s' % (
+                      procs, threads, result['construction_time'],
+                      result['simulation_time']
+                  ))
+            results.append(result)
+
+    # speedup relative to the run with the fewest virtual processes
+    reference = min(results, key=lambda r: r['virtual_procs'])
+    for result in results:
+        for key in TIMERS:
+            result[key.replace('time', 'speedup')] = \
+                reference[key] / result[key]
+
+    with open(args['<benchmark_file>'], 'w') as f:
+        yaml.dump(results, f)
@@ -0,0 +1,48 @@
+"""Calculate binned population rates.
+
+Usage:
+    calculateActivity.py [options] <spikes_dir> <simconfig_file>
+                                   <activity_file>
+
+Streams through the spike store <spikes_dir> and saves the population
+averaged rates in spks/s as a (populations x bins) float32 array to
+<activity_file>; row i belongs to the i-th population of the store.
+
+Options:
+    --bin_width=<bin>       bin width in ms [default: 1.0]
+    --chunk_size=<n>        number of spikes processed at once
+                            [default: 4194304]
+"""
+
+
+if __name__ == '__main__':
+    import os
+    import sys
+    import yaml
+    from docopt import docopt
+    import numpy as np
+
+    # make the shared cnstools package importable
+    sys.path.insert(0, os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir
+    ))
+    from cnstools.populationActivity import populationRates
+    from cnstools.spikeStore import SpikeStore
+
+    # parse command line parameters
+    args = docopt(__doc__)
+
+    # load simulation config
+    with open(args['<simconfig_file>'], 'r') as simconf_file:
+        simulation_config = yaml.load(simconf_file, Loader=yaml.FullLoader)
+
+    # calculate binned rates up to the end of the (possibly aborted)
+    # simulation
+    rates = populationRates(
+        SpikeStore(args['<spikes_dir>']),
+        simulation_config.get('simulated_time', simulation_config['simtime']),
+        float(args['--bin_width']), int(args['--chunk_size'])
+    )
+
+    # save rates
+    np.save(args['<activity_file>'], rates)
@@ -0,0 +1,40 @@
+"""Reduce the statistics of independent trials to mean and confidence interval.
+
+Usage:
+    calculateEnsembleStatistics.py <ensemble_file> <statistics_file>...
+
+Reads the population rates and CVs of each trial, as saved by
+calculateStatistics.py, and saves a structured array with the fields
+population, rate, rate_ci, CV, CV_ci and num_trials to <ensemble_file>; rate
+and CV are the means over trials and rate_ci and CV_ci the half widths of
+their 95% confidence intervals (see cnstools/ensemble.py).
+"""
+
+
+if __name__ == '__main__':
+    import os
+    import sys
+    from docopt import docopt
+    import numpy as np
+
+    # make the shared cnstools package importable
+    sys.path.insert(0, os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir
+    ))
+    from cnstools.ensemble import reduceTrials
+
+    # parse command line parameters
+    args = docopt(__doc__)
+
+    # collect the rates and CVs of all trials
+    rows = []
+    for statistics_file in args['<statistics_file>']:
+        for pop, rate, CV in np.load(statistics_file):
+            rows.append((pop, float(rate), float(CV)))
+    table = np.array(rows, dtype=[
+        ('population', 'U64'), ('rate', np.float64), ('CV', np.float64)
+    ])
+
+    # reduce and save
+    np.save(args['<ensemble_file>'],
+            reduceTrials(table, ['population'], ['rate', 'CV']))
@@ -1,42 +1,61 @@
 """Calculate average rate and CV per population.
 
 Usage:
-    calculateStatistics.py <spikes_file> <simconfig_file> <statistics_file>
+    calculateStatistics.py [options] <spikes_dir> <simconfig_file>
+                                     <statistics_file>
 
+Reads the spikes from the spike store <spikes_dir> (see
+cnstools/spikeStore.py).
+
+Options:
+    --registry=<file>   SQLite run registry (see cnstools/runRegistry.py); the
+                        rates and CVs are added to the run that wrote
+                        <simconfig_file>, if it is registered
 """
 
 
 if __name__ == '__main__':
+    import os
+    import sys
     import yaml
     from docopt import docopt
     import numpy as np
 
+    # make the shared cnstools package importable
+    sys.path.insert(0, os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir
+    ))
+    from cnstools.runRegistry import RunRegistry
+    from cnstools.spikeStatistics import calculateSpikeStatistics
+    from cnstools.spikeStore import SpikeStore
+
     # parse command line parameters
     args = docopt(__doc__)
 
-    # load spikes file
-    spikes = np.load(args['<spikes_file>'], allow_pickle=True)
-
     # load simulation config
     with open(args['<simconfig_file>'], 'r') as simconf_file:
         simulation_config = yaml.load(simconf_file, Loader=yaml.FullLoader)
 
+    # aborted simulations stop before simtime
+    simtime = simulation_config.get('simulated_time',
+                                    simulation_config['simtime'])
+
     # calculate rates and CVs
     stats = []
-    simtime = simulation_config['simtime']
-    for pop, min_id, max_id, ids, times in spikes:
-        neurons_pop = max_id - min_id + 1
-
-        rate_pop = 1e3 * len(times) / simtime / neurons_pop
-
-        CV_pop = 0.
-        for id in range(min_id, max_id+1):
-            ISIs = np.diff(times[ids == id])
-            if len(ISIs) > 1:
-                CV_pop += np.std(ISIs) / np.mean(ISIs)
-        CV_pop /= neurons_pop
-
-        stats.append([pop, rate_pop, CV_pop])
+    for pop, min_id, max_id, ids, times in SpikeStore(args['<spikes_dir>']):
+        stats_pop = calculateSpikeStatistics(
+            ids, times, simtime, min_id, max_id
+        )
+        stats.append([pop, stats_pop['rate_pop'], stats_pop['CV_pop']])
 
     # save rates
     np.save(args['<statistics_file>'], stats)
+
+    # add rates and CVs to the registered run
+    if args['--registry'] is not None:
+        with RunRegistry(args['--registry']) as registry:
+            key = registry.keyOf(args['<simconfig_file>'])
+            if key is not None:
+                for pop, rate, CV in stats:
+                    registry.addStatistics(key, pop, {'rate': rate, 'CV': CV})
+                registry.addOutputs(key, [args['<statistics_file>']])
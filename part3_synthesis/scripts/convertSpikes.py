@@ -0,0 +1,39 @@
+"""Convert gdf files of spike detectors into a columnar spike store.
+
+Usage:
+    convertSpikes.py [options] <population_file> <data_path> <spike_store>
+
+Streams the gdf files written by simulateMultiareaNetwork.py with
+--record_to=file into a spike store (see cnstools/spikeStore.py) without
+holding all spikes in memory.
+
+Arguments:
+    population_file     population table saved by simulateMultiareaNetwork.py
+    data_path           directory of the gdf files
+    spike_store         output directory of the spike store
+
+Conversion options:
+    --chunk_bytes=<n>   size of the chunks read at once [default: 16777216]
+"""
+
+
+if __name__ == '__main__':
+    import os
+    import sys
+    from docopt import docopt
+    import numpy as np
+
+    # make the shared cnstools package importable
+    sys.path.insert(0, os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir
+    ))
+    from cnstools.spikeStore import convertGdf
+
+    # parse command line parameters
+    args = docopt(__doc__)
+
+    # convert all gdf files
+    convertGdf(
+        args['<spike_store>'], np.load(args['<population_file>']),
+        args['<data_path>'], chunk_bytes=int(args['--chunk_bytes'])
+    )
@@ -0,0 +1,37 @@
+"""Index a spike store for fast time window and id range queries.
+
+Usage:
+    indexSpikes.py [options] <spikes_dir>
+
+Sorts the spikes in the spike store <spikes_dir> by (sender, time) and adds
+a time-sorted view with offset tables (see cnstools/spikeStore.py). Stores
+written by simulateMultiareaNetwork.py and convertSpikes.py are already
+indexed with the default options.
+
+Indexing options:
+    --bin_width=<bin>       width of the time bins of the time offsets in ms
+                            [default: 10.0]
+    --chunk_size=<n>        number of spikes processed at once
+                            [default: 4194304]
+"""
+
+
+if __name__ == '__main__':
+    import os
+    import sys
+    from docopt import docopt
+
+    # make the shared cnstools package importable
+    sys.path.insert(0, os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir
+    ))
+    from cnstools.spikeStore import indexSpikeStore
+
+    # parse command line parameters
+    args = docopt(__doc__)
+
+    # index the spike store in place
+    indexSpikeStore(
+        args['<spikes_dir>'], bin_width=float(args['--bin_width']),
+        chunk_size=int(args['--chunk_size'])
+    )
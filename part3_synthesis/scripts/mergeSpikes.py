@@ -0,0 +1,31 @@
+"""Merge the spike stores of all MPI ranks.
+
+Usage:
+    mergeSpikes.py <shard_dir> <spikes_dir>
+
+Combines the spike stores <shard_dir>/rank_<rank> written by
+simulateMultiareaNetwork.py with several MPI processes into the indexed
+spike store <spikes_dir>.
+"""
+
+
+if __name__ == '__main__':
+    import glob
+    import os
+    import sys
+    from docopt import docopt
+
+    # make the shared cnstools package importable
+    sys.path.insert(0, os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir
+    ))
+    from cnstools.spikeStore import mergeSpikeStores
+
+    # parse command line parameters
+    args = docopt(__doc__)
+
+    # merge the spike stores of all ranks
+    mergeSpikeStores(
+        args['<spikes_dir>'],
+        sorted(glob.glob(os.path.join(args['<shard_dir>'], 'rank_*')))
+    )
@@ -0,0 +1,140 @@
+"""Downscaling of the multi-area network.
+
+Reducing the number of synapses per neuron (indegree) by a factor K_scale
+changes the input statistics of every neuron. The naive scaling multiplies
+the weights by 1 / K_scale, which keeps the mean input but increases its
+variance by the same factor. Following
+
+    van Albada, Helias, Diesmann (2015) Scalability of asynchronous networks
+    is limited by one-to-one mapping between effective connectivity and
+    correlations. PLoS CB 11(9):e1004490
+
+the weights are instead multiplied by 1 / sqrt(K_scale), which keeps the
+variance of the input, and the missing mean input is provided as a DC
+current per population. The DC current depends on the firing rates of the
+full-scale network, e.g. the rates calculated by calculateStatistics.py for a
+simulation at N_scale = K_scale = 1.
+
+In both cases the number of neurons is multiplied by N_scale and the number
+of synapses by K_scale * N_scale.
+"""
+
+import os
+import sys
+import numpy as np
+
+# make the shared cnstools package importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, os.pardir))
+from cnstools.sparseMatrix import entriesAt, mapEntries, \
+    nonzeroEntries  # noqa: E402
+
+
+SCALING_MODES = ('naive', 'van_albada')
+
+
+def loadRates(rates_file, structure):
+    """Load full-scale firing rates in the order of the populations.
+
+    Parameters:
+        rates_file          statistics file of calculateStatistics.py (rows
+                            population, rate, CV) or npy array of one rate
+                            per population in spks/s
+        structure           names of all populations
+
+    Returns:
+        rates:              array of the rate of each population in spks/s
+    """
+    table = np.load(rates_file)
+    if table.ndim == 1:
+        rates = table.astype(np.float64)
+    else:
+        rate_of = dict(zip(table[:, 0], table[:, 1].astype(np.float64)))
+        missing = [pop for pop in structure if pop not in rate_of]
+        if len(missing) > 0:
+            raise ValueError('No rates of populations %s in %s' % (
+                missing, rates_file
+            ))
+        rates = np.array([rate_of[pop] for pop in structure])
+    if rates.shape != (len(structure),):
+        raise ValueError('Expected %i rates, got shape %s' % (
+            len(structure), rates.shape
+        ))
+    return rates
+
+
+def meanInput(population_sizes, synapses, weights, rates, nu_ext,
+              tau_syn_ex, tau_syn_in):
+    """Mean synaptic input current of each population.
+
+    Parameters:
+        population_sizes    number of neurons
+        synapses            number of synapses, dense array or SparseMatrix
+        weights             average weights in pA, dense array or
+                            SparseMatrix
+        rates               rate of each population in spks/s
+        nu_ext              rate of external (Poissonian) input in spks/s
+        tau_syn_ex          time constant of excitatory currents in ms
+        tau_syn_in          time constant of inhibitory currents in ms
+
+    Returns:
+        mu:                 mean input current of each population in pA
+    """
+    rows, cols, counts = nonzeroEntries(synapses)
+    indegrees = counts / np.maximum(population_sizes[rows], 1)
+    J = entriesAt(weights, rows, cols)
+    tau_syn = np.where(J < 0, tau_syn_in, tau_syn_ex)
+    # the last column holds the external input
+    source_rates = np.append(rates, nu_ext)[cols]
+    mu = np.zeros(len(population_sizes))
+    np.add.at(mu, rows, indegrees * J * tau_syn * 1e-3 * source_rates)
+    return mu
+
+
+def scaleNetwork(population_sizes, synapses, weights, N_scale, K_scale,
+                 mode='naive', rates=None, nu_ext=None, tau_syn_ex=None,
+                 tau_syn_in=None):
+    """Scale the number of neurons and synapses and compensate the weights.
+
+    Parameters:
+        population_sizes    number of neurons
+        synapses            number of synapses, dense array or SparseMatrix
+        weights             average weights in pA, dense array or
+                            SparseMatrix
+        N_scale             scaling factor for neuron number
+        K_scale             scaling factor for indegree
+        mode                'naive' or 'van_albada'
+        rates               full-scale rate of each population in spks/s
+                            (mode='van_albada' only)
+        nu_ext              rate of external (Poissonian) input in spks/s
+                            (mode='van_albada' only)
+        tau_syn_ex          time constant of excitatory currents in ms
+                            (mode='van_albada' only)
+        tau_syn_in          time constant of inhibitory currents in ms
+                            (mode='van_albada' only)
+
+    Returns:
+        population_sizes, synapses, weights: scaled data (not rounded)
+        dc:                 DC current of each population in pA
+    """
+    if mode == 'naive':
+        weight_factor = 1. / K_scale
+        dc = np.zeros(len(population_sizes))
+    elif mode == 'van_albada':
+        if rates is None or nu_ext is None or tau_syn_ex is None or \
+                tau_syn_in is None:
+            raise ValueError('van_albada scaling needs rates, nu_ext, '
+                             'tau_syn_ex and tau_syn_in')
+        weight_factor = 1. / np.sqrt(K_scale)
+        # scaling indegrees by K_scale and weights by 1 / sqrt(K_scale) leaves
+        # a fraction sqrt(K_scale) of the mean input
+        dc = (1. - np.sqrt(K_scale)) * meanInput(
+            population_sizes, synapses, weights, rates, nu_ext, tau_syn_ex,
+            tau_syn_in
+        )
+    else:
+        raise ValueError('Unknown scaling mode: %s' % mode)
+
+    return (N_scale * population_sizes,
+            mapEntries(synapses, lambda s: K_scale * N_scale * s),
+            mapEntries(weights, lambda w: weight_factor * w), dc)
@@ -1,29 +1,53 @@
 """Plot network connectivity.
 
 Usage:
-    plotConnectivity.py <synapse_file> <plot_file>
+    plotConnectivity.py [options] <synapse_file> <plot_file>
 
+The synapse matrix is a dense npy file or a sparse npz file (see
+cnstools/sparseMatrix.py). Matrices with more than max_size populations are
+downsampled by summing the synapses in square blocks of populations, such
+that the plot never has more than max_size x max_size cells. Pairs of
+populations without synapses are left blank.
+
+Options:
+    --max_size=<n>      maximal number of rows and columns of the plotted
+                        matrix [default: 1000]
 """
 
 
 if __name__ == '__main__':
+    import os
+    import sys
     from docopt import docopt
     import numpy as np
     import matplotlib.pyplot as plt
 
+    # make the shared cnstools package importable
+    sys.path.insert(0, os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir
+    ))
+    from cnstools.sparseMatrix import blockSums, loadMatrix
+
     # parse command line parameters
     args = docopt(__doc__)
 
-    # load synapse number
-    synapses = np.load(args['<synapse_file>'])
-    recurrent_synapses = synapses[:, :-1]
+    # load synapse number and sum the recurrent synapses (without the last
+    # column of external synapses) in blocks of populations
+    synapses = loadMatrix(args['<synapse_file>'])
+    num_pops = synapses.shape[0]
+    block_size = -(-num_pops // int(args['--max_size']))
+    recurrent_synapses = blockSums(synapses, block_size, num_cols=num_pops)
 
     # plot connetivity
     plt.imshow(
-        np.log10(recurrent_synapses), aspect='equal',
-        interpolation='none'
+        np.ma.log10(np.ma.masked_equal(recurrent_synapses, 0.)),
+        aspect='equal', interpolation='none'
     )
-    plt.colorbar(label='log10( number of synapses )')
+    if block_size > 1:
+        plt.colorbar(label='log10( number of synapses per block of '
+                           '%i x %i populations )' % (block_size, block_size))
+    else:
+        plt.colorbar(label='log10( number of synapses )')
     plt.title('connectivity matrix')
     plt.xticks([])
     plt.yticks([])
@@ -3,6 +3,11 @@
 Usage:
     plotStatistics.py <statistics_file> <plot_file>
 
+Plots the histograms of the population rates and CVs of <statistics_file>,
+produced by calculateStatistics.py or, for an ensemble of trials, by
+calculateEnsembleStatistics.py. For ensembles the histograms are of the
+means over trials, and the means with their 95% confidence intervals are
+additionally plotted for all populations, ordered by the mean.
 """
 
 
@@ -14,13 +19,21 @@ if __name__ == '__main__':
     # parse command line parameters
     args = docopt(__doc__)
 
-    # load rates and CVs
-    populations, rates, CVs = np.load(args['<statistics_file>']).T
-    rates = rates.astype(np.float)
-    CVs = CVs.astype(np.float)
+    # load rates and CVs, for ensembles with their confidence intervals
+    statistics = np.load(args['<statistics_file>'])
+    ensemble = statistics.dtype.names is not None
+    if ensemble:
+        rates, CVs = statistics['rate'], statistics['CV']
+    else:
+        populations, rates, CVs = statistics.T
+        rates = rates.astype(np.float)
+        CVs = CVs.astype(np.float)
 
     # plot rate and CV distribution
-    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(6, 4))
+    if ensemble:
+        fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(6, 8))
+    else:
+        fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(6, 4))
     ax1.hist(rates, bins='auto', rwidth=0.9)
     ax2.hist(CVs, bins='auto', rwidth=0.9)
     ax1.spines["top"].set_visible(False)
@@ -33,6 +46,21 @@ if __name__ == '__main__':
     ax2.set_title('CV histogram')
     ax1.set_xlabel('$\\nu$ [spks/s]')
     ax2.set_xlabel('$CV$')
+
+    # plot mean and confidence interval of every population
+    if ensemble:
+        for ax, field, label in ((ax3, 'rate', '$\\nu$ [spks/s]'),
+                                 (ax4, 'CV', '$CV$')):
+            order = np.argsort(statistics[field])
+            ax.errorbar(statistics[field][order], np.arange(len(order)),
+                        xerr=statistics[field + '_ci'][order], fmt='.',
+                        markersize=2, elinewidth=0.5)
+            ax.spines["top"].set_visible(False)
+            ax.spines["right"].set_visible(False)
+            ax.set_title('mean of %i trials, 95%% CI' %
+                         statistics['num_trials'].max())
+            ax.set_xlabel(label)
+            ax.set_ylabel('population (ordered)')
     plt.tight_layout()
 
     # save plot
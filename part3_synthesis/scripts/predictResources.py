@@ -0,0 +1,135 @@
+"""Predict the memory and run time of the multi-area network simulation.
+
+Usage:
+    predictResources.py [options] <neuron_file> <synapse_file>
+                                  [<resources_file>]
+
+Counts the neurons and synapses of the network without NEST, predicts the
+memory per MPI process and the wall time of simulateMultiareaNetwork.py with
+the model of cnstools/resourceModel.py and prints them. The resources of a
+cluster job of the simulation (snakemake resources mem_mb, mem_mb_per_cpu
+and runtime in minutes, plus mem_mb_per_process) are saved as yaml to
+<resources_file>, if given. The Snakefile sizes the simulateNetwork jobs the
+same way.
+
+Options:
+    --simtime=<T>           simulation time in ms [default: 500.0]
+    --dt=<dt>               simulation timestep in ms [default: 0.1]
+    --num_procs=<p>         number of MPI processes [default: 1]
+    --num_threads=<t>       number of threads per MPI process [default: 1]
+    --N_scale=<N_scale>     scaling factor for neuron number, 1.0 for the
+                            output of preprocessStructuralData.py
+                            [default: 1.0]
+    --K_scale=<K_scale>     scaling factor for indegree [default: 1.0]
+    --resource_model=<file> coefficients fitted to measured runs with
+                            python -m cnstools.resourceModel (defaults if
+                            not given)
+    --memory_margin=<f>     factor applied to the predicted memory
+                            [default: 1.5]
+    --time_margin=<f>       factor applied to the predicted wall time
+                            [default: 2.0]
+"""
+
+import os
+import sys
+import numpy as np
+
+# make the shared cnstools package importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, os.pardir))
+from cnstools.resourceModel import ResourceModel, formatPrediction, \
+    jobResources  # noqa: E402
+from cnstools.sparseMatrix import loadMatrix, mapEntries, \
+    nonzeroEntries  # noqa: E402
+
+
+def multiareaSize(population_sizes, synapses):
+    """Number of nodes and connections of the multi-area network in NEST.
+
+    Every population has a poisson generator and a spike detector, which are
+    connected to each of its neurons. The last column of the synapse matrix
+    holds the external synapses, which the poisson generator replaces (see
+    buildMultiareaNetwork), so only the recurrent columns are counted.
+
+    Parameters:
+        population_sizes    number of neurons of each population
+        synapses            matrix of the synapse numbers between
+                            populations plus the external column (ndarray or
+                            SparseMatrix)
+
+    Returns:
+        num_nodes:          number of neurons and devices
+        num_connections:    number of synapses and device connections
+    """
+    num_neurons = int(np.sum(population_sizes, dtype=np.int64))
+    _, cols, counts = nonzeroEntries(synapses)
+    num_synapses = int(np.sum(counts[cols < len(population_sizes)],
+                              dtype=np.int64))
+    return num_neurons + 2 * len(population_sizes), \
+        num_synapses + 2 * num_neurons
+
+
+def predictResources(neuron_file, synapse_file, simtime, dt=0.1,
+                     num_procs=1, num_threads=1, N_scale=1., K_scale=1.,
+                     resource_model=None, memory_margin=1.5,
+                     time_margin=2.0):
+    """Predict the resources of a simulation from the structural data.
+
+    Parameters:
+        neuron_file         npy file of the neuron number of each population
+        synapse_file        npy or npz file of the synapse matrix
+        simtime             simulation time in ms
+        dt                  simulation timestep in ms
+        num_procs           number of MPI processes
+        num_threads         number of threads per MPI process
+        N_scale             scaling factor for neuron number
+        K_scale             scaling factor for indegree
+        resource_model      yaml file of the coefficients of the resource
+                            model, the defaults if None
+        memory_margin       factor applied to the predicted memory
+        time_margin         factor applied to the predicted wall time
+
+    Returns:
+        num_nodes:          number of neurons and devices
+        num_connections:    number of synapses and device connections
+        prediction:         see cnstools.resourceModel.ResourceModel.predict
+        resources:          see cnstools.resourceModel.jobResources
+    """
+    # scale as simulateMultiareaNetwork.py does
+    population_sizes = np.rint(N_scale * np.load(neuron_file))
+    synapses = mapEntries(loadMatrix(synapse_file),
+                          lambda synapses: np.rint(K_scale*N_scale*synapses))
+    num_nodes, num_connections = multiareaSize(population_sizes, synapses)
+
+    model = ResourceModel() if resource_model is None else \
+        ResourceModel.load(resource_model)
+    prediction = model.predict(num_nodes, num_connections, simtime, dt,
+                               num_procs, num_threads)
+    resources = jobResources(prediction, num_procs, num_threads,
+                             memory_margin, time_margin)
+    return num_nodes, num_connections, prediction, resources
+
+
+if __name__ == '__main__':
+    import yaml
+    from docopt import docopt
+
+    # parse command line parameters
+    args = docopt(__doc__)
+
+    # predict and print
+    num_nodes, num_connections, prediction, resources = predictResources(
+        args['<neuron_file>'], args['<synapse_file>'],
+        float(args['--simtime']), float(args['--dt']),
+        int(args['--num_procs']), int(args['--num_threads']),
+        float(args['--N_scale']), float(args['--K_scale']),
+        args['--resource_model'], float(args['--memory_margin']),
+        float(args['--time_margin'])
+    )
+    print(formatPrediction(num_nodes, num_connections, prediction, resources))
+
+    # save the resources of the simulateNetwork rule
+    if args['<resources_file>'] is not None:
+        with open(args['<resources_file>'], 'w') as f:
+            yaml.dump({'simulateNetwork': resources}, f,
+                      default_flow_style=False)
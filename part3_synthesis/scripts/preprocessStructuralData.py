@@ -0,0 +1,213 @@
+"""Validate and scale the structural data of the multi-area network.
+
+Usage:
+    preprocessStructuralData.py [options] <structure_file> <neuron_file>
+                                          <synapse_file> <weight_file>
+                                          <output_dir>
+
+Checks that the population names, neuron numbers, synapse numbers and
+weights describe the same populations (see buildMultiareaNetwork), scales
+the number of neurons with N_scale, the number of synapses with
+K_scale * N_scale and compensates the weights (see --scaling). Saves the
+results with compact dtypes (int32 numbers, float32 weights) under the names
+of the input files to <output_dir>, together with the DC current of each
+population in pA as dc_array.npy. The synapse and weight matrices are read
+and written as dense npy or sparse npz files (see cnstools/sparseMatrix.py).
+Files whose content did not change are not written again, such that their
+modification time is kept.
+
+Network options:
+    --N_scale=<N_scale>     scaling factor for neuron number [default: 0.01]
+    --K_scale=<K_scale>     scaling factor for indegree [default: 0.01]
+    --scaling=<mode>        'naive' scales the weights by 1 / K_scale,
+                            'van_albada' scales them by 1 / sqrt(K_scale)
+                            and adds a DC current that keeps the mean input
+                            at the full-scale rates (see networkScaling.py)
+                            [default: naive]
+    --rates=<file>          full-scale rates for 'van_albada', statistics
+                            file of calculateStatistics.py or npy array of
+                            one rate per population in spks/s
+    --nu_ext=<nu_ext>       rate of external (Poissonian) input for
+                            'van_albada', has to match the simulation
+                            [default: 5.0]
+    --neuron_parameters=<file>  neuron parameters for 'van_albada'
+                            [default: neuron_parameters.yaml]
+"""
+
+import os
+import sys
+import numpy as np
+
+# make the shared cnstools package importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, os.pardir))
+from cnstools.sparseMatrix import SparseMatrix, loadMatrix, mapEntries, \
+    nonzeroEntries  # noqa: E402
+from networkScaling import SCALING_MODES, loadRates, scaleNetwork  # noqa: E402
+
+
+COUNT_DTYPE = np.int32
+WEIGHT_DTYPE = np.float32
+
+
+def validateStructuralData(structure, population_sizes, synapses, weights):
+    """Check the invariants buildMultiareaNetwork relies on.
+
+    Parameters:
+        structure           names of all populations
+        population_sizes    number of neurons
+        synapses            number of synapses, dense array or SparseMatrix
+        weights             average weights, dense array or SparseMatrix
+
+    Raises:
+        ValueError if the data are inconsistent
+    """
+    N_pops = len(structure)
+    if structure.ndim != 1 or population_sizes.shape != (N_pops,):
+        raise ValueError('Expected %i neuron numbers, got shape %s' % (
+            N_pops, population_sizes.shape
+        ))
+    for name, matrix in (('synapse', synapses), ('weight', weights)):
+        if tuple(matrix.shape) != (N_pops, N_pops + 1):
+            raise ValueError(
+                'Expected a %s matrix of shape (%i, %i), got shape %s' % (
+                    name, N_pops, N_pops + 1, tuple(matrix.shape)
+                )
+            )
+    if np.any(population_sizes < 0):
+        raise ValueError('Negative neuron numbers')
+    _, _, counts = nonzeroEntries(synapses)
+    if np.any(counts < 0):
+        raise ValueError('Negative synapse numbers')
+    if not np.all(np.isfinite(nonzeroEntries(weights)[2])):
+        raise ValueError('Non-finite weights')
+
+
+def scaleStructuralData(population_sizes, synapses, weights, N_scale,
+                        K_scale, **scaling):
+    """Scale the structural data and convert it to compact dtypes.
+
+    Parameters:
+        population_sizes    number of neurons
+        synapses            number of synapses, dense array or SparseMatrix
+        weights             average weights, dense array or SparseMatrix
+        N_scale             scaling factor for neuron number
+        K_scale             scaling factor for indegree
+        scaling             scaling mode and its parameters, see
+                            networkScaling.scaleNetwork
+
+    Returns:
+        population_sizes, synapses, weights: scaled data
+        dc:                 DC current of each population in pA
+
+    Raises:
+        ValueError if the scaled data do not fit the compact dtypes or if a
+        population with synapses has no neurons left
+    """
+    def toCounts(numbers):
+        numbers = np.round(numbers)
+        if numbers.size > 0 and numbers.max() > np.iinfo(COUNT_DTYPE).max:
+            raise ValueError('Scaled numbers exceed %s' % COUNT_DTYPE.__name__)
+        return numbers.astype(COUNT_DTYPE)
+
+    population_sizes, synapses, weights, dc = scaleNetwork(
+        population_sizes, synapses, weights, N_scale, K_scale, **scaling
+    )
+    population_sizes = toCounts(population_sizes)
+    synapses = mapEntries(synapses, toCounts)
+    weights = mapEntries(weights, lambda w: w.astype(WEIGHT_DTYPE))
+
+    # every population taking part in a connection needs neurons
+    rows, cols, _ = nonzeroEntries(synapses)
+    recurrent = cols < len(population_sizes)
+    empty = np.union1d(rows, cols[recurrent])
+    empty = empty[population_sizes[empty] == 0]
+    if len(empty) > 0:
+        raise ValueError(
+            'Populations %s have synapses but no neurons at N_scale=%g' % (
+                empty.tolist(), N_scale
+            )
+        )
+
+    return population_sizes, synapses, weights, dc.astype(WEIGHT_DTYPE)
+
+
+def saveIfChanged(path, data):
+    """Save an array or matrix unless the file already holds the same data.
+
+    Parameters:
+        path                npy file, or npz file for a SparseMatrix
+        data                array or SparseMatrix
+
+    Returns:
+        changed:            True if the file was written
+    """
+    if os.path.exists(path):
+        old = loadMatrix(path)
+        if isinstance(data, SparseMatrix):
+            same = isinstance(old, SparseMatrix) and all(
+                np.array_equal(getattr(old, name), getattr(data, name)) and
+                getattr(old, name).dtype == getattr(data, name).dtype
+                for name in ('row', 'col', 'data')
+            ) and old.shape == data.shape
+        else:
+            same = isinstance(old, np.ndarray) and \
+                old.dtype == data.dtype and np.array_equal(old, data)
+        if same:
+            return False
+
+    # write atomically, such that an interrupted run leaves no broken file
+    tmp_path = path + '.tmp' + os.path.splitext(path)[1]
+    if isinstance(data, SparseMatrix):
+        data.save(tmp_path)
+    else:
+        np.save(tmp_path, data)
+    os.replace(tmp_path, path)
+    return True
+
+
+if __name__ == '__main__':
+    from docopt import docopt
+
+    # parse command line parameters
+    args = docopt(__doc__)
+
+    # load and validate the structural data
+    structure = np.load(args['<structure_file>'])
+    population_sizes = np.load(args['<neuron_file>'])
+    synapses = loadMatrix(args['<synapse_file>'])
+    weights = loadMatrix(args['<weight_file>'])
+    validateStructuralData(structure, population_sizes, synapses, weights)
+
+    # scale the number of neurons & connections
+    scaling = {'mode': args['--scaling']}
+    if scaling['mode'] not in SCALING_MODES:
+        raise ValueError('Unknown scaling mode: %s' % scaling['mode'])
+    if scaling['mode'] == 'van_albada':
+        import yaml
+        if args['--rates'] is None:
+            raise ValueError('van_albada scaling needs --rates')
+        with open(args['--neuron_parameters'], 'r') as f:
+            neuron_parameters = yaml.load(f, Loader=yaml.FullLoader)
+        scaling.update({
+            'rates': loadRates(args['--rates'], structure),
+            'nu_ext': float(args['--nu_ext']),
+            'tau_syn_ex': neuron_parameters['tau_syn_ex'],
+            'tau_syn_in': neuron_parameters['tau_syn_in']
+        })
+    population_sizes, synapses, weights, dc = scaleStructuralData(
+        population_sizes, synapses, weights,
+        float(args['--N_scale']), float(args['--K_scale']), **scaling
+    )
+
+    # save all files whose content changed
+    os.makedirs(args['<output_dir>'], exist_ok=True)
+    for input_file, data in ((args['<structure_file>'], structure),
+                             (args['<neuron_file>'], population_sizes),
+                             (args['<synapse_file>'], synapses),
+                             (args['<weight_file>'], weights),
+                             ('dc_array.npy', dc)):
+        path = os.path.join(args['<output_dir>'],
+                            os.path.basename(input_file))
+        if saveIfChanged(path, data):
+            print('Updated %s' % path)
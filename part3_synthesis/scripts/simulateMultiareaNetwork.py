@@ -6,6 +6,11 @@ Usage:
                                           <synapse_file> <weight_file>
                                           <spikes_file> <simconfig_file>
 
+The structural data are the output of preprocessStructuralData.py, which
+already scales the network; --N_scale and --K_scale scale it once more
+(naively). The synapse and weight matrices are dense npy files or sparse npz
+files (see cnstools/sparseMatrix.py).
+
 Simulation options:
     --simtime=<T>           simulation time in ms [default: 500.0]
     --dt=<dt>               simulation timestep in ms [default: 0.1]
@@ -15,15 +20,100 @@ Simulation options:
     --V0_std=<V0_std>       standard deviation of initial membrane potential
                             [default: 10.0]
 
+Recording options:
+    --record_to=<backend>   'memory' keeps all spikes in memory and saves
+                            them as a spike store to <spikes_file>, 'file'
+                            lets the spike detectors write gdf files to
+                            <data_path> and saves only the population table
+                            to <spikes_file>; use convertSpikes.py to create
+                            a spike store from it [default: memory]
+                            With more than one MPI process and 'memory',
+                            each rank saves its own spike store to
+                            <spikes_file>/rank_<rank>; use mergeSpikes.py
+                            to combine them
+    --data_path=<path>      directory of the gdf files [default: .]
+
+Chunking options:
+    --chunk_time=<T>        simulate in chunks of T ms, reading out the spikes
+                            after each chunk (one chunk if not given)
+    --rate_min=<rate>       abort after a chunk with a lower mean rate of all
+                            neurons in spks/s (no bound if not given)
+    --rate_max=<rate>       abort after a chunk with a higher mean rate of all
+                            neurons in spks/s (no bound if not given); with
+                            more than one MPI process the rate bounds need
+                            mpi4py
+    --checkpoint_dir=<dir>  save the neuron states and spikes after each
+                            chunk to <dir>; a simulation started again with
+                            the same parameters continues after the last
+                            saved chunk, only with 'memory' (no checkpoints
+                            if not given)
+
 Network options:
     --nu_ext=<nu_ext>       rate of external (Poissonian) input [default: 5.0]
-    --N_scale=<N_scale>     scaling factor for neuron number [default: 0.01]
-    --K_scale=<K_scale>     scaling factor for indegree [default: 0.01]
+    --N_scale=<N_scale>     further scaling factor for neuron number
+                            [default: 1.0]
+    --K_scale=<K_scale>     further scaling factor for indegree
+                            [default: 1.0]
+    --dc_file=<file>        DC current of each population in pA added to
+                            I_e, e.g. dc_array.npy of
+                            preprocessStructuralData.py (none if not given)
+    --connect=<method>      method to create the recurrent connections:
+                            'bulk' draws all connections with numpy and
+                            creates them with one Connect call per target
+                            population, 'fixed_total_number' uses one NEST
+                            Connect call per pair of populations
+                            [default: bulk]
+
+Cache options:
+    --cache_dir=<dir>       directory of a cache of the scaled structural
+                            data and the drawn recurrent synapses, keyed by
+                            the contents of the structural data, the scaling
+                            factors, the master seed, the number of virtual
+                            processes and the connection method; repeated
+                            runs with the same key create the cached
+                            synapses instead of drawing them again (no cache
+                            if not given)
+    --cache_budget=<GB>     disk budget of the cache in GB, the least recently
+                            used entries are removed beyond it [default: 10.0]
+
+Dry run options:
+    --dry_run               count the neurons and synapses of the scaled
+                            network and predict the memory per MPI process
+                            and the wall time of the simulation (see
+                            cnstools/resourceModel.py) instead of building
+                            and simulating it; predictResources.py makes
+                            the same prediction without importing NEST
+    --num_procs=<p>         number of MPI processes assumed by the dry run
+                            [default: 1]
+    --resource_model=<file> coefficients of the resource model fitted to
+                            measured runs (defaults if not given)
+
+Registry options:
+    --registry=<file>       SQLite run registry to register the parameters,
+                            the hash of the inputs and the output files of
+                            the run in (none if not given), see
+                            cnstools/runRegistry.py
 """
 
+import os
+import sys
+import time
 import numpy as np
 import nest
 
+# make the shared cnstools package importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, os.pardir))
+from cnstools.chunkedSimulation import Checkpoint, runChunked  # noqa: E402
+from cnstools.instrumentation import PhaseTimer, sidecarPath  # noqa: E402
+from cnstools.networkCache import NetworkCache, hashInputs  # noqa: E402
+from cnstools.runRegistry import RunRegistry, runKey  # noqa: E402
+from cnstools.sparseMatrix import entriesAt, loadMatrix, mapEntries, \
+    matrixArrays, matrixFromArrays, nonzeroEntries  # noqa: E402
+from cnstools.spikeStore import POPULATION_DTYPE, populationLabel, \
+    saveSpikeStore, shardPath  # noqa: E402
+from predictResources import multiareaSize  # noqa: E402
+
 
 def _round_to_int(arr, dtype=np.int):
     """
@@ -32,21 +122,140 @@ def _round_to_int(arr, dtype=np.int):
     return np.round(arr).astype(dtype)
 
 
+def drawConnections(synapses, source_sizes, target_size, rng):
+    """Draw the connections from several source populations into a target.
+
+    Statistically equivalent to NEST's fixed_total_number rule: sources and
+    targets of the synapses between two populations are drawn uniformly
+    with replacement from the respective populations.
+
+    Parameters:
+        synapses            number of synapses from each source population
+        source_sizes        number of neurons of each source population
+        target_size         number of neurons of the target population
+        rng                 numpy RandomState
+
+    Returns:
+        source_pops, sources, targets: index of the source population and
+                            index of the source and target neuron within
+                            their population of each synapse
+    """
+    source_pops = np.repeat(np.arange(len(synapses)), synapses)
+    sources = np.floor(
+        rng.random_sample(len(source_pops)) * source_sizes[source_pops]
+    ).astype(np.int64)
+    targets = rng.randint(0, target_size, len(source_pops))
+    return source_pops, sources, targets
+
+
+def _connectBulk(neurons, structure, population_sizes, recurrent, rng,
+                 keep_connections=False, chunk_size=10**7):
+    """
+    Helper function to create all recurrent connections with one one_to_one
+    Connect call per target population (or per chunk of about chunk_size
+    synapses for large target populations), iterating only the non-zero
+    entries. Returns the gids of the sources and targets and the weights of
+    all synapses if keep_connections, else None.
+    """
+    target_pops, source_pops, synapses, weights = recurrent
+    first_gids = np.array([neurons[pop][0] for pop in structure])
+    bounds = np.searchsorted(target_pops, np.arange(len(structure) + 1))
+    connections = {'sources': [], 'targets': [], 'weights': []}
+    for ii in np.unique(target_pops):
+        entries = slice(bounds[ii], bounds[ii+1])
+        chunks = np.cumsum(synapses[entries]) // chunk_size
+        for chunk in np.unique(chunks):
+            in_chunk = chunks == chunk
+            pops = source_pops[entries][in_chunk]
+            pop_index, sources, targets = drawConnections(
+                synapses[entries][in_chunk], population_sizes[pops],
+                population_sizes[ii], rng
+            )
+            sources = first_gids[pops][pop_index] + sources
+            targets = first_gids[ii] + targets
+            chunk_weights = weights[entries][in_chunk][pop_index]
+            nest.Connect(
+                sources.tolist(), targets.tolist(), {'rule': 'one_to_one'},
+                {'model': 'static_synapse', 'weight': chunk_weights}
+            )
+            if keep_connections:
+                connections['sources'].append(sources.astype(np.uint32))
+                connections['targets'].append(targets.astype(np.uint32))
+                connections['weights'].append(chunk_weights)
+    if not keep_connections:
+        return None
+    return {name: np.concatenate(arrays) if len(arrays) > 0 else
+            np.zeros(0) for name, arrays in connections.items()}
+
+
+def _connectExplicit(sources, targets, weights, chunk_size=10**7):
+    """
+    Helper function to create the recurrent connections returned by
+    _connectBulk with one one_to_one Connect call per chunk of chunk_size
+    synapses, in the order in which they were drawn.
+    """
+    for start in range(0, len(sources), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        nest.Connect(
+            sources[chunk].tolist(), targets[chunk].tolist(),
+            {'rule': 'one_to_one'},
+            {'model': 'static_synapse', 'weight': np.asarray(weights[chunk])}
+        )
+
+
+def _connectFixedTotalNumber(neurons, structure, recurrent):
+    """
+    Helper function to create all recurrent connections with one
+    fixed_total_number Connect call per non-zero pair of populations.
+    """
+    for ii, jj, synapses, weight in zip(*recurrent):
+        conn_spec = {'rule': 'fixed_total_number', 'N': synapses}
+        syn_spec = {'model': 'static_synapse', 'weight': weight}
+        nest.Connect(
+            neurons[structure[jj]], neurons[structure[ii]], conn_spec, syn_spec
+        )
+
+
 def buildMultiareaNetwork(structure, population_sizes, synapses, weights,
-                          neuron_parameters, nu_ext):
+                          neuron_parameters, nu_ext, connect='bulk',
+                          rng=None, record_to='memory', connections=None,
+                          keep_connections=False, dc_drive=None, timer=None):
     """Build a multi-area network in NEST.
 
     Parameters:
         structure           names of all populations
         population_sizes    number of neurons
-        synapses            number of synapses
-        weights             average weights
+        synapses            number of synapses, dense array or SparseMatrix
+        weights             average weights, dense array or SparseMatrix
         neuron_parameters   neuron parameters
         nu_ext              rate of external Poisson input
+        connect             'bulk' or 'fixed_total_number', see drawConnections
+        rng                 numpy RandomState for connect='bulk'
+        record_to           'memory' or 'file', recording backend of the
+                            spike detectors
+        connections         dict of the arrays sources, targets and weights
+                            of all recurrent synapses of a previous build with
+                            the same parameters; if given, these synapses are
+                            created instead of drawing new ones
+        keep_connections    return the synapses drawn by connect='bulk',
+                            e.g. to cache them; they take about as much
+                            memory as NEST's own connections
+        dc_drive            DC current of each population in pA added to the
+                            I_e of its neurons (optional)
+        timer               cnstools.instrumentation.PhaseTimer to record the
+                            phases create, connect and connect_devices
+                            (optional)
 
     Returns:
         poisson_generators, neurons, spike_detectors: dicts of gid lists
+        connections:        dict of the arrays sources, targets and weights
+                            of all recurrent synapses (None if
+                            connect='fixed_total_number' or not
+                            keep_connections)
     """
+    if timer is None:
+        timer = PhaseTimer()
+
     # assert matching number of populations
     assert np.allclose(structure.shape, population_sizes.shape)
     assert np.allclose(structure.shape, synapses.shape[0])
@@ -54,55 +263,124 @@ def buildMultiareaNetwork(structure, population_sizes, synapses, weights,
     assert np.allclose(structure.shape, weights.shape[0])
     assert np.allclose(structure.shape, weights.shape[1] - 1)
 
-    # separate recurrent from external synapses / weights
-    recurrent_synapses = synapses[:, :-1]
-    external_indegree = _round_to_int(synapses[:, -1] / population_sizes)
-    recurrent_weights = weights[:, :-1]
-    external_weights = weights[:, -1]
-
-    # build all neurons, spike_detectors, and Poisson generators
-    neurons = {}
-    spike_detectors = {}
-    poisson_generators = {}
-    nest.SetDefaults('spike_detector', {
-        'withtime': True, 'withgid': True, 'to_file': False, 'to_memory': True
-    })
-    # NOTE: In an actual simulation, you probably want to dump the
-    #       spiking activity to_file and not to_memory because often
-    #       memory is the main constraint. Here we do it for simplicity.
-    nest.SetDefaults('iaf_psc_exp', neuron_parameters)
-    for ii, pop in enumerate(structure):
-        poisson_generators[pop] = nest.Create('poisson_generator', params={
-            'rate': external_indegree[ii] * nu_ext
+    # separate recurrent from external synapses / weights, keeping only the
+    # non-zero recurrent entries (target, source, synapses, weight); the
+    # preprocessed data have compact dtypes, NEST gets int64 and float64
+    N_pops = len(structure)
+    population_sizes = np.asarray(population_sizes, dtype=np.int64)
+    rows, cols, counts = nonzeroEntries(synapses)
+    counts = counts.astype(np.int64)
+    external = cols == N_pops
+    external_synapses = np.zeros(N_pops, dtype=counts.dtype)
+    external_synapses[rows[external]] = counts[external]
+    external_indegree = _round_to_int(external_synapses / population_sizes)
+    external_weights = entriesAt(
+        weights, np.arange(N_pops), np.full(N_pops, N_pops)
+    ).astype(np.float64)
+    rows, cols, counts = rows[~external], cols[~external], counts[~external]
+    recurrent = (rows, cols, counts,
+                 entriesAt(weights, rows, cols).astype(np.float64))
+
+    with timer.phase('create'):
+        # build all neurons, spike_detectors, and Poisson generators
+        neurons = {}
+        spike_detectors = {}
+        poisson_generators = {}
+        # NOTE: Recording to_memory is simple but often memory is the main
+        #       constraint; recording to_file keeps the memory footprint of the
+        #       simulation independent of the number of spikes.
+        nest.SetDefaults('spike_detector', {
+            'withtime': True, 'withgid': True, 'to_file': record_to == 'file',
+            'to_memory': record_to == 'memory'
         })
-        neurons[pop] = nest.Create('iaf_psc_exp', population_sizes[ii])
-        spike_detectors[pop] = nest.Create('spike_detector')
-
-    # create recurrent connections
-    for ii, targetPop in enumerate(structure):
-        for jj, sourcePop in enumerate(structure):
-            conn_spec = {
-                'rule': 'fixed_total_number', 'N': recurrent_synapses[ii, jj]
-            }
-            syn_spec = {
-                'model': 'static_synapse', 'weight': recurrent_weights[ii, jj]
-            }
-            nest.Connect(
-                neurons[sourcePop], neurons[targetPop], conn_spec, syn_spec
-            )
+        nest.SetDefaults('iaf_psc_exp', neuron_parameters)
+        for ii, pop in enumerate(structure):
+            poisson_generators[pop] = nest.Create('poisson_generator', params={
+                'rate': external_indegree[ii] * nu_ext
+            })
+            neurons[pop] = nest.Create('iaf_psc_exp', population_sizes[ii])
+            if dc_drive is not None and dc_drive[ii] != 0.:
+                nest.SetStatus(neurons[pop], 'I_e', float(
+                    neuron_parameters.get('I_e', 0.) + dc_drive[ii]
+                ))
+            spike_detectors[pop] = nest.Create('spike_detector', params={
+                'label': populationLabel(ii)
+            })
+
+    with timer.phase('connect'):
+        # create recurrent connections
+        if connections is not None:
+            _connectExplicit(connections['sources'], connections['targets'],
+                             connections['weights'])
+        elif connect == 'bulk':
+            connections = _connectBulk(neurons, structure, population_sizes,
+                                       recurrent, rng, keep_connections)
+        elif connect == 'fixed_total_number':
+            _connectFixedTotalNumber(neurons, structure, recurrent)
+        else:
+            raise ValueError('Unknown connection method: %s' % connect)
+
+    with timer.phase('connect_devices'):
+        # connect devices
+        for ii, pop in enumerate(structure):
+            nest.Connect(poisson_generators[pop], neurons[pop], syn_spec={
+                'weight': external_weights[ii]
+            })
+            nest.Connect(neurons[pop], spike_detectors[pop])
+
+    return poisson_generators, neurons, spike_detectors, connections
+
+
+def initializeVoltages(neurons, pyrngs, V0_mean, V0_std):
+    """Draw the initial membrane potentials of all local neurons.
+
+    NEST distributes the neurons round-robin over the virtual processes
+    (vp = gid % N_vp) and the virtual processes round-robin over the MPI
+    processes (rank = vp % N_procs), hence the local neurons and their
+    virtual processes follow from the gid ranges alone. The potentials of the
+    neurons of each virtual process are drawn in one call from pyrngs[vp] in
+    ascending order of their gids and set with a single SetStatus call.
 
-    # connect devices
-    for ii, pop in enumerate(structure):
-        nest.Connect(poisson_generators[pop], neurons[pop], syn_spec={
-            'weight': external_weights[ii]
-        })
-        nest.Connect(neurons[pop], spike_detectors[pop])
+    Parameters:
+        neurons             dict of gid lists of all populations
+        pyrngs              numpy RandomState of each virtual process
+        V0_mean             mean initial membrane potential
+        V0_std              standard deviation of initial membrane potential
+
+    Returns:
+        num_local_nodes:    number of neurons on this MPI process
+    """
+    N_vp = nest.GetKernelStatus('total_num_virtual_procs')
+    gids = np.sort(np.concatenate([
+        np.arange(neurons[pop][0], neurons[pop][-1] + 1) for pop in neurons
+    ]))
+    # group the gids by virtual process keeping their ascending order
+    gids = gids[np.argsort(gids % N_vp, kind='stable')]
+    vp_offsets = np.concatenate(([0], np.cumsum(np.bincount(
+        gids % N_vp, minlength=N_vp
+    ))))
+
+    local_gids = []
+    local_voltages = []
+    for vp in range(nest.Rank(), N_vp, nest.NumProcesses()):
+        vp_gids = gids[vp_offsets[vp]:vp_offsets[vp+1]]
+        local_gids.append(vp_gids)
+        local_voltages.append(
+            pyrngs[vp].normal(V0_mean, V0_std, len(vp_gids))
+        )
+    local_gids = np.concatenate(local_gids)
+    nest.SetStatus(local_gids.tolist(), 'V_m',
+                   np.concatenate(local_voltages).tolist())
 
-    return poisson_generators, neurons, spike_detectors
+    return len(local_gids)
 
 
 def simulateMultiareaNetwork(simtime, dt, master_seed, num_threads,
-                             V0_mean, V0_std, network_config):
+                             V0_mean, V0_std, network_config,
+                             record_to='memory', data_path='.',
+                             connections=None, keep_connections=False,
+                             chunk_time=None, rate_bounds=None,
+                             checkpoint=None, timer=None):
     """Build a multi-area network and simulate it.
 
     Parameters:
@@ -113,62 +391,104 @@ def simulateMultiareaNetwork(simtime, dt, master_seed, num_threads,
         V0_mean             mean initial membrane potential
         V0_std              standard deviation of initial membrane potential
         network_config      keyword arguments for buildBrunel
+        record_to           'memory' or 'file', recording backend of the
+                            spike detectors
+        data_path           directory of the gdf files if record_to='file'
+        connections         recurrent synapses of a previous build, see
+                            buildMultiareaNetwork
+        keep_connections    return the drawn recurrent synapses, see
+                            buildMultiareaNetwork
+        chunk_time          simulation time of a chunk in ms (optional)
+        rate_bounds         minimal and maximal mean rate of all neurons in
+                            spks/s, the simulation is aborted after a chunk
+                            outside of them (optional)
+        checkpoint          cnstools.chunkedSimulation.Checkpoint to resume
+                            from and to update after each chunk (optional,
+                            record_to='memory' only)
+        timer               cnstools.instrumentation.PhaseTimer to record
+                            the phases of the simulation (optional)
 
     Returns:
         spikes:             dict of spike senders / spike times of all
-                            neurons in all populations
+                            neurons in all populations; only the id range
+                            if record_to='file'
+        connections:        recurrent synapses, see buildMultiareaNetwork
+        simulated_time:     simulated time in ms, less than simtime if the
+                            simulation was aborted
     """
-    # configure kernel
-    nest.ResetKernel()
-    nest.SetKernelStatus({
-        'local_num_threads': num_threads, 'resolution': dt, 'print_time': False
-    })
+    # NEST writes the gdf files with the times of the resumed simulation,
+    # which cannot be shifted to continue the previous one
+    if checkpoint is not None and record_to != 'memory':
+        raise ValueError("Checkpoints need record_to='memory'")
+    if timer is None:
+        timer = PhaseTimer()
+
+    with timer.phase('configure'):
+        # configure kernel
+        nest.ResetKernel()
+        nest.SetKernelStatus({
+            'local_num_threads': num_threads, 'resolution': dt,
+            'print_time': False
+        })
+        if record_to == 'file':
+            os.makedirs(data_path, exist_ok=True)
+            nest.SetKernelStatus({
+                'data_path': data_path, 'overwrite_files': True
+            })
 
-    # seed all random number generators
-    if nest.Rank() == 0:
-        print('Master seed: %i ' % master_seed)
-    N_tp = nest.GetKernelStatus(['total_num_virtual_procs'])[0]
+        # seed all random number generators
+        if nest.Rank() == 0:
+            print('Master seed: %i ' % master_seed)
+        N_tp = nest.GetKernelStatus(['total_num_virtual_procs'])[0]
+        if nest.Rank() == 0:
+            print('Total number of processes: %i' % N_tp)
+        pyrng_seeds = list(range(master_seed, master_seed+N_tp))
+        grng_seed = master_seed + N_tp
+        rng_seeds = list(range(master_seed+1+N_tp, master_seed+1+2*N_tp))
+        pyrngs = [np.random.RandomState(s) for s in pyrng_seeds]
+        nest.SetKernelStatus({'grng_seed': grng_seed, 'rng_seeds': rng_seeds})
+
+    # build the Brunel network, the connections of the bulk method are
+    # drawn with the next seed after the NEST rng seeds
+    build_start = time.time()
+    _, neurons, spike_detectors, connections = buildMultiareaNetwork(
+        rng=np.random.RandomState(master_seed+1+2*N_tp),
+        record_to=record_to, connections=connections,
+        keep_connections=keep_connections, timer=timer,
+        **network_config
+    )
     if nest.Rank() == 0:
-        print('Total number of processes: %i' % N_tp)
-    pyrng_seeds = list(range(master_seed, master_seed+N_tp))
-    grng_seed = master_seed + N_tp
-    rng_seeds = list(range(master_seed+1+N_tp, master_seed+1+2*N_tp))
-    pyrngs = [np.random.RandomState(s) for s in pyrng_seeds]
-    nest.SetKernelStatus({'grng_seed': grng_seed, 'rng_seeds': rng_seeds})
-
-    # build the Brunel network
-    _, neurons, spike_detectors = buildMultiareaNetwork(**network_config)
+        print('Network construction time: %.2f s' % (
+            time.time() - build_start
+        ))
 
     # distribute initial voltages
-    for thread in np.arange(nest.GetKernelStatus('local_num_threads')):
-        # Using GetNodes is a work-around until NEST 3.0 is released. It
-        # will issue a deprecation warning.
-        local_nodes = nest.GetNodes([0], {'model': 'iaf_psc_exp',
-                                          'thread': thread},
-                                    local_only=True)[0]
-        vp = nest.GetStatus(local_nodes)[0]['vp']
-        # vp is the same for all local nodes on the same thread
-        nest.SetStatus(
-            local_nodes, 'V_m', pyrngs[vp].normal(
-                V0_mean, V0_std, len(local_nodes)
-            )
-        )
-        if nest.Rank() == 0:
-            print('Number of local nodes: %i' % len(local_nodes))
-
-    # simulate
-    nest.Simulate(simtime)
+    with timer.phase('initialize'):
+        num_local_nodes = initializeVoltages(neurons, pyrngs, V0_mean, V0_std)
+    if nest.Rank() == 0:
+        print('Number of local nodes: %i' % num_local_nodes)
+
+    # simulate and read out spikes from spikedetectors after each chunk
+    simulation_start = time.time()
+    pops = list(spike_detectors)
+    detector_spikes, simulated_time, _ = runChunked(
+        simtime, [spike_detectors[pop] for pop in pops],
+        chunk_time=chunk_time, rate_bounds=rate_bounds,
+        num_neurons=None if rate_bounds is None else
+        sum(len(neurons[pop]) for pop in pops),
+        neurons=np.concatenate([neurons[pop] for pop in pops]),
+        checkpoint=checkpoint, timer=timer
+    )
+    if nest.Rank() == 0:
+        print('Simulation time: %.2f s' % (time.time() - simulation_start))
 
-    # read out spikes from spikedetectors
     spikes = {}
-    for pop in spike_detectors:
-        data = nest.GetStatus(spike_detectors[pop], 'events')[0]
-        spikes[pop] = {
-            'ids': data['senders'], 'times': data['times'],
-            'min_id': neurons[pop][0], 'max_id': neurons[pop][-1]
-        }
+    for pop, (ids, times) in zip(pops, detector_spikes):
+        spikes[pop] = {'min_id': neurons[pop][0], 'max_id': neurons[pop][-1]}
+        if record_to == 'memory':
+            spikes[pop].update({'ids': ids, 'times': times})
 
-    return spikes
+    return spikes, connections, simulated_time
 
 
 if __name__ == '__main__':
@@ -177,47 +497,190 @@ if __name__ == '__main__':
 
     # parse command line parameters
     args = docopt(__doc__)
+    timer = PhaseTimer()
 
     # load neuron parameters
     with open(args['<neuron_parameter_file>'], 'r') as network_file:
         neuron_yaml = yaml.load(network_file, Loader=yaml.FullLoader)
 
-    # scale number of neurons & connections
-    # NOTE: very naive implementation. How to do better:
-    #       van Albada, Helias, Diesmann (2015) PLoS CB
-    N_scale = float(args['--N_scale'])
-    K_scale = float(args['--K_scale'])
-    neurons_scaled = _round_to_int(N_scale*np.load(args['<neuron_file>']))
-    synapses_scaled = _round_to_int(
-        K_scale*N_scale*np.load(args['<synapse_file>'])
-    )
-    weights_scaled = np.load(args['<weight_file>']) / K_scale
+    with timer.phase('load'):
+        # look up the scaled arrays and the recurrent synapses of a previous
+        # build with the same structural data, scaling and connectivity seeds
+        N_scale = float(args['--N_scale'])
+        K_scale = float(args['--K_scale'])
+        cache = None
+        cached = None
+        if args['--cache_dir'] is not None:
+            cache = NetworkCache(args['--cache_dir'],
+                                 budget=float(args['--cache_budget'])*1e9)
+            cache_key = hashInputs(
+                [args['<structure_file>'], args['<neuron_file>'],
+                 args['<synapse_file>'], args['<weight_file>']],
+                N_scale=N_scale, K_scale=K_scale,
+                master_seed=int(args['--master_seed']),
+                total_num_virtual_procs=(
+                    int(args['--num_threads']) * nest.NumProcesses()
+                ),
+                connect=args['--connect']
+            )
+            cached = cache.load(cache_key)
+            if nest.Rank() == 0:
+                print('Network cache %s: %s' % (
+                    'hit' if cached is not None else 'miss', cache_key
+                ))
+
+        # scale number of neurons & connections
+        # NOTE: very naive implementation. How to do better:
+        #       van Albada, Helias, Diesmann (2015) PLoS CB
+        connections = None
+        if cached is not None:
+            neurons_scaled = np.array(cached['population_sizes'])
+            synapses_scaled = matrixFromArrays('synapse_matrix', cached)
+            weights_scaled = matrixFromArrays('weight_matrix', cached)
+            if 'sources' in cached:
+                connections = cached
+        else:
+            neurons_scaled = _round_to_int(
+                N_scale*np.load(args['<neuron_file>'])
+            )
+            synapses_scaled = mapEntries(
+                loadMatrix(args['<synapse_file>']),
+                lambda synapses: _round_to_int(K_scale*N_scale*synapses)
+            )
+            weights_scaled = mapEntries(
+                loadMatrix(args['<weight_file>']),
+                lambda weights: weights/K_scale
+            )
+
+    # predict the resources from the scaled network instead of simulating
+    if args['--dry_run']:
+        from cnstools.resourceModel import ResourceModel, \
+            formatPrediction, jobResources
+
+        num_nodes, num_connections = multiareaSize(neurons_scaled,
+                                                   synapses_scaled)
+        model = ResourceModel() if args['--resource_model'] is None else \
+            ResourceModel.load(args['--resource_model'])
+        prediction = model.predict(
+            num_nodes, num_connections, float(args['--simtime']),
+            float(args['--dt']), int(args['--num_procs']),
+            int(args['--num_threads'])
+        )
+        print(formatPrediction(num_nodes, num_connections, prediction,
+                               jobResources(prediction,
+                                            int(args['--num_procs']),
+                                            int(args['--num_threads']))))
+        sys.exit(0)
 
     # parse simulation config
     simulation_config = {
         'simtime': float(args['--simtime']), 'dt': float(args['--dt']),
         'V0_mean': float(args['--V0_mean']), 'V0_std': float(args['--V0_std']),
         'master_seed': int(args['--master_seed']),
-        'num_threads': int(args['--num_threads'])
+        'num_threads': int(args['--num_threads']),
+        'record_to': args['--record_to'], 'data_path': args['--data_path']
     }
 
+    # parse chunking options, the checkpoint is only resumed with the same
+    # inputs and parameters
+    chunk_time = args['--chunk_time']
+    rate_bounds = None
+    if args['--rate_min'] is not None or args['--rate_max'] is not None:
+        rate_bounds = (
+            float(args['--rate_min'] or 0.), float(args['--rate_max'] or 'inf')
+        )
+    inputs = [args['<neuron_parameter_file>'], args['<structure_file>'],
+              args['<neuron_file>'], args['<synapse_file>'],
+              args['<weight_file>']]
+    if args['--dc_file'] is not None:
+        inputs.append(args['--dc_file'])
+    checkpoint = None
+    if args['--checkpoint_dir'] is not None:
+        checkpoint = Checkpoint(args['--checkpoint_dir'], key=hashInputs(
+            inputs, N_scale=N_scale, K_scale=K_scale,
+            nu_ext=float(args['--nu_ext']), connect=args['--connect'],
+            **simulation_config
+        ))
+
     # simulate network
-    spikes = simulateMultiareaNetwork(
+    spikes, connections, simulated_time = simulateMultiareaNetwork(
         network_config={
             'neuron_parameters': neuron_yaml,
             'structure': np.load(args['<structure_file>']),
             'population_sizes': neurons_scaled, 'synapses': synapses_scaled,
-            'weights': weights_scaled, 'nu_ext': float(args['--nu_ext'])
+            'weights': weights_scaled, 'nu_ext': float(args['--nu_ext']),
+            'connect': args['--connect'],
+            'dc_drive': None if args['--dc_file'] is None else
+            np.load(args['--dc_file'])
         },
-        **simulation_config
+        connections=connections,
+        keep_connections=cache is not None and cached is None,
+        chunk_time=None if chunk_time is None else
+        float(chunk_time), rate_bounds=rate_bounds, checkpoint=checkpoint,
+        timer=timer, **simulation_config
+    )
+    simulation_config['simulated_time'] = simulated_time
+
+    with timer.phase('cache'):
+        # cache the scaled arrays and the drawn recurrent synapses, which are
+        # the same on all ranks
+        if cache is not None and cached is None and nest.Rank() == 0:
+            arrays = {'population_sizes': neurons_scaled}
+            arrays.update(matrixArrays('synapse_matrix', synapses_scaled))
+            arrays.update(matrixArrays('weight_matrix', weights_scaled))
+            if connections is not None:
+                arrays.update(connections)
+            cache.save(cache_key, arrays)
+
+    with timer.phase('output'):
+        # save spikes (one spike store per rank if there are several) or, if
+        # they are in gdf files, the population table
+        if simulation_config['record_to'] == 'memory':
+            populations = [[
+                pop, spikes[pop]['min_id'], spikes[pop]['max_id'],
+                spikes[pop]['ids'], spikes[pop]['times']] for pop in spikes
+            ]
+            if nest.NumProcesses() > 1:
+                saveSpikeStore(shardPath(args['<spikes_file>'], nest.Rank()),
+                               populations, index=False)
+            else:
+                saveSpikeStore(args['<spikes_file>'], populations)
+        elif nest.Rank() == 0:
+            np.save(args['<spikes_file>'], np.array([
+                (pop, spikes[pop]['min_id'], spikes[pop]['max_id'], 0, 0)
+                for pop in spikes
+            ], dtype=POPULATION_DTYPE))
+
+        # save simulation config
+        if nest.Rank() == 0:
+            with open(args['<simconfig_file>'], 'w') as simconf_file:
+                yaml.dump(simulation_config, simconf_file)
+
+    # save the instrumentation next to the simulation config
+    timer.save(
+        sidecarPath(args['<simconfig_file>'], rank=nest.Rank()
+                    if nest.NumProcesses() > 1 else None),
+        script='simulateMultiareaNetwork', parameters=simulation_config
     )
 
-    # save spikes
-    np.save(args['<spikes_file>'], [[
-        pop, spikes[pop]['min_id'], spikes[pop]['max_id'],
-        spikes[pop]['ids'], spikes[pop]['times']] for pop in spikes
-    ])
+    # register the run with all parameters, including the neuron parameters,
+    # and the simulated time, which is shorter for aborted runs
+    if args['--registry'] is not None and nest.Rank() == 0:
+        parameters = dict(
+            simulation_config, neuron_parameters=neuron_yaml,
+            N_scale=N_scale, K_scale=K_scale, nu_ext=float(args['--nu_ext']),
+            connect=args['--connect'], num_processes=nest.NumProcesses()
+        )
+        del parameters['simulated_time']
+        with RunRegistry(args['--registry']) as registry:
+            key = runKey(parameters, inputs)
+            registry.register(
+                key, 'simulateMultiareaNetwork', parameters,
+                [args['<spikes_file>'], args['<simconfig_file>']]
+            )
+            registry.addStatistics(key, 'network',
+                                   {'simulated_time': simulated_time})
 
-    # save simulation config
-    with open(args['<simconfig_file>'], 'w') as simconf_file:
-        yaml.dump(simulation_config, simconf_file)
+    # the results are saved, the checkpoint is not needed anymore
+    if checkpoint is not None:
+        checkpoint.remove()